@@ -0,0 +1,298 @@
+# backend/analytics.py
+"""
+Agregados precalculados de client_data para los endpoints de analítica.
+
+Las métricas del dashboard (/analytics/summary) se calculan en una sola
+pasada sobre client_data al terminar cada carga o limpieza y se guardan en
+una fila de analytics_summary. El endpoint solo lee esa fila, así su tiempo
+de respuesta no crece con el tamaño de la tabla.
+
+Con la misma frecuencia se actualizan client_rollup (por cliente y
+tipo_de_cliente), client_category_rollup (por cliente y tipo_cliente) y
+product_rollup (por artículo, categoría y proveedor): totales, facturas,
+primera/última compra y meses activos con la misma agrupación que usaban
+los endpoints de ranking, que los leen en lugar de agrupar client_data.
+product_rollup es el agregado común de los cuatro widgets de productos del
+dashboard (top, comparativo, pareto y rotación). Una
+recarga completa los reconstruye; una carga agregada o incremental solo
+recalcula los clientes y artículos que tocó.
+"""
+from sqlalchemy import text, bindparam
+from sqlalchemy.orm import Session
+from typing import Dict, Any, Optional, Set
+from datetime import datetime
+import logging
+import json
+
+from models import AnalyticsSummary, ClientRollup, ClientCategoryRollup, ProductRollup
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_ROW_ID = 1
+TOP_CLIENTS_LIMIT = 3
+
+# Todas las métricas escalares en un solo recorrido de la tabla
+SUMMARY_QUERY = """
+    SELECT 
+        COUNT(*) as total_records,
+        COUNT(DISTINCT CASE WHEN TRIM(cliente) != '' THEN cliente END) as unique_clients,
+        COALESCE(SUM(venta), 0) as total_sales,
+        COALESCE(SUM(mb), 0) as total_margin,
+        COUNT(DISTINCT CASE WHEN TRIM(factura) != '' THEN factura END) as unique_invoices,
+        COUNT(DISTINCT CASE WHEN TRIM(articulo) != '' THEN articulo END) as unique_products
+    FROM {table}
+"""
+
+TOP_CLIENTS_QUERY = """
+    SELECT 
+        cliente,
+        COALESCE(SUM(venta), 0) as total_venta
+    FROM {table} 
+    WHERE cliente IS NOT NULL 
+    AND TRIM(cliente) != ''
+    GROUP BY cliente
+    ORDER BY total_venta DESC
+    LIMIT :limit_param
+"""
+
+
+# Reconstrucción de los agregados por cliente y tipo_de_cliente
+CLIENT_ROLLUP_QUERY = """
+    INSERT INTO client_rollup (
+        cliente, tipo_de_cliente, num_transacciones, num_facturas,
+        dias_activos, meses_activos, cantidad_total, total_ventas, total_mb,
+        frecuencia_compra, primera_compra, ultima_compra
+    )
+    SELECT 
+        cliente,
+        tipo_de_cliente,
+        COUNT(*),
+        COUNT(DISTINCT factura),
+        COUNT(DISTINCT fecha_date),
+        COUNT(DISTINCT year_month),
+        COALESCE(SUM(cantidad), 0),
+        COALESCE(SUM(venta), 0),
+        COALESCE(SUM(mb), 0),
+        CASE 
+            WHEN COUNT(DISTINCT fecha_date) > 30 THEN
+                CAST(COUNT(DISTINCT factura) AS FLOAT) / (COUNT(DISTINCT fecha_date) / 30.0)
+            WHEN COUNT(DISTINCT fecha_date) > 1 THEN
+                CAST(COUNT(DISTINCT factura) AS FLOAT)
+            ELSE 0
+        END,
+        MIN(fecha_date),
+        MAX(fecha_date)
+    FROM {table}
+    WHERE cliente IS NOT NULL 
+    AND TRIM(cliente) != ''
+    {scope}
+    GROUP BY cliente, tipo_de_cliente
+"""
+
+# Reconstrucción de los agregados por cliente y tipo_cliente (categoría)
+CLIENT_CATEGORY_ROLLUP_QUERY = """
+    INSERT INTO client_category_rollup (
+        cliente, tipo_cliente, num_transacciones, num_facturas,
+        total_ventas, total_mb, primera_compra, ultima_compra
+    )
+    SELECT 
+        cliente,
+        tipo_cliente,
+        COUNT(*),
+        COUNT(DISTINCT factura),
+        COALESCE(SUM(venta), 0),
+        COALESCE(SUM(mb), 0),
+        MIN(fecha_date),
+        MAX(fecha_date)
+    FROM {table}
+    WHERE cliente IS NOT NULL 
+    AND TRIM(cliente) != ''
+    {scope}
+    GROUP BY cliente, tipo_cliente
+"""
+
+# Reconstrucción de los agregados por producto, categoría y proveedor. Los
+# totales base cuentan solo ventas positivas; los netos (pareto) todas las
+# filas y los de rotación solo ventas y cantidades positivas, como las
+# consultas sobre client_data a las que reemplazan
+PRODUCT_ROLLUP_QUERY = """
+    INSERT INTO product_rollup (
+        articulo, categoria, proveedor, num_transacciones, num_facturas,
+        num_clientes, meses_activos, cantidad_total, total_ventas, total_mb,
+        primera_venta, ultima_venta, ventas_netas, cantidad_neta, mb_neto,
+        rotacion_facturas, rotacion_clientes, rotacion_cantidad, rotacion_ventas,
+        rotacion_meses, rotacion_dias
+    )
+    SELECT 
+        articulo,
+        categoria,
+        proveedor,
+        COUNT(CASE WHEN venta > 0 THEN 1 END),
+        COUNT(DISTINCT CASE WHEN venta > 0 THEN factura END),
+        COUNT(DISTINCT CASE WHEN venta > 0 THEN cliente END),
+        COUNT(DISTINCT CASE WHEN venta > 0 THEN year_month END),
+        COALESCE(SUM(CASE WHEN venta > 0 THEN cantidad END), 0),
+        COALESCE(SUM(CASE WHEN venta > 0 THEN venta END), 0),
+        COALESCE(SUM(CASE WHEN venta > 0 THEN mb END), 0),
+        MIN(CASE WHEN venta > 0 THEN fecha_date END),
+        MAX(CASE WHEN venta > 0 THEN fecha_date END),
+        COALESCE(SUM(venta), 0),
+        COALESCE(SUM(cantidad), 0),
+        COALESCE(SUM(mb), 0),
+        COUNT(DISTINCT CASE WHEN venta > 0 AND cantidad > 0 THEN factura END),
+        COUNT(DISTINCT CASE WHEN venta > 0 AND cantidad > 0 THEN cliente END),
+        COALESCE(SUM(CASE WHEN venta > 0 AND cantidad > 0 THEN cantidad END), 0),
+        COALESCE(SUM(CASE WHEN venta > 0 AND cantidad > 0 THEN venta END), 0),
+        COUNT(DISTINCT CASE WHEN venta > 0 AND cantidad > 0 THEN year_month END),
+        COUNT(DISTINCT CASE WHEN venta > 0 AND cantidad > 0 THEN fecha_date END)
+    FROM {table}
+    WHERE articulo IS NOT NULL 
+    AND TRIM(articulo) != ''
+    {scope}
+    GROUP BY articulo, categoria, proveedor
+"""
+
+# Qué tabla se reconstruye con cada consulta y por qué columna se acota
+ROLLUPS = [
+    (ClientRollup, CLIENT_ROLLUP_QUERY, "cliente"),
+    (ClientCategoryRollup, CLIENT_CATEGORY_ROLLUP_QUERY, "cliente"),
+    (ProductRollup, PRODUCT_ROLLUP_QUERY, "articulo"),
+]
+
+# Claves por sentencia en una reconstrucción parcial (límite de parámetros del motor)
+ROLLUP_KEYS_BATCH = 500
+
+
+def compute_summary(db: Session, table_name: str = "client_data") -> Dict[str, Any]:
+    """Calcular las métricas del resumen directamente desde client_data (o su staging)"""
+    row = db.execute(text(SUMMARY_QUERY.format(table=table_name))).fetchone()
+    top_clients = db.execute(
+        text(TOP_CLIENTS_QUERY.format(table=table_name)),
+        {"limit_param": TOP_CLIENTS_LIMIT}
+    ).fetchall()
+    return {
+        "total_records": int(row.total_records or 0),
+        "unique_clients": int(row.unique_clients or 0),
+        "total_sales": float(row.total_sales or 0),
+        "total_margin": float(row.total_margin or 0),
+        "unique_invoices": int(row.unique_invoices or 0),
+        "unique_products": int(row.unique_products or 0),
+        "top_clients": [
+            {"cliente": client.cliente, "total_venta": float(client.total_venta)}
+            for client in top_clients
+        ],
+    }
+
+
+def refresh_summary(db: Session, table_name: str = "client_data") -> AnalyticsSummary:
+    """
+    Recalcular y guardar la fila de resumen (no hace commit).
+
+    En una recarga completa se calcula sobre la tabla staging antes del
+    intercambio, para no recorrer client_data con el lock exclusivo tomado.
+    Lo mismo aplica a refresh_rollups.
+    """
+    values = compute_summary(db, table_name)
+    summary = db.get(AnalyticsSummary, SUMMARY_ROW_ID) or AnalyticsSummary(id=SUMMARY_ROW_ID)
+
+    for name, value in values.items():
+        setattr(summary, name, json.dumps(value) if name == "top_clients" else value)
+    summary.dataset_version = (summary.dataset_version or 0) + 1
+    summary.refreshed_at = datetime.utcnow()
+
+    db.add(summary)
+    db.flush()
+    logger.info(f"📊 Resumen de analítica actualizado: {values['total_records']} registros")
+    return summary
+
+
+def refresh_rollups(db: Session, table_name: str = "client_data",
+                    keys: Optional[Dict[str, Set[str]]] = None):
+    """
+    Reconstruir client_rollup, client_category_rollup y product_rollup (no hace commit).
+
+    Sin `keys` se reconstruyen completas desde client_data o su staging. Con
+    `keys` ({"cliente": {...}, "articulo": {...}}, ver ingest_csv_stream) solo
+    se borran y recalculan las filas de esos clientes y artículos: una carga
+    agregada o incremental no recorre toda la tabla.
+    """
+    counts = {}
+    for rollup, query, column in ROLLUPS:
+        name = rollup.__tablename__
+        if keys is None:
+            db.execute(text(f"DELETE FROM {name}"))
+            counts[name] = db.execute(text(query.format(table=table_name, scope=""))).rowcount
+            continue
+
+        values = sorted(value for value in keys.get(column, ()) if value is not None)
+        counts[name] = 0
+        for start in range(0, len(values), ROLLUP_KEYS_BATCH):
+            params = {"keys": values[start:start + ROLLUP_KEYS_BATCH]}
+            db.execute(
+                text(f"DELETE FROM {name} WHERE {column} IN :keys").bindparams(bindparam("keys", expanding=True)),
+                params
+            )
+            counts[name] += db.execute(
+                text(query.format(table=table_name, scope=f"AND {column} IN :keys"))
+                .bindparams(bindparam("keys", expanding=True)),
+                params
+            ).rowcount
+
+    scope = "recalculados" if keys is not None else "reconstruidos"
+    logger.info(
+        f"📦 Agregados {scope}: {counts['client_rollup']} filas por cliente, "
+        f"{counts['client_category_rollup']} por categoría de cliente, {counts['product_rollup']} por producto"
+    )
+
+
+def refresh_aggregates(db: Session, table_name: str = "client_data",
+                       keys: Optional[Dict[str, Set[str]]] = None) -> AnalyticsSummary:
+    """Recalcular el resumen y los agregados por cliente/producto (no hace commit)"""
+    refresh_rollups(db, table_name, keys)
+    return refresh_summary(db, table_name)
+
+
+def ensure_aggregates(db: Session) -> bool:
+    """
+    Construir los agregados si aún no existen (datos cargados antes de esta
+    versión, o tablas de agregados recreadas por migrate_add_new_columns)
+    """
+    summary = db.get(AnalyticsSummary, SUMMARY_ROW_ID)
+    if summary is None:
+        refresh_aggregates(db)
+    elif summary.total_records and any(db.query(rollup).first() is None for rollup, _, _ in ROLLUPS):
+        refresh_rollups(db)
+    else:
+        return False
+    db.commit()
+    return True
+
+
+def ensure_aggregates(db: Session) -> bool:
+    """Construir los agregados si aún no existen (datos cargados antes de esta versión)"""
+    if db.get(AnalyticsSummary, SUMMARY_ROW_ID) is not None:
+        return False
+    refresh_aggregates(db)
+    db.commit()
+    return True
+
+
+def get_summary(db: Session) -> Dict[str, Any]:
+    """Leer el resumen precalculado; si todavía no existe se calcula y guarda"""
+    summary = db.get(AnalyticsSummary, SUMMARY_ROW_ID)
+    if summary is None:
+        summary = refresh_aggregates(db)
+        db.commit()
+
+    return {
+        "total_records": summary.total_records or 0,
+        "unique_clients": summary.unique_clients or 0,
+        "total_sales": summary.total_sales or 0.0,
+        "total_margin": summary.total_margin or 0.0,
+        "unique_invoices": summary.unique_invoices or 0,
+        "unique_products": summary.unique_products or 0,
+        "top_clients": json.loads(summary.top_clients) if summary.top_clients else [],
+        "dataset_version": summary.dataset_version or 0,
+        "refreshed_at": summary.refreshed_at.isoformat() if summary.refreshed_at else None,
+    }
+
@@ -0,0 +1,179 @@
+# backend/cache.py
+"""
+Caché en memoria para los resultados de los endpoints de analítica.
+
+Los datos de client_data solo cambian con /upload-csv y /client-data/clear,
+así que cada resultado se guarda bajo (endpoint, parámetros, versión del
+dataset). La versión es analytics_summary.dataset_version, que cada carga o
+limpieza incrementa en la misma transacción que los datos; así todas las
+instancias y workers comparten el mismo contador. Cada proceso la relee
+(lectura por clave primaria) como mucho cada
+settings.analytics_cache_version_ttl segundos, y bump_version() la relee de
+inmediato tras una carga local. La caché es LRU con tamaño máximo y lleva
+contadores de aciertos y fallos.
+"""
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+import functools
+import threading
+import asyncio
+import inspect
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import engine
+
+logger = logging.getLogger(__name__)
+
+DATASET_VERSION_QUERY = text("SELECT dataset_version FROM analytics_summary WHERE id = 1")
+
+
+def is_fallback_payload(value: Any) -> bool:
+    """Respuesta con success=False o con datos de ejemplo (fallback=True)"""
+    return isinstance(value, dict) and (value.get("success") is False or value.get("fallback") is True)
+
+
+def read_dataset_version() -> int:
+    """Versión persistida del dataset (0 si todavía no hay resumen)"""
+    with engine.connect() as conn:
+        return conn.execute(DATASET_VERSION_QUERY).scalar() or 0
+
+
+class ResultCache:
+    """Caché LRU de resultados versionada por carga de datos"""
+
+    def __init__(self, max_entries: int = 256, version_ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl
+        self.entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = 0
+        self.version_checked_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _version_due(self) -> bool:
+        checked_at = self.version_checked_at
+        return checked_at is None or time.monotonic() - checked_at >= self.version_ttl
+
+    def refresh_version(self) -> int:
+        """Releer la versión persistida; si cambió se descartan los resultados guardados"""
+        try:
+            version = read_dataset_version()
+        except Exception as e:
+            # Sin tabla de resumen (p. ej. antes de create_tables): conservar la versión local
+            logger.warning(f"⚠️ No se pudo leer la versión del dataset: {e}")
+            version = self.version
+
+        with self.lock:
+            self.version_checked_at = time.monotonic()
+            if version != self.version:
+                self.version = version
+                self.entries.clear()
+                logger.info(f"🧹 Caché de analítica invalidada (versión {self.version})")
+            return self.version
+
+    def current_version(self) -> int:
+        """Versión vigente, releyéndola de la base de datos si venció el TTL"""
+        if self._version_due():
+            return self.refresh_version()
+        return self.version
+
+    def bump_version(self) -> int:
+        """Invalidar los resultados guardados (se llama tras cada carga o limpieza confirmada)"""
+        with self.lock:
+            self.entries.clear()
+        return self.refresh_version()
+
+    def get(self, key: Tuple) -> Tuple[bool, Any]:
+        """Devolver (encontrado, valor) y marcar la entrada como usada recientemente"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key: Tuple, value: Any):
+        """Guardar un resultado, expulsando el menos usado si se supera el límite"""
+        with self.lock:
+            # Un resultado calculado antes de un bump_version ya no es válido
+            if key[-1] != self.version:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso de la caché"""
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+            }
+
+    def cached(self, name: Optional[str] = None) -> Callable:
+        """
+        Decorador para endpoints async de analítica.
+
+        La clave usa el nombre del endpoint y sus parámetros (sin la sesión de
+        base de datos). No se guardan respuestas vacías, con success=False ni
+        con datos de ejemplo (fallback=True), para no fijar un error
+        transitorio hasta la siguiente carga.
+        Los valores devueltos se comparten entre peticiones: no modificarlos.
+        """
+        def decorator(func: Callable) -> Callable:
+            endpoint = name or func.__name__
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                params = tuple(
+                    (param, value) for param, value in bound.arguments.items()
+                    if not isinstance(value, Session)
+                )
+                version = self.version
+                if self._version_due():
+                    loop = asyncio.get_running_loop()
+                    version = await loop.run_in_executor(None, self.refresh_version)
+                key = (endpoint, params, version)
+                try:
+                    hash(key)
+                except TypeError:
+                    return await func(*args, **kwargs)
+
+                found, value = self.get(key)
+                if found:
+                    return value
+
+                value = await func(*args, **kwargs)
+                # Vacíos y respaldos no se guardan: se reintentan en la próxima petición
+                if value and not is_fallback_payload(value):
+                    self.set(key, value)
+                return value
+
+            return wrapper
+        return decorator
+
+
+# Instancia global compartida por los endpoints de analítica
+analytics_cache = ResultCache(
+    max_entries=settings.analytics_cache_size,
+    version_ttl=settings.analytics_cache_version_ttl
+)
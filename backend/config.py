@@ -8,6 +8,31 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     
+    # Pool de conexiones del engine
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    
+    # Hilos para cargas de CSV en segundo plano
+    ingest_workers: int = 1
+    
+    # Entradas máximas en la caché de resultados de analítica
+    analytics_cache_size: int = 256
+    # Segundos entre relecturas de analytics_summary.dataset_version
+    # (otras instancias ven una carga como mucho con este retraso)
+    analytics_cache_version_ttl: float = 5.0
+    
+    # Hilos por categoría para el trabajo bloqueante de los endpoints
+    # (executor_max_queue = 0 deja la cola sin límite)
+    analytics_workers: int = 4
+    ml_workers: int = 2
+    db_workers: int = 4
+    ingest_request_workers: int = 2
+    auth_workers: int = 4
+    executor_max_queue: int = 0
+    
+    # Carpeta con los pares versionados modelo/metadatos
+    ml_models_dir: str = "ml_models"
+    
     mail_username: Optional[str] = None
     mail_password: Optional[str] = None
     mail_from: Optional[str] = None
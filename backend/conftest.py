@@ -0,0 +1,89 @@
+# backend/conftest.py
+"""
+Fixtures de pytest para las pruebas del backend.
+
+Las pruebas corren contra una base SQLite temporal: DATABASE_URL se fija
+aquí, antes de que cualquier prueba importe models (el engine se crea al
+importar el módulo). Cada prueba recibe las tablas recién creadas.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+TEST_DB_PATH = Path(tempfile.mkdtemp(prefix="anders_tests_")) / "test.db"
+os.environ["DATABASE_URL"] = f"sqlite:///{TEST_DB_PATH}"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import csv
+import io
+import pytest
+
+CSV_HEADER = [
+    "Fecha", "Tipo de Venta", "Documento", "Factura", "Codigo", "Cliente",
+    "Tipo de Cliente", "SKU", "Articulo", "Proveedor", "Almacen", "Cantidad",
+    "U.M.", "P. Venta", "C. Unit", "Venta", "Costo", "MB", "%MB",
+    "Sociedad", "BC", "BT", "BU", "BS", "Comercial", "Tipo_Cliente",
+    "CATEGORIA", "SUPERCATEGORIA", "CRUCE"
+]
+
+
+def build_csv_rows(count: int, start: int = 0, missing_factura_every: int = 0):
+    """Filas de CSV deterministas (listas en el orden de CSV_HEADER)"""
+    rows = []
+    for i in range(start, start + count):
+        venta = 100 + (i % 17) * 25.5
+        costo = round(venta * 0.7, 2)
+        factura = "" if missing_factura_every and i % missing_factura_every == 0 else str(1000 + i)
+        rows.append([
+            f"2024-{(i % 12) + 1:02d}-{(i % 27) + 1:02d}", "Venta", "FAC", factura, f"C{i % 9}",
+            f"Cliente {i % 7}", "Distribuidor" if i % 2 else "Fabricante químicos", f"SKU{i % 11}",
+            f"Producto {i % 11}", f"Prov {i % 3}", "A1", str(1 + i % 5), "KG", "10", "7",
+            f"{venta:.2f}", f"{costo:.2f}", f"{venta - costo:.2f}", "30%", "S1", "BC", "BT", "BU", "BS",
+            f"Comercial {i % 4}", "Grande" if i % 3 else "Pequeño",
+            "SOLVENTES" if i % 2 else "RESINAS", "QUIMICOS", "SI"
+        ])
+    return rows
+
+
+def write_csv(rows) -> io.BytesIO:
+    """CSV en memoria con el encabezado esperado por /upload-csv"""
+    text_buffer = io.StringIO()
+    writer = csv.writer(text_buffer)
+    writer.writerow(CSV_HEADER)
+    writer.writerows(rows)
+    return io.BytesIO(text_buffer.getvalue().encode("utf-8"))
+
+
+@pytest.fixture
+def db():
+    """Sesión sobre tablas vacías recién creadas"""
+    from models import Base, SessionLocal, engine, create_tables, migrate_add_new_columns
+    from cache import analytics_cache
+    from search import search_engine
+
+    Base.metadata.drop_all(bind=engine)
+    create_tables()
+    migrate_add_new_columns()  # índices de client_data, como al arrancar
+    # dataset_version vuelve a empezar: olvidar lo construido con la base anterior
+    analytics_cache.entries.clear()
+    analytics_cache.refresh_version()
+    search_engine.version = None
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+@pytest.fixture
+def client(db):
+    """TestClient de la aplicación sobre la base de prueba"""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,151 @@
+# backend/executors.py
+"""
+Ejecución acotada del trabajo bloqueante de los endpoints.
+
+Los endpoints usan la Session síncrona de SQLAlchemy, pandas y el modelo ML;
+ejecutarlos dentro del event loop bloquea todas las peticiones concurrentes.
+BoundedExecutor los corre en un ThreadPoolExecutor por categoría
+(analytics, ml, db, ingest, auth) con su propio límite de hilos, así una
+consulta de analítica lenta solo ocupa hilos de "analytics" y el login o el
+health check siguen respondiendo.
+
+Cada categoría puede limitar además su cola de espera (max_queue): si está
+llena la petición se rechaza con 503 en vez de acumular trabajo. stats()
+expone hilos ocupados, cola y tiempos de espera/ejecución por categoría.
+"""
+from fastapi import HTTPException
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+import asyncio
+import functools
+import threading
+import logging
+import time
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryPool:
+    """Pool de hilos de una categoría con sus contadores"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int = 0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"exec-{name}")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    def _run(self, submitted_at: float, func: Callable, args: tuple, kwargs: dict) -> Any:
+        started_at = time.perf_counter()
+        wait = started_at - submitted_at
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self.lock:
+                self.running -= 1
+                self.total_run += elapsed
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        with self.lock:
+            if self.max_queue and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail=f"Servidor ocupado ({self.name}), intente nuevamente")
+            self.queued += 1
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._run, time.perf_counter(), func, args, kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            finished = self.completed + self.failed
+            started = finished + self.running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queue_depth": self.queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.total_wait / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "avg_run_ms": round(self.total_run / finished * 1000, 2) if finished else 0.0
+            }
+
+
+class BoundedExecutor:
+    """Pools de hilos por categoría para sacar el trabajo bloqueante del event loop"""
+
+    def __init__(self, limits: Dict[str, int], max_queue: int = 0):
+        self.pools = {
+            name: CategoryPool(name, max_workers, max_queue)
+            for name, max_workers in limits.items()
+        }
+
+    def pool(self, category: str) -> CategoryPool:
+        if category not in self.pools:
+            raise KeyError(f"Categoría de ejecución desconocida: {category}")
+        return self.pools[category]
+
+    async def run(self, category: str, func: Callable, *args, **kwargs) -> Any:
+        """Ejecutar func(*args, **kwargs) en el pool de la categoría y esperar el resultado"""
+        return await self.pool(category).run(func, *args, **kwargs)
+
+    def offload(self, category: str) -> Callable:
+        """
+        Decorador para endpoints síncronos: devuelve una versión async que
+        corre la función en el pool de la categoría.
+
+        Conserva la firma original para que FastAPI resuelva parámetros y
+        dependencias igual que antes.
+        """
+        pool = self.pool(category)
+
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await pool.run(func, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+
+# Instancia global usada por los endpoints de main.py
+bounded_executor = BoundedExecutor(
+    {
+        "analytics": settings.analytics_workers,
+        "ml": settings.ml_workers,
+        "db": settings.db_workers,
+        "ingest": settings.ingest_request_workers,
+        "auth": settings.auth_workers
+    },
+    max_queue=settings.executor_max_queue
+)
@@ -0,0 +1,172 @@
+# backend/export.py
+"""
+Exportación en streaming de client_data (CSV, NDJSON o Parquet).
+
+La consulta se ejecuta con un cursor del lado del servidor
+(stream_results + yield_per): la base de datos entrega las filas en lotes
+de EXPORT_BATCH_SIZE, cada lote se serializa y se envía al cliente antes
+de pedir el siguiente. La memoria usada no depende del tamaño de la tabla.
+
+Las columnas se eligen como en /client-data (fields=) y los filtros son los
+de /client-data/search. Parquet necesita pyarrow; cada lote se escribe como
+un row group.
+"""
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Date, Float, Integer, Numeric
+from decimal import Decimal
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional
+import csv
+import io
+import json
+import logging
+import time
+
+from models import engine, ClientData
+from projection import resolve_fields, select_client_data
+from search import search_conditions
+
+logger = logging.getLogger(__name__)
+
+# Formato -> (media type, extensión del archivo)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+EXPORT_BATCH_SIZE = 5000
+
+
+def _export_value(value: Any) -> Any:
+    """Valor serializable en texto: DECIMAL a float y fechas en ISO 8601"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _stream_batches(statement) -> Iterator[List[tuple]]:
+    """Lotes de filas de un cursor del lado del servidor"""
+    started = time.perf_counter()
+    rows = 0
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(statement)
+        for batch in result.partitions():
+            rows += len(batch)
+            yield batch
+    logger.info(f"📤 Exportación completada: {rows} filas en {time.perf_counter() - started:.2f}s")
+
+
+def _csv_chunks(statement, fields: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in _stream_batches(statement):
+        writer.writerows([_export_value(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Encabezado de una exportación sin filas
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(statement, fields: List[str]) -> Iterator[str]:
+    for batch in _stream_batches(statement):
+        yield "".join(
+            json.dumps({name: _export_value(value) for name, value in zip(fields, row)}, ensure_ascii=False) + "\n"
+            for row in batch
+        )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Archivo de solo escritura cuyos bytes se van retirando con drain()"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self.chunks.append(chunk)
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _arrow_schema(fields: List[str]):
+    import pyarrow as pa
+
+    def arrow_type(column_type):
+        if isinstance(column_type, Integer):
+            return pa.int64()
+        if isinstance(column_type, (Numeric, Float)):
+            return pa.float64()
+        if isinstance(column_type, DateTime):
+            return pa.timestamp("us")
+        if isinstance(column_type, Date):
+            return pa.date32()
+        return pa.string()
+
+    return pa.schema([(name, arrow_type(getattr(ClientData, name).type)) for name in fields])
+
+
+def _parquet_chunks(statement, fields: List[str]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(fields)
+    float_columns = {i for i, field in enumerate(schema) if pa.types.is_floating(field.type)}
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in _stream_batches(statement):
+            columns = list(zip(*batch)) if batch else [()] * len(fields)
+            arrays = [
+                pa.array([None if v is None else float(v) for v in values] if i in float_columns else values,
+                         type=schema.field(i).type)
+                for i, values in enumerate(columns)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def build_export(
+    export_format: str,
+    fields: Optional[str] = None,
+    filters: Optional[Dict[str, Optional[str]]] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None
+):
+    """
+    Validar la petición y devolver (generador de chunks, media type, nombre de archivo).
+
+    Los errores de validación se lanzan aquí, antes de empezar a enviar la respuesta.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format debe ser uno de: {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="La exportación a Parquet requiere pyarrow")
+
+    selected_fields = resolve_fields(fields, include_all_fields=True)
+    statement = select_client_data(selected_fields).where(
+        *search_conditions(filters or {}, fecha_desde, fecha_hasta)
+    )
+    writers = {"csv": _csv_chunks, "ndjson": _ndjson_chunks, "parquet": _parquet_chunks}
+    media_type, extension = EXPORT_FORMATS[export_format]
+    return writers[export_format](statement, selected_fields), media_type, f"client_data.{extension}"
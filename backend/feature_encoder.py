@@ -0,0 +1,147 @@
+# backend/feature_encoder.py
+"""
+Codificación de features para el modelo de venta cruzada.
+
+El encoder se arma una sola vez a partir de los feature_names de
+ml_models/model_metadata.json: columnas one-hot SUPERCATEGORIA_*, códigos
+categóricos (Tipo de Cliente, Tipo_Cliente, CATEGORIA, SKU, Codigo) y
+columnas numéricas. Con los índices precalculados, encode() transforma un
+DataFrame completo en la matriz que espera el modelo sin recorrer filas.
+
+Los diccionarios de categorías se toman de "category_mappings" en los
+metadatos si existe; si no, with_categories() los construye una vez con la
+convención de LabelEncoder (valores únicos ordenados -> 0..n-1) a partir de
+los valores distintos de client_data. Nunca se ajustan con el lote de una
+request: el código de un cliente no depende de quién más venga en el lote.
+"""
+import pandas as pd
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Prefijos de columnas one-hot -> columna de origen
+ONE_HOT_PREFIXES = {"SUPERCATEGORIA_": "SUPERCATEGORIA"}
+
+# Features que el modelo recibe como código entero de categoría
+CATEGORICAL_FEATURES = ["Tipo de Cliente", "Tipo_Cliente", "CATEGORIA", "SKU", "Codigo"]
+
+# Columnas de entrada aceptadas para cada feature: encabezado del CSV primero,
+# luego el nombre de la columna en client_data / diccionarios de clientes
+SOURCE_ALIASES = {
+    "Tipo de Cliente": ["Tipo de Cliente", "tipo_de_cliente"],
+    "Tipo_Cliente": ["Tipo_Cliente", "tipo_cliente"],
+    "CATEGORIA": ["CATEGORIA", "categoria"],
+    "SUPERCATEGORIA": ["SUPERCATEGORIA", "supercategoria"],
+    "SKU": ["SKU", "sku"],
+    "Codigo": ["Codigo", "codigo", "codigo_cliente"],
+    "Cantidad": ["Cantidad", "cantidad"],
+    "P. Venta": ["P. Venta", "p_venta"],
+    "C. Unit": ["C. Unit", "c_unit"],
+    "Venta": ["Venta", "venta"],
+    "Costo": ["Costo", "costo"],
+    "MB": ["MB", "mb"],
+}
+
+
+# Columna de client_data de la que salen los valores de cada feature categórica
+CATEGORY_COLUMNS = {name: SOURCE_ALIASES[name][1] for name in CATEGORICAL_FEATURES}
+
+
+def _clean_text(series: pd.Series) -> pd.Series:
+    """Normalizar valores categóricos (texto sin espacios, NaN si falta)"""
+    text_values = series.astype("string").str.strip()
+    return text_values.where(text_values != "")
+
+
+class FeatureEncoder:
+    """Transforma DataFrames de clientes en la matriz de features del modelo"""
+
+    def __init__(self, feature_names: List[str], category_mappings: Optional[Dict[str, Dict[str, int]]] = None):
+        self.feature_names = list(feature_names)
+        self.numeric: Dict[str, int] = {}
+        self.categorical: Dict[str, int] = {}
+        self.one_hot: Dict[str, Dict[str, int]] = {}
+
+        for index, name in enumerate(self.feature_names):
+            prefix = next((p for p in ONE_HOT_PREFIXES if name.startswith(p)), None)
+            if prefix:
+                self.one_hot.setdefault(ONE_HOT_PREFIXES[prefix], {})[name[len(prefix):]] = index
+            elif name in CATEGORICAL_FEATURES:
+                self.categorical[name] = index
+            else:
+                self.numeric[name] = index
+
+        self.category_mappings = {
+            name: {str(value): int(code) for value, code in mapping.items()}
+            for name, mapping in (category_mappings or {}).items()
+        }
+        # Diccionarios publicados con el modelo (los demás salen de los datos)
+        self.metadata_mappings = set(self.category_mappings)
+
+        # Índices de columna one-hot alineados con sus categorías
+        self._one_hot_arrays = {
+            source: (pd.Index(list(columns.keys())), np.array(list(columns.values()), dtype=np.intp))
+            for source, columns in self.one_hot.items()
+        }
+
+    @property
+    def missing_mappings(self) -> List[str]:
+        """Features categóricas sin diccionario de códigos"""
+        return [name for name in self.categorical if name not in self.category_mappings]
+
+    def _source(self, frame: pd.DataFrame, name: str) -> Optional[pd.Series]:
+        for alias in SOURCE_ALIASES.get(name, [name]):
+            if alias in frame.columns:
+                return frame[alias]
+        return None
+
+    def with_categories(self, values: Dict[str, Iterable]) -> "FeatureEncoder":
+        """
+        Copia con los diccionarios que no vienen en los metadatos construidos
+        a partir de values (feature -> valores conocidos de la categoría).
+        """
+        encoder = FeatureEncoder(self.feature_names, {
+            name: mapping for name, mapping in self.category_mappings.items() if name in self.metadata_mappings
+        })
+        encoder.metadata_mappings = set(self.metadata_mappings)
+        for name in encoder.missing_mappings:
+            if name not in values:
+                continue
+            uniques = sorted(_clean_text(pd.Series(list(values[name]), dtype="object")).dropna().unique())
+            encoder.category_mappings[name] = {value: code for code, value in enumerate(uniques)}
+        return encoder
+
+    def encode(self, frame: pd.DataFrame) -> np.ndarray:
+        """
+        Codificar un DataFrame completo (una fila por cliente/transacción).
+
+        Valores faltantes o categorías desconocidas quedan como NaN, que XGBoost
+        trata como 'missing'; las columnas one-hot valen 0 salvo la categoría
+        de la fila.
+        """
+        X = np.full((len(frame), len(self.feature_names)), np.nan, dtype=float)
+
+        for name, index in self.numeric.items():
+            column = self._source(frame, name)
+            if column is not None:
+                X[:, index] = pd.to_numeric(column, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+        for name, index in self.categorical.items():
+            column = self._source(frame, name)
+            mapping = self.category_mappings.get(name)
+            if column is not None and mapping:
+                codes = _clean_text(column).map(mapping)
+                X[:, index] = pd.to_numeric(codes, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+        for source, (categories, indexes) in self._one_hot_arrays.items():
+            X[:, indexes] = 0.0
+            column = self._source(frame, source)
+            if column is None:
+                continue
+            codes = categories.get_indexer(_clean_text(column))
+            rows = np.flatnonzero(codes >= 0)
+            X[rows, indexes[codes[rows]]] = 1.0
+
+        return X
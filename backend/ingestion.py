@@ -0,0 +1,1071 @@
+# backend/ingestion.py
+"""
+Pipeline de ingesta de CSV para la tabla client_data.
+
+El archivo subido se lee por bloques (pd.read_csv con chunksize), cada bloque
+se normaliza columna por columna (operaciones vectorizadas de pandas/NumPy) y
+se envía directo a la base de datos. La carga usa COPY FROM STDIN en
+PostgreSQL y executemany de SQLAlchemy Core en otros motores, así que la
+memoria pico depende del tamaño de bloque y no del tamaño del archivo.
+
+La fecha se parsea una sola vez por valor único (YYYY-MM-DD o DD/MM/YYYY) y
+se guarda tipada en fecha_date junto con year_month ('YYYY-MM', indexada),
+para que las consultas de analítica agrupen y filtren sin reparsear texto.
+
+Con replace_data las filas nuevas se cargan en una tabla staging sin índices;
+los índices se construyen después de la carga y la tabla se intercambia con
+client_data mediante RENAME dentro de una sola transacción, así los lectores
+nunca ven una tabla vacía ni a medio cargar.
+
+Cada fila lleva un hash de su clave natural (row_key: factura, codigo, sku,
+fecha) y otro de su contenido (row_hash). row_key tiene índice único: la
+última fila cargada con una clave es su dueña y las anteriores quedan con
+row_key NULL. En modo incremental el bloque se carga en una tabla temporal
+y se fusiona con client_data: en PostgreSQL con INSERT ... ON CONFLICT
+(row_key) DO UPDATE, seguro ante cargas concurrentes; en otros motores con
+UPDATE ... FROM (filas cambiadas) e INSERT ... WHERE NOT EXISTS. Los montos
+se redondean a la escala de DECIMAL(15,4) antes de guardarlos y de
+calcular row_hash, así una fila leída de la base y la misma fila leída del
+CSV tienen el mismo hash.
+
+Las cargas agregadas e incrementales anotan los clientes y artículos que
+tocan, y solo esos se recalculan en los agregados (refresh_rollups).
+
+Las cargas grandes pueden ejecutarse en segundo plano con
+IngestionJobManager, que usa exactamente la misma lógica (load_csv_upload).
+Tras cada carga confirmada se ejecutan los hooks registrados con
+register_post_ingest_hook (p. ej. el puntaje de venta cruzada).
+"""
+import pandas as pd
+import numpy as np
+from sqlalchemy import insert, update, select, bindparam, text, Table, Column, MetaData
+from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, BinaryIO, Iterator, Callable, List, Set, Tuple
+from datetime import datetime
+import threading
+import traceback
+import logging
+import shutil
+import tempfile
+import time
+import uuid
+import io
+import os
+import re
+
+from models import ClientData, SessionLocal, CLIENT_DATA_INDEXES, RELEASE_DUPLICATE_ROW_KEYS_SQL
+from analytics import refresh_aggregates
+from cache import analytics_cache
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Opciones comunes de lectura de CSV (upload y preview). Todas las columnas
+# se leen como texto: con chunksize pandas infiere los tipos por bloque y una
+# misma columna (p. ej. Factura) quedaría '1001.0' o '1001' según el bloque.
+CSV_READ_OPTIONS = {
+    "encoding": "utf-8",
+    "dtype": str,
+    "skipinitialspace": True,
+    "na_values": ['', 'NA', 'N/A', 'null', 'NULL', 'None', 'NONE'],
+    "keep_default_na": True,
+}
+
+# Filas por bloque al leer el CSV en modo streaming
+CSV_CHUNK_SIZE = 50000
+
+# Tamaño de lote para la carga masiva
+LOAD_BATCH_SIZE = 5000
+
+# Límite de DECIMAL(15,4): 11 dígitos enteros y 4 decimales
+NUMERIC_MAX_ABS = 1e11
+NUMERIC_SCALE = 4
+
+# Ejemplos de valores inválidos guardados en el reporte de validación
+VALIDATION_SAMPLE_SIZE = 20
+
+# Tablas auxiliares para la recarga completa (replace_data) y la incremental
+STAGING_TABLE = "client_data_staging"
+INCOMING_TABLE = "client_data_incoming"
+RETIRED_TABLE = "client_data_old"
+SWAP_INDEX_SUFFIX = "_swap"
+
+# Marcador de NULL en el CSV enviado a COPY
+COPY_NULL_MARKER = '\\N'
+
+# Valores de texto que se consideran vacíos después de convertir a str
+NULL_STRINGS = ['nan', 'None', 'null']
+
+# Mapeo columna del modelo -> encabezado del CSV
+STRING_COLUMNS = {
+    "fecha": "Fecha",
+    "tipo_de_venta": "Tipo de Venta",
+    "documento": "Documento",
+    "factura": "Factura",
+    "codigo": "Codigo",
+    "cliente": "Cliente",
+    "tipo_de_cliente": "Tipo de Cliente",
+    "sku": "SKU",
+    "articulo": "Articulo",
+    "proveedor": "Proveedor",
+    "almacen": "Almacen",
+    "um": "U.M.",
+    "mb_percent": "%MB",
+    "sociedad": "Sociedad",
+    "bc": "BC",
+    "bt": "BT",
+    "bu": "BU",
+    "bs": "BS",
+    "comercial": "Comercial",
+    "tipo_cliente": "Tipo_Cliente",
+    "categoria": "CATEGORIA",
+    "supercategoria": "SUPERCATEGORIA",
+    "cruce": "CRUCE",
+}
+
+NUMERIC_COLUMNS = {
+    "cantidad": "Cantidad",
+    "p_venta": "P. Venta",
+    "c_unit": "C. Unit",
+    "venta": "Venta",
+    "costo": "Costo",
+    "mb": "MB",
+}
+
+# Campos de compatibilidad: (columna CSV, valor por defecto)
+COMPATIBILITY_STRING_COLUMNS = {
+    "client_name": ("Cliente", "Sin nombre"),
+    "client_type": ("Tipo de Cliente", "No especificado"),
+    "executive": ("Comercial", "No asignado"),
+    "product": ("Articulo", "No especificado"),
+}
+
+# Clave natural de una transacción (deduplicación en cargas incrementales)
+NATURAL_KEY_COLUMNS = ["factura", "codigo", "sku", "fecha"]
+
+# Encabezados esperados en el CSV (en el orden del archivo original)
+EXPECTED_CSV_COLUMNS = [
+    "Fecha", "Tipo de Venta", "Documento", "Factura", "Codigo", "Cliente",
+    "Tipo de Cliente", "SKU", "Articulo", "Proveedor", "Almacen", "Cantidad",
+    "U.M.", "P. Venta", "C. Unit", "Venta", "Costo", "MB", "%MB",
+    "Sociedad", "BC", "BT", "BU", "BS", "Comercial", "Tipo_Cliente",
+    "CATEGORIA", "SUPERCATEGORIA", "CRUCE"
+]
+
+
+def _missing_column(length: int, default: Any) -> np.ndarray:
+    """Columna constante para encabezados ausentes en el CSV"""
+    column = np.empty(length, dtype=object)
+    column[:] = default
+    return column
+
+
+def clean_string_column(series: pd.Series, default: Optional[str] = None) -> np.ndarray:
+    """Limpiar una columna de texto completa (strip y nulos -> default)"""
+    missing = series.isna().to_numpy(copy=True)
+    cleaned = series.astype(str).str.strip()
+    missing |= cleaned.isin(NULL_STRINGS).to_numpy()
+
+    result = cleaned.to_numpy(dtype=object, copy=True)
+    result[missing] = default
+    return result
+
+
+def parse_numeric_column(series: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convertir una columna a float eliminando separadores, moneda y porcentajes.
+
+    Devuelve (valores, inválidos): valores redondeados a NUMERIC_SCALE
+    decimales (lo que guarda DECIMAL(15,4)), NaN donde falta o no se pudo
+    convertir, y una máscara de los valores presentes que no son números
+    finitos dentro del rango de DECIMAL(15,4).
+    """
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        values = series.to_numpy(dtype=float, na_value=np.nan, copy=True)
+    else:
+        # Quitar todo lo que no sea dígito, punto o signo ('1,234.50 $' -> '1234.50')
+        stripped = series.astype(str).str.replace(r'[^\d.-]', '', regex=True)
+        numeric = pd.to_numeric(stripped.where(series.notna()), errors='coerce')
+        values = numeric.to_numpy(dtype=float, na_value=np.nan, copy=True)
+
+    with np.errstate(invalid='ignore'):
+        out_of_range = ~np.isfinite(values) | (np.abs(values) >= NUMERIC_MAX_ABS)
+    invalid = out_of_range & series.notna().to_numpy()
+    values[out_of_range] = np.nan
+    return np.round(values, NUMERIC_SCALE), invalid
+
+
+def parse_date_values(values) -> pd.DatetimeIndex:
+    """
+    Parsear fechas del CSV: primero YYYY-MM-DD (ISO), luego DD/MM/YYYY y por
+    último el parser 'mixed' de pandas (día primero) para el resto.
+    """
+    text_values = pd.Index(values).astype(str).str.strip()
+    parsed = pd.to_datetime(text_values, format='ISO8601', errors='coerce').to_numpy(copy=True)
+
+    for date_format in ('%d/%m/%Y', 'mixed'):
+        missing = pd.isna(parsed)
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(
+            text_values[missing], format=date_format, dayfirst=True, errors='coerce'
+        ).to_numpy()
+
+    return pd.DatetimeIndex(parsed)
+
+
+def clean_date_columns(series: pd.Series, default: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """
+    Parsear 'Fecha' una sola vez por valor único y derivar las columnas tipadas.
+
+    Devuelve date (datetime, con default si no se puede parsear), fecha_date
+    (date o None) y year_month ('YYYY-MM' o None).
+    """
+    codes, uniques = pd.factorize(series)
+    length = len(series)
+
+    if len(uniques):
+        parsed = parse_date_values(uniques)
+        valid_dates = ~parsed.isna()
+        datetimes = np.array([default] * len(parsed), dtype=object)
+        dates = np.array([None] * len(parsed), dtype=object)
+        months = np.array([None] * len(parsed), dtype=object)
+        datetimes[valid_dates] = parsed[valid_dates].to_pydatetime()
+        dates[valid_dates] = [value.date() for value in datetimes[valid_dates]]
+        months[valid_dates] = parsed[valid_dates].strftime('%Y-%m').to_numpy()
+    else:
+        datetimes = dates = months = np.empty(0, dtype=object)
+
+    result = {
+        "date": _missing_column(length, default),
+        "fecha_date": _missing_column(length, None),
+        "year_month": _missing_column(length, None),
+    }
+    valid = codes >= 0
+    for name, values in (("date", datetimes), ("fecha_date", dates), ("year_month", months)):
+        result[name][valid] = values[codes[valid]]
+    return result
+
+
+def compute_row_hashes(columns: Dict[str, np.ndarray]):
+    """
+    Calcular (row_key, row_hash) como enteros int64 para cada fila.
+
+    row_key identifica la clave natural y row_hash el contenido del CSV;
+    ambos se calculan de forma vectorizada con pd.util.hash_pandas_object.
+    Los montos se redondean a NUMERIC_SCALE decimales: los DECIMAL leídos
+    de la base y los float del CSV dan el mismo hash.
+    """
+    def as_text(name):
+        return pd.Series(columns[name], dtype=object)
+
+    def as_number(name):
+        return pd.Series(columns[name], dtype=object).astype(float).round(NUMERIC_SCALE)
+
+    key_frame = pd.DataFrame({name: as_text(name) for name in NATURAL_KEY_COLUMNS})
+    content_frame = pd.DataFrame({
+        **{name: as_text(name) for name in STRING_COLUMNS},
+        **{name: as_number(name) for name in NUMERIC_COLUMNS},
+    })
+
+    row_key = pd.util.hash_pandas_object(key_frame, index=False).to_numpy().view(np.int64)
+    row_hash = pd.util.hash_pandas_object(content_frame, index=False).to_numpy().view(np.int64)
+    return row_key, row_hash
+
+
+def new_validation_report() -> Dict[str, Any]:
+    """Reporte vacío de valores corregidos durante la ingesta"""
+    return {
+        "invalid_numeric": {attr: 0 for attr in NUMERIC_COLUMNS},
+        "invalid_dates": 0,
+        "total_invalid": 0,
+        "samples": [],
+    }
+
+
+def _record_invalid(report: Dict[str, Any], series: pd.Series, invalid: np.ndarray, row_offset: int) -> int:
+    """Acumular en el reporte los ejemplos de valores inválidos de una columna"""
+    positions = np.flatnonzero(invalid)
+    report["total_invalid"] += len(positions)
+    room = VALIDATION_SAMPLE_SIZE - len(report["samples"])
+    for position in positions[:max(room, 0)]:
+        report["samples"].append({
+            "row": row_offset + int(position) + 1,
+            "column": series.name,
+            "value": str(series.iloc[position]),
+        })
+    return len(positions)
+
+
+def normalize_dataframe(
+    df: pd.DataFrame,
+    filename: str,
+    row_offset: int = 0,
+    validation: Optional[Dict[str, Any]] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Normalizar un DataFrame del CSV a columnas listas para insertar en client_data.
+
+    Devuelve un diccionario columna del modelo -> arreglo de NumPy (dtype object)
+    con valores nativos de Python (str, float, datetime o None). Los montos
+    no numéricos o fuera de rango se guardan como 0 y las fechas no
+    reconocidas como NULL; si se pasa `validation` (ver new_validation_report)
+    se acumulan allí los conteos y ejemplos.
+    """
+    length = len(df)
+    uploaded_at = datetime.utcnow()
+    columns: Dict[str, np.ndarray] = {}
+
+    def column_or_missing(csv_name, cleaner, default):
+        if csv_name in df.columns:
+            return cleaner(df[csv_name], default)
+        return _missing_column(length, default)
+
+    # Metadatos
+    columns["uploaded_at"] = _missing_column(length, uploaded_at)
+    columns["filename"] = _missing_column(length, filename)
+
+    # Columnas del CSV
+    for attr, csv_name in STRING_COLUMNS.items():
+        columns[attr] = column_or_missing(csv_name, clean_string_column, None)
+
+    for attr, csv_name in NUMERIC_COLUMNS.items():
+        if csv_name not in df.columns:
+            columns[attr] = _missing_column(length, 0.0)
+            continue
+        values, invalid = parse_numeric_column(df[csv_name])
+        columns[attr] = values.astype(object)
+        columns[attr][np.isnan(values)] = 0.0
+        if validation is not None and invalid.any():
+            validation["invalid_numeric"][attr] += _record_invalid(validation, df[csv_name], invalid, row_offset)
+
+    # Campos de compatibilidad
+    for attr, (csv_name, default) in COMPATIBILITY_STRING_COLUMNS.items():
+        columns[attr] = column_or_missing(csv_name, clean_string_column, default)
+
+    columns["value"] = columns["venta"]
+    fecha = df["Fecha"] if "Fecha" in df.columns else pd.Series([None] * length, dtype=object)
+    columns.update(clean_date_columns(fecha, uploaded_at))
+    if validation is not None:
+        present = fecha.notna().to_numpy() & (fecha.astype(str).str.strip() != '').to_numpy()
+        invalid_dates = present & pd.isna(columns["fecha_date"])
+        if invalid_dates.any():
+            validation["invalid_dates"] += _record_invalid(validation, fecha, invalid_dates, row_offset)
+
+    row_numbers = pd.Series(np.arange(row_offset + 1, row_offset + length + 1)).astype(str)
+    columns["description"] = (f"Importado desde {filename} - Fila " + row_numbers).to_numpy(dtype=object)
+
+    row_key, row_hash = compute_row_hashes(columns)
+    columns["row_key"] = row_key.astype(object)
+    columns["row_hash"] = row_hash.astype(object)
+
+    return columns
+
+
+def iter_row_mappings(columns: Dict[str, np.ndarray]):
+    """Recorrer las columnas normalizadas como diccionarios por fila"""
+    names = list(columns.keys())
+    for values in zip(*(columns[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def _column_slices(columns: Dict[str, np.ndarray], batch_size: int):
+    """Dividir las columnas normalizadas en lotes de filas"""
+    total_rows = len(next(iter(columns.values()))) if columns else 0
+    for start in range(0, total_rows, batch_size):
+        yield {name: values[start:start + batch_size] for name, values in columns.items()}
+
+
+class _CopyStream:
+    """Archivo de solo lectura que genera el CSV para COPY lote por lote"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], batch_size: int):
+        self._batches = _column_slices(columns, batch_size)
+        self._buffer = ''
+        self._position = 0
+
+    def _next_chunk(self) -> str:
+        batch = next(self._batches, None)
+        if batch is None:
+            return ''
+        chunk = io.StringIO()
+        pd.DataFrame(batch).to_csv(chunk, header=False, index=False, na_rep=COPY_NULL_MARKER)
+        return chunk.getvalue()
+
+    def read(self, size: int = -1) -> str:
+        parts = []
+        remaining = size
+        while size < 0 or remaining > 0:
+            if self._position >= len(self._buffer):
+                self._buffer = self._next_chunk()
+                self._position = 0
+                if not self._buffer:
+                    break
+
+            end = len(self._buffer) if size < 0 else self._position + remaining
+            part = self._buffer[self._position:end]
+            self._position += len(part)
+            remaining -= len(part)
+            parts.append(part)
+        return ''.join(parts)
+
+
+def _copy_load(db: Session, table_name: str, columns: Dict[str, np.ndarray], batch_size: int) -> None:
+    """Cargar filas con COPY FROM STDIN (PostgreSQL / psycopg2)"""
+    column_list = ", ".join(columns.keys())
+    copy_sql = (
+        f"COPY {table_name} ({column_list}) FROM STDIN "
+        f"WITH (FORMAT csv, NULL '{COPY_NULL_MARKER}')"
+    )
+    raw_connection = db.connection().connection
+    cursor = raw_connection.cursor()
+    try:
+        cursor.copy_expert(copy_sql, _CopyStream(columns, batch_size))
+    finally:
+        cursor.close()
+
+
+def _executemany_load(db: Session, table, columns: Dict[str, np.ndarray], batch_size: int) -> None:
+    """Cargar filas con INSERT executemany de SQLAlchemy Core"""
+    statement = insert(table)
+    for batch in _column_slices(columns, batch_size):
+        db.execute(statement, list(iter_row_mappings(batch)))
+
+
+def bulk_load_client_data(
+    db: Session,
+    columns: Dict[str, np.ndarray],
+    table=None,
+    batch_size: int = LOAD_BATCH_SIZE
+) -> Dict[str, Any]:
+    """
+    Insertar columnas normalizadas en client_data sin pasar por el ORM.
+
+    No hace commit: la transacción queda a cargo del llamador.
+    Devuelve estadísticas de carga (método, filas, segundos, filas/segundo).
+    """
+    table = table if table is not None else ClientData.__table__
+    total_rows = len(next(iter(columns.values()))) if columns else 0
+    dialect = db.get_bind().dialect.name
+
+    started = time.perf_counter()
+    if total_rows:
+        if dialect == "postgresql":
+            method = "copy"
+            _copy_load(db, table.name, columns, batch_size)
+        else:
+            method = "executemany"
+            _executemany_load(db, table, columns, batch_size)
+    else:
+        method = "copy" if dialect == "postgresql" else "executemany"
+    elapsed = time.perf_counter() - started
+
+    rows_per_second = round(total_rows / elapsed, 1) if elapsed > 0 else float(total_rows)
+    logger.info(f"📥 Carga masiva ({method}): {total_rows} filas en {elapsed:.2f}s ({rows_per_second} filas/s)")
+
+    return {
+        "method": method,
+        "rows": total_rows,
+        "seconds": round(elapsed, 4),
+        "rows_per_second": rows_per_second,
+    }
+
+
+def iter_csv_chunks(binary_file: BinaryIO, chunk_size: int = CSV_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Leer el archivo subido (spooled file) por bloques de filas"""
+    binary_file.seek(0)
+    reader = pd.read_csv(binary_file, chunksize=chunk_size, **CSV_READ_OPTIONS)
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+
+def ingest_csv_stream(
+    db: Session,
+    binary_file: BinaryIO,
+    filename: str,
+    chunk_size: int = CSV_CHUNK_SIZE,
+    table=None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    incremental: bool = False,
+    rollup_keys: Optional[Dict[str, Set[str]]] = None
+) -> Dict[str, Any]:
+    """
+    Leer, normalizar y cargar un CSV bloque por bloque.
+
+    Con incremental=True cada bloque se fusiona con client_data por clave
+    natural (ver merge_incoming_chunk) en lugar de agregarse tal cual. Sin
+    table ni incremental los bloques se agregan a client_data
+    (append_incoming_chunk). En esos dos modos, si se indica `rollup_keys`
+    se acumulan ahí los clientes y artículos cuyos agregados cambian.
+
+    No hace commit: la transacción queda a cargo del llamador.
+    Los errores de formato del CSV se propagan como excepciones de pandas
+    (ParserError, EmptyDataError) o UnicodeDecodeError. Si se indica
+    `progress`, se llama con las estadísticas acumuladas después de parsear
+    y después de cargar cada bloque.
+    """
+    started = time.perf_counter()
+    stats = {
+        "total_rows": 0,
+        "saved_rows": 0,
+        "chunks": 0,
+        "columns_found": [],
+        "load_method": None,
+        "load_seconds": 0.0,
+        "validation": new_validation_report(),
+    }
+    if incremental:
+        stats.update({"inserted_rows": 0, "updated_rows": 0, "skipped_rows": 0})
+    appending = table is None and not incremental
+    if incremental or appending:
+        incoming = prepare_incoming_table(db)
+
+    for chunk in iter_csv_chunks(binary_file, chunk_size):
+        if stats["chunks"] == 0:
+            stats["columns_found"] = list(chunk.columns)
+            logger.info(f"Columnas encontradas: {stats['columns_found']}")
+
+        columns = normalize_dataframe(chunk, filename, row_offset=stats["total_rows"], validation=stats["validation"])
+        stats["chunks"] += 1
+        stats["total_rows"] += len(chunk)
+        if progress:
+            progress(stats)
+
+        if incremental:
+            load_stats = merge_incoming_chunk(db, incoming, columns, rollup_keys)
+            stats["inserted_rows"] += load_stats["inserted"]
+            stats["updated_rows"] += load_stats["updated"]
+            stats["skipped_rows"] += load_stats["skipped"]
+            stats["saved_rows"] += load_stats["inserted"] + load_stats["updated"]
+        elif appending:
+            load_stats = append_incoming_chunk(db, incoming, columns, rollup_keys)
+            stats["saved_rows"] += load_stats["rows"]
+        else:
+            load_stats = bulk_load_client_data(db, columns, table=table)
+            stats["saved_rows"] += load_stats["rows"]
+        stats["load_method"] = load_stats["method"]
+        stats["load_seconds"] += load_stats["seconds"]
+        if progress:
+            progress(stats)
+        logger.info(f"Bloque {stats['chunks']} cargado: {stats['saved_rows']} filas acumuladas")
+
+    if incremental or appending:
+        db.execute(text(f"DROP TABLE IF EXISTS {INCOMING_TABLE}"))
+
+    if stats["validation"]["total_invalid"]:
+        logger.warning(f"⚠️ Valores corregidos durante la ingesta: {stats['validation']['total_invalid']}")
+
+    elapsed = time.perf_counter() - started
+    stats["load_seconds"] = round(stats["load_seconds"], 4)
+    stats["seconds"] = round(elapsed, 4)
+    stats["rows_per_second"] = round(stats["saved_rows"] / elapsed, 1) if elapsed > 0 else float(stats["saved_rows"])
+    return stats
+
+
+def _client_data_table_definition(name: str, include_id: bool = True, temporary: bool = False) -> Table:
+    """Tabla auxiliar con las mismas columnas que client_data y sin índices"""
+    columns = [
+        Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+        for column in ClientData.__table__.columns
+        if include_id or column.name != "id"
+    ]
+    return Table(name, MetaData(), *columns, prefixes=["TEMPORARY"] if temporary else [])
+
+
+def prepare_staging_table(db: Session) -> Table:
+    """Crear la tabla staging vacía (sin índices) para una recarga completa"""
+    staging = _client_data_table_definition(STAGING_TABLE)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Serializar recargas concurrentes; el lock se libera con la transacción
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext('client_data_swap'))"))
+        db.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+        db.execute(text(f"CREATE TABLE {STAGING_TABLE} (LIKE client_data INCLUDING DEFAULTS)"))
+    else:
+        db.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+        staging.create(bind=db.connection())
+
+    return staging
+
+
+def _swap_postgresql(db: Session):
+    """Construir índices sobre staging e intercambiar con RENAME (PostgreSQL)"""
+    index_rows = db.execute(text("""
+        SELECT i.indexname, i.indexdef, c.conname
+        FROM pg_indexes i
+        LEFT JOIN pg_constraint c
+            ON c.conindid = (quote_ident(i.schemaname) || '.' || quote_ident(i.indexname))::regclass
+            AND c.contype = 'p'
+        WHERE i.tablename = 'client_data'
+        AND i.schemaname = current_schema()
+    """)).fetchall()
+
+    # Índices después de la carga: mismas definiciones, nombres temporales
+    definition_pattern = re.compile(r'^(CREATE (?:UNIQUE )?INDEX )(\S+)( ON (?:ONLY )?)(\S+)( .*)$')
+    swapped_indexes = []
+    for row in index_rows:
+        temporary_name = f"{row.indexname[:63 - len(SWAP_INDEX_SUFFIX)]}{SWAP_INDEX_SUFFIX}"
+        match = definition_pattern.match(row.indexdef)
+        if not match:
+            logger.warning(f"⚠️ Índice no reconocido, se omite: {row.indexdef}")
+            continue
+        db.execute(text(f"{match.group(1)}{temporary_name}{match.group(3)}{STAGING_TABLE}{match.group(5)}"))
+        if row.conname:
+            db.execute(text(
+                f"ALTER TABLE {STAGING_TABLE} ADD CONSTRAINT {temporary_name} PRIMARY KEY USING INDEX {temporary_name}"
+            ))
+        swapped_indexes.append((temporary_name, row.indexname))
+
+    db.execute(text(f"ANALYZE {STAGING_TABLE}"))
+
+    sequence_name = db.execute(text("SELECT pg_get_serial_sequence('client_data', 'id')")).scalar()
+
+    # Intercambio atómico: los lectores ven la tabla anterior hasta el COMMIT
+    db.execute(text("LOCK TABLE client_data IN ACCESS EXCLUSIVE MODE"))
+    db.execute(text(f"DROP TABLE IF EXISTS {RETIRED_TABLE}"))
+    db.execute(text(f"ALTER TABLE client_data RENAME TO {RETIRED_TABLE}"))
+    db.execute(text(f"ALTER TABLE {STAGING_TABLE} RENAME TO client_data"))
+    if sequence_name:
+        db.execute(text(f"ALTER SEQUENCE {sequence_name} OWNED BY client_data.id"))
+    db.execute(text(f"DROP TABLE {RETIRED_TABLE}"))
+
+    for temporary_name, final_name in swapped_indexes:
+        db.execute(text(f"ALTER INDEX {temporary_name} RENAME TO {final_name}"))
+
+
+def _swap_generic(db: Session):
+    """Intercambiar staging con client_data y recrear índices (SQLite y otros)"""
+    connection = db.connection()
+    db.execute(text("DROP TABLE client_data"))
+    db.execute(text(f"ALTER TABLE {STAGING_TABLE} RENAME TO client_data"))
+
+    for index in ClientData.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+    for index_sql in CLIENT_DATA_INDEXES:
+        db.execute(text(index_sql))
+
+
+def swap_staging_table(db: Session):
+    """Reemplazar client_data por la tabla staging ya cargada (sin commit)"""
+    started = time.perf_counter()
+    if db.get_bind().dialect.name == "postgresql":
+        _swap_postgresql(db)
+    else:
+        _swap_generic(db)
+    logger.info(f"🔁 Tabla staging intercambiada con client_data en {time.perf_counter() - started:.2f}s")
+
+
+def prepare_incoming_table(db: Session) -> Table:
+    """Crear la tabla temporal que recibe cada bloque en modo incremental"""
+    incoming = _client_data_table_definition(INCOMING_TABLE, include_id=False, temporary=True)
+    db.execute(text(f"DROP TABLE IF EXISTS {INCOMING_TABLE}"))
+    incoming.create(bind=db.connection())
+    return incoming
+
+
+def backfill_row_keys(db: Session, batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """
+    Calcular row_key/row_hash de filas cargadas antes de existir estas columnas.
+
+    Las claves que ya tiene otra fila (o que se repiten en el lote) quedan
+    en NULL para respetar el índice único; la fila más reciente es la dueña.
+    """
+    table = ClientData.__table__
+    content_columns = list(STRING_COLUMNS) + list(NUMERIC_COLUMNS)
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values(row_key=bindparam("b_row_key"), row_hash=bindparam("b_row_hash"))
+    )
+
+    total = 0
+    while True:
+        rows = db.execute(
+            select(table.c.id, *[table.c[name] for name in content_columns])
+            .where(table.c.row_hash.is_(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+
+        frame = pd.DataFrame(rows, columns=["id"] + content_columns)
+        row_key, row_hash = compute_row_hashes({name: frame[name].to_numpy(dtype=object) for name in content_columns})
+        keys = pd.Series(row_key)
+        taken = set(db.execute(
+            select(table.c.row_key).where(table.c.row_key.in_([int(key) for key in keys.unique()]))
+        ).scalars())
+        released = (keys.duplicated(keep="last") | keys.isin(taken)).to_numpy()
+
+        db.execute(statement, [
+            {"b_id": int(row_id), "b_row_key": None if release else int(key), "b_row_hash": int(content_hash)}
+            for row_id, key, content_hash, release in zip(frame["id"], row_key, row_hash, released)
+        ])
+        total += len(rows)
+
+    if total:
+        logger.info(f"🔑 Claves naturales calculadas para {total} filas existentes")
+    return total
+
+
+def backfill_typed_dates(db: Session, batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """Completar fecha_date/year_month de filas cargadas antes de existir estas columnas"""
+    table = ClientData.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values(fecha_date=bindparam("b_fecha_date"), year_month=bindparam("b_year_month"))
+    )
+
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(table.c.id, table.c.fecha)
+            .where(table.c.id > last_id, table.c.year_month.is_(None), table.c.fecha.isnot(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+
+        last_id = rows[-1].id
+        parsed = clean_date_columns(pd.Series([row.fecha for row in rows], dtype=object))
+        params = [
+            {"b_id": row.id, "b_fecha_date": fecha_date, "b_year_month": year_month}
+            for row, fecha_date, year_month in zip(rows, parsed["fecha_date"], parsed["year_month"])
+            if year_month is not None
+        ]
+        if params:
+            db.execute(statement, params)
+            total += len(params)
+
+    if total:
+        logger.info(f"📅 Fechas tipadas calculadas para {total} filas existentes")
+    return total
+
+
+def _release_chunk_duplicates(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Dentro del bloque solo la última fila de cada clave conserva row_key"""
+    repeated = pd.Series(columns["row_key"]).duplicated(keep="last").to_numpy()
+    if repeated.any():
+        columns = {**columns, "row_key": columns["row_key"].copy()}
+        columns["row_key"][repeated] = None
+    return columns
+
+
+def _collect_rollup_keys(db: Session, rollup_keys: Optional[Dict[str, Set[str]]], replaced: bool) -> None:
+    """
+    Agregar a rollup_keys los clientes y artículos del bloque en la tabla
+    temporal y, si `replaced`, los de las filas de client_data con la misma
+    row_key (su valor anterior, antes de que la fusión lo reemplace)
+    """
+    if rollup_keys is None:
+        return
+    for column in ("cliente", "articulo"):
+        values = rollup_keys.setdefault(column, set())
+        values.update(row[0] for row in db.execute(text(f"SELECT DISTINCT {column} FROM {INCOMING_TABLE}")))
+        if replaced:
+            values.update(row[0] for row in db.execute(text(f"""
+                SELECT DISTINCT t.{column} FROM client_data t
+                JOIN {INCOMING_TABLE} i ON t.row_key = i.row_key
+            """)))
+
+
+def append_incoming_chunk(db: Session, incoming: Table, columns: Dict[str, np.ndarray],
+                          rollup_keys: Optional[Dict[str, Set[str]]] = None) -> Dict[str, Any]:
+    """
+    Agregar un bloque a client_data sin deduplicar (replace_data=False).
+
+    Las filas nuevas se quedan con su row_key; las existentes con la misma
+    clave la liberan, como en una recarga completa.
+    """
+    columns = _release_chunk_duplicates(columns)
+    db.execute(text(f"DELETE FROM {INCOMING_TABLE}"))
+    load_stats = bulk_load_client_data(db, columns, table=incoming)
+    _collect_rollup_keys(db, rollup_keys, replaced=False)
+
+    column_names = ", ".join(columns.keys())
+    db.execute(text(f"""
+        UPDATE client_data SET row_key = NULL
+        WHERE row_key IN (SELECT row_key FROM {INCOMING_TABLE} WHERE row_key IS NOT NULL)
+    """))
+    db.execute(text(f"INSERT INTO client_data ({column_names}) SELECT {column_names} FROM {INCOMING_TABLE}"))
+    return load_stats
+
+
+def _merge_postgresql(db: Session, column_names: List[str]) -> Tuple[int, int]:
+    """Upsert con ON CONFLICT sobre el índice único de row_key (seguro ante cargas concurrentes)"""
+    assignments = ", ".join(f"{name} = EXCLUDED.{name}" for name in column_names)
+    rows = db.execute(text(f"""
+        INSERT INTO client_data ({", ".join(column_names)})
+        SELECT {", ".join(column_names)} FROM {INCOMING_TABLE}
+        ON CONFLICT (row_key) DO UPDATE SET {assignments}
+        WHERE client_data.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+        RETURNING (xmax = 0) AS inserted
+    """)).fetchall()
+    inserted = sum(1 for row in rows if row.inserted)
+    return inserted, len(rows) - inserted
+
+
+def _merge_generic(db: Session, column_names: List[str]) -> Tuple[int, int]:
+    """UPDATE ... FROM de las filas cambiadas e INSERT de las claves nuevas (SQLite y otros)"""
+    assignments = ", ".join(f"{name} = i.{name}" for name in column_names)
+    updated = db.execute(text(f"""
+        UPDATE client_data SET {assignments}
+        FROM {INCOMING_TABLE} AS i
+        WHERE client_data.row_key = i.row_key
+        AND (client_data.row_hash IS NULL OR client_data.row_hash <> i.row_hash)
+    """)).rowcount
+
+    inserted = db.execute(text(f"""
+        INSERT INTO client_data ({", ".join(column_names)})
+        SELECT {", ".join(f"i.{name}" for name in column_names)}
+        FROM {INCOMING_TABLE} AS i
+        WHERE NOT EXISTS (
+            SELECT 1 FROM client_data t WHERE t.row_key = i.row_key
+        )
+    """)).rowcount
+    return inserted, updated
+
+
+def merge_incoming_chunk(db: Session, incoming: Table, columns: Dict[str, np.ndarray],
+                         rollup_keys: Optional[Dict[str, Set[str]]] = None) -> Dict[str, Any]:
+    """
+    Fusionar un bloque normalizado con client_data por clave natural.
+
+    Dentro del bloque gana la última fila de cada clave. Devuelve filas
+    insertadas, actualizadas (contenido distinto) y omitidas (sin cambios).
+    """
+    keep = ~pd.Series(columns["row_key"]).duplicated(keep="last").to_numpy()
+    if not keep.all():
+        columns = {name: values[keep] for name, values in columns.items()}
+    incoming_rows = int(keep.sum())
+
+    db.execute(text(f"DELETE FROM {INCOMING_TABLE}"))
+    load_stats = bulk_load_client_data(db, columns, table=incoming)
+    _collect_rollup_keys(db, rollup_keys, replaced=True)
+
+    if db.get_bind().dialect.name == "postgresql":
+        inserted, updated = _merge_postgresql(db, list(columns.keys()))
+    else:
+        inserted, updated = _merge_generic(db, list(columns.keys()))
+
+    return {
+        **load_stats,
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": max(0, incoming_rows - inserted - updated) + int((~keep).sum()),
+    }
+
+
+def load_csv_upload(
+    db: Session,
+    binary_file: BinaryIO,
+    filename: str,
+    replace_data: bool = True,
+    chunk_size: int = CSV_CHUNK_SIZE,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    incremental: bool = False
+) -> Dict[str, Any]:
+    """
+    Lógica completa de /upload-csv: cargar el CSV por bloques y confirmar.
+
+    Con replace_data la carga va a una tabla staging que reemplaza a
+    client_data en la misma transacción; sin replace_data se agrega a la
+    tabla existente. Con incremental se insertan solo filas nuevas y se
+    actualizan las cambiadas (replace_data se ignora).
+    Lanza pd.errors.EmptyDataError si el archivo no tiene filas.
+    """
+    if incremental:
+        replace_data = False
+
+    try:
+        table = prepare_staging_table(db) if replace_data else None
+        if incremental:
+            backfill_row_keys(db)
+        rollup_keys = None if replace_data else {}
+        stats = ingest_csv_stream(
+            db, binary_file, filename,
+            chunk_size=chunk_size, table=table, progress=progress, incremental=incremental,
+            rollup_keys=rollup_keys
+        )
+        if stats["total_rows"] == 0:
+            raise pd.errors.EmptyDataError("El archivo CSV está vacío")
+
+        if replace_data:
+            db.execute(text(RELEASE_DUPLICATE_ROW_KEYS_SQL.format(table=STAGING_TABLE)))
+            refresh_aggregates(db, STAGING_TABLE)
+            swap_staging_table(db)
+        else:
+            refresh_aggregates(db, keys=rollup_keys)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    analytics_cache.bump_version()
+    run_post_ingest_hooks(db)
+
+    stats["replace_method"] = "incremental" if incremental else ("staging_swap" if replace_data else "append")
+    logger.info(f"✅ {stats['saved_rows']} registros guardados exitosamente con todas las columnas")
+    return stats
+
+
+# Tareas a ejecutar después de cada carga confirmada (reciben la sesión)
+POST_INGEST_HOOKS: List[Callable[[Session], Any]] = []
+
+
+def register_post_ingest_hook(hook: Callable[[Session], Any]) -> None:
+    """Registrar una tarea que se ejecuta tras cada carga exitosa"""
+    POST_INGEST_HOOKS.append(hook)
+
+
+def run_post_ingest_hooks(db: Session) -> None:
+    """Ejecutar los hooks post-carga; un fallo se registra pero no anula la carga"""
+    for hook in POST_INGEST_HOOKS:
+        try:
+            hook(db)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"⚠️ Error en tarea post-carga {getattr(hook, '__name__', hook)}: {e}")
+
+
+class IngestionJobManager:
+    """Ejecuta cargas de CSV en segundo plano y expone su progreso"""
+
+    def __init__(self, max_workers: int = 1, max_jobs: int = 100):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, source_file: BinaryIO, filename: str, replace_data: bool = True,
+               chunk_size: int = CSV_CHUNK_SIZE, incremental: bool = False) -> Dict[str, Any]:
+        """Copiar el archivo subido a disco y encolar la carga; devuelve el estado inicial"""
+        source_file.seek(0)
+        spool = tempfile.NamedTemporaryFile(prefix="upload_", suffix=".csv", delete=False)
+        with spool:
+            shutil.copyfileobj(source_file, spool)
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "pending",
+            "filename": filename,
+            "replace_data": replace_data,
+            "incremental": incremental,
+            "chunk_size": chunk_size,
+            "rows_parsed": 0,
+            "rows_inserted": 0,
+            "rows_updated": 0,
+            "rows_skipped": 0,
+            "chunks": 0,
+            "errors_count": 0,
+            "errors": [],
+            "validation": None,
+            "load_method": None,
+            "rows_per_second": 0.0,
+            "elapsed_seconds": 0.0,
+            "created_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "message": "Carga en cola",
+        }
+
+        with self.lock:
+            self.jobs[job_id] = job
+            self._prune()
+
+        self.executor.submit(self._run, job_id, spool.name)
+        logger.info(f"📨 Job de ingesta {job_id} encolado para {filename}")
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Copia del estado actual de un job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return {**job, "errors": list(job["errors"])} if job else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Estados de todos los jobs conocidos, del más reciente al más antiguo"""
+        with self.lock:
+            job_ids = list(self.jobs.keys())
+        return [self.get(job_id) for job_id in reversed(job_ids)]
+
+    def _prune(self):
+        # Olvidar los jobs terminados más antiguos cuando se supera el límite
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("completed", "failed")]
+        while len(self.jobs) > self.max_jobs and finished:
+            self.jobs.pop(finished.pop(0), None)
+
+    def _update(self, job_id: str, **fields):
+        with self.lock:
+            job = self.jobs[job_id]
+            job.update(fields)
+            if job["started_at"]:
+                started = datetime.fromisoformat(job["started_at"])
+                elapsed = (datetime.utcnow() - started).total_seconds()
+                job["elapsed_seconds"] = round(elapsed, 2)
+                job["rows_per_second"] = round(job["rows_inserted"] / elapsed, 1) if elapsed > 0 else 0.0
+
+    def _run(self, job_id: str, path: str):
+        self._update(job_id, status="running", started_at=datetime.utcnow().isoformat(), message="Procesando archivo")
+        job = self.get(job_id)
+
+        def progress(stats):
+            self._update(
+                job_id,
+                rows_parsed=stats["total_rows"],
+                rows_inserted=stats.get("inserted_rows", stats["saved_rows"]),
+                rows_updated=stats.get("updated_rows", 0),
+                rows_skipped=stats.get("skipped_rows", 0),
+                chunks=stats["chunks"],
+                load_method=stats["load_method"],
+            )
+
+        db = SessionLocal()
+        try:
+            with open(path, "rb") as binary_file:
+                stats = load_csv_upload(
+                    db, binary_file, job["filename"],
+                    replace_data=job["replace_data"],
+                    chunk_size=job["chunk_size"],
+                    progress=progress,
+                    incremental=job["incremental"]
+                )
+            progress(stats)
+            self._update(
+                job_id,
+                status="completed",
+                validation=stats["validation"],
+                finished_at=datetime.utcnow().isoformat(),
+                message=f"Archivo procesado exitosamente. {stats['saved_rows']} registros guardados."
+            )
+        except Exception as e:
+            logger.error(f"❌ Job de ingesta {job_id} falló: {str(e)}")
+            logger.error(traceback.format_exc())
+            with self.lock:
+                failed = self.jobs[job_id]
+                failed["errors"].append(str(e))
+                failed["errors_count"] = len(failed["errors"])
+                failed["rows_inserted"] = 0
+            self._update(
+                job_id,
+                status="failed",
+                finished_at=datetime.utcnow().isoformat(),
+                message=f"Error procesando archivo: {str(e)}"
+            )
+        finally:
+            db.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# Instancia global del gestor de cargas en segundo plano
+ingestion_jobs = IngestionJobManager(max_workers=settings.ingest_workers)
@@ -1,23 +1,35 @@
 from fastapi import FastAPI, File, UploadFile, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func
+from sqlalchemy import text
 import pandas as pd
-import io
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Literal
 from datetime import datetime
 import logging
 import traceback
 import json
+import heapq
+import asyncio
+import inspect
 import uvicorn
 import os
 import re
 from pathlib import Path
 
 # Importar modelos y configuración
-from models import get_database, ClientData, AuthorizedEmail, create_tables, test_database_connection, migrate_add_new_columns
+from models import get_database, SessionLocal, ClientData, AuthorizedEmail, create_tables, test_database_connection, migrate_add_new_columns
 from config import settings
+from analytics import get_summary, refresh_aggregates, ensure_aggregates
+from cache import analytics_cache, is_fallback_payload
+from executors import bounded_executor
+from ingestion import CSV_READ_OPTIONS, CSV_CHUNK_SIZE, EXPECTED_CSV_COLUMNS, load_csv_upload, ingestion_jobs, backfill_typed_dates, register_post_ingest_hook, run_post_ingest_hooks
+from scoring import score_cross_sell, get_cross_sell_scores, current_model_version
+from search import search_engine
+from pagination import decode_cursor, next_cursor, count_client_data
+from projection import resolve_fields, fetch_client_data
+from export import build_export
+from responses import FastJSONResponse, FastJSONRoute, apply_layout
 
 from auth import (
     get_password_hash, 
@@ -162,6 +174,31 @@ logger.info(f"   Cargado: {ml_service.is_loaded}")
 logger.info(f"   Demo: {ml_service.demo_mode}")
 logger.info("="*50)
 
+
+def score_cross_sell_after_ingest(db: Session):
+    """Fijar los diccionarios de categorías del dataset nuevo y recalcular cross_sell_scores"""
+    if hasattr(ml_service, "refresh_categories"):
+        ml_service.refresh_categories(db)
+    return score_cross_sell(db, ml_service)
+
+
+def score_cross_sell_after_model_swap(loaded):
+    """Recalcular cross_sell_scores cuando se activa otra versión del modelo"""
+    db = SessionLocal()
+    try:
+        score_cross_sell(db, ml_service)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"⚠️ No se pudieron recalcular los puntajes con el modelo {loaded.version}: {e}")
+    finally:
+        db.close()
+
+
+register_post_ingest_hook(score_cross_sell_after_ingest)
+if hasattr(ml_service, "on_swap"):
+    ml_service.on_swap(score_cross_sell_after_model_swap)
+
 # ===== MODELOS PYDANTIC PARA ML =====
 from pydantic import BaseModel
 
@@ -187,8 +224,11 @@ class SingleClientPrediction(BaseModel):
 app = FastAPI(
     title="Sistema de Análisis Anders",
     description="API para importar y analizar datos CSV completos",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=FastJSONResponse
 )
+# Respuestas serializadas con orjson sin pasar por jsonable_encoder
+app.router.route_class = FastJSONRoute
 
 # CORS Middleware
 app.add_middleware(
@@ -237,6 +277,25 @@ async def startup_event():
     if not migrate_add_new_columns():
         logger.warning("⚠️ No se pudieron agregar todas las columnas nuevas")
     
+    # Completar fechas tipadas de datos cargados antes de la migración
+    db = SessionLocal()
+    try:
+        backfill_typed_dates(db)
+        db.commit()
+        ensure_aggregates(db)
+        search_engine.ensure_indexes(db)
+        # Códigos de categorías del modelo: una vez con los datos ya cargados
+        if hasattr(ml_service, "refresh_categories"):
+            ml_service.refresh_categories(db)
+        # Puntuar si no hay puntajes del modelo activo (primer arranque o modelo nuevo)
+        if get_cross_sell_scores(db, current_model_version(ml_service), limit=0) is None:
+            run_post_ingest_hooks(db)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"⚠️ No se pudieron completar las fechas tipadas o los agregados: {e}")
+    finally:
+        db.close()
+    
     # Verificar ml Service
     if ML_AVAILABLE and ml_service.is_loaded:
         logger.info("✅ Sistema ML inicializado correctamente")
@@ -261,7 +320,8 @@ async def health_check():
 
 # ===== ENDPOINT DE DIAGNÓSTICO =====
 @app.get("/debug/data-status")
-async def debug_data_status_postgresql(db: Session = Depends(get_database)):
+@bounded_executor.offload("db")
+def debug_data_status_postgresql(db: Session = Depends(get_database)):
     """Diagnóstico específico para PostgreSQL"""
     try:
         logger.info("🔍 Ejecutando diagnóstico de PostgreSQL...")
@@ -377,36 +437,16 @@ async def debug_data_status_postgresql(db: Session = Depends(get_database)):
 
 # ===== ENDPOINT DE MÉTRICAS CORREGIDO =====
 @app.get("/analytics/summary")
-async def get_summary_analytics_postgresql(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_summary_analytics_postgresql(db: Session = Depends(get_database)):
     """Obtener métricas reales adaptadas específicamente para PostgreSQL"""
     try:
-        logger.info("🔍 Iniciando cálculo de métricas para PostgreSQL...")
-        
-        # Verificar que la tabla existe
-        table_check_query = text("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public'
-                AND table_name = 'client_data'
-            )
-        """)
-        table_exists = db.execute(table_check_query).scalar()
+        logger.info("🔍 Leyendo métricas precalculadas...")
         
-        if not table_exists:
-            logger.error("❌ Tabla client_data no existe")
-            return {
-                "success": False,
-                "error": "Tabla client_data no existe en la base de datos",
-                "summary": {
-                    "total_records": 0,
-                    "unique_clients": 0,
-                    "total_sales": 0.0,
-                    "average_margin_percentage": 0.0
-                }
-            }
-        
-        # Contar registros totales
-        total_records = db.execute(text("SELECT COUNT(*) FROM client_data")).scalar() or 0
+        # Resumen calculado en una sola pasada al terminar cada carga
+        summary = get_summary(db)
+        total_records = summary["total_records"]
         logger.info(f"📊 Total de registros: {total_records}")
         
         if total_records == 0:
@@ -422,97 +462,22 @@ async def get_summary_analytics_postgresql(db: Session = Depends(get_database)):
                 }
             }
         
-        # Clientes únicos - PostgreSQL compatible
-        unique_clients_query = text("""
-            SELECT COUNT(DISTINCT cliente) 
-            FROM client_data 
-            WHERE cliente IS NOT NULL 
-            AND TRIM(cliente) != ''
-        """)
-        unique_clients = db.execute(unique_clients_query).scalar() or 0
-        logger.info(f"👥 Clientes únicos: {unique_clients}")
-        
-        # Ventas totales - Conversión segura para PostgreSQL
-        total_sales_query = text("""
-            SELECT COALESCE(
-                SUM(
-                    CASE 
-                        WHEN venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN venta::numeric
-                        ELSE 0
-                    END
-                ), 0
-            )
-            FROM client_data 
-            WHERE venta IS NOT NULL
-        """)
-        total_sales = float(db.execute(total_sales_query).scalar() or 0)
-        logger.info(f"💰 Ventas totales: {total_sales}")
-        
-        # Margen bruto total - PostgreSQL compatible
-        total_margin_query = text("""
-            SELECT COALESCE(
-                SUM(
-                    CASE 
-                        WHEN mb::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN mb::numeric
-                        ELSE 0
-                    END
-                ), 0
-            )
-            FROM client_data 
-            WHERE mb IS NOT NULL
-        """)
-        total_margin = float(db.execute(total_margin_query).scalar() or 0)
-        logger.info(f"📈 Margen total: {total_margin}")
+        unique_clients = summary["unique_clients"]
+        total_sales = summary["total_sales"]
+        total_margin = summary["total_margin"]
+        unique_invoices = summary["unique_invoices"]
+        unique_products = summary["unique_products"]
+        top_clients = summary["top_clients"]
         
         # Calcular margen promedio
         average_margin_percentage = 0
         if total_sales > 0:
             average_margin_percentage = round((total_margin / total_sales) * 100, 2)
         
-        # Métricas adicionales
-        unique_invoices = db.execute(text("""
-            SELECT COUNT(DISTINCT factura) 
-            FROM client_data 
-            WHERE factura IS NOT NULL AND TRIM(factura) != ''
-        """)).scalar() or 0
-        
-        unique_products = db.execute(text("""
-            SELECT COUNT(DISTINCT articulo) 
-            FROM client_data 
-            WHERE articulo IS NOT NULL AND TRIM(articulo) != ''
-        """)).scalar() or 0
-        
         # Cálculos derivados
         average_transaction_value = round(total_sales / unique_invoices, 2) if unique_invoices > 0 else 0
         average_sales_per_client = round(total_sales / unique_clients, 2) if unique_clients > 0 else 0
         
-        # Top 3 clientes para validación
-        top_clients_query = text("""
-            SELECT 
-                cliente,
-                SUM(
-                    CASE 
-                        WHEN venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN venta::numeric
-                        ELSE 0
-                    END
-                ) as total_venta
-            FROM client_data 
-            WHERE cliente IS NOT NULL 
-            AND TRIM(cliente) != ''
-            GROUP BY cliente
-            ORDER BY total_venta DESC
-            LIMIT 3
-        """)
-        
-        top_clients_result = db.execute(top_clients_query).fetchall()
-        top_clients = [
-            {"cliente": row.cliente, "total_venta": float(row.total_venta)}
-            for row in top_clients_result
-        ]
-        
         logger.info("✅ Métricas calculadas exitosamente")
         
         return {
@@ -572,13 +537,20 @@ async def get_summary_analytics_postgresql(db: Session = Depends(get_database)):
             }
 
 @app.post("/upload-csv")
-async def upload_csv(
+@bounded_executor.offload("ingest")
+def upload_csv(
     file: UploadFile = File(...),
     replace_data: bool = True,
+    chunk_size: int = CSV_CHUNK_SIZE,
+    background: bool = False,
+    incremental: bool = False,
     db: Session = Depends(get_database)
 ):
     """
-    Endpoint mejorado para cargar CSV con TODAS las columnas
+    Endpoint mejorado para cargar CSV con TODAS las columnas.
+    Con background=true devuelve un job_id y procesa el archivo en segundo plano.
+    Con incremental=true solo inserta filas nuevas y actualiza las cambiadas
+    según la clave natural (factura, codigo, sku, fecha).
     """
     try:
         logger.info(f"Procesando archivo completo: {file.filename}")
@@ -586,180 +558,75 @@ async def upload_csv(
         if not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail="El archivo debe ser un CSV (.csv)")
         
-        # Limpiar datos anteriores si se solicita
-        if replace_data:
-            try:
-                deleted_count = db.query(ClientData).delete()
-                db.commit()
-                logger.info(f"🗑️ Datos anteriores eliminados: {deleted_count} registros")
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Error eliminando datos anteriores: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Error limpiando datos anteriores: {str(e)}")
+        if chunk_size < 1:
+            raise HTTPException(status_code=400, detail="chunk_size debe ser mayor que 0")
         
-        # Leer el archivo
-        contents = await file.read()
-        csv_string = contents.decode('utf-8')
-        csv_io = io.StringIO(csv_string)
+        # Modo asíncrono: encolar la carga y devolver el id del job
+        if background:
+            job = ingestion_jobs.submit(
+                file.file, file.filename,
+                replace_data=replace_data, chunk_size=chunk_size, incremental=incremental
+            )
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "success": True,
+                    "message": "Archivo recibido. La carga se procesa en segundo plano.",
+                    "job_id": job["job_id"],
+                    "status_url": f"/upload-csv/jobs/{job['job_id']}",
+                    "job": job
+                }
+            )
         
-        # Leer CSV
+        # Limpiar datos previos (opcional), leer, normalizar y cargar por bloques
         try:
-            df = pd.read_csv(
-                csv_io,
-                encoding='utf-8',
-                skipinitialspace=True,
-                na_values=['', 'NA', 'N/A', 'null', 'NULL', 'None', 'NONE'],
-                keep_default_na=True
+            stats = load_csv_upload(
+                db, file.file, file.filename,
+                replace_data=replace_data, chunk_size=chunk_size, incremental=incremental
             )
-            logger.info(f"CSV leído exitosamente. Filas: {len(df)}, Columnas: {len(df.columns)}")
-            logger.info(f"Columnas encontradas: {list(df.columns)}")
-        except Exception as e:
+        except pd.errors.EmptyDataError:
+            raise HTTPException(status_code=400, detail="El archivo CSV está vacío")
+        except (pd.errors.ParserError, UnicodeDecodeError) as e:
             logger.error(f"Error leyendo CSV: {str(e)}")
             raise HTTPException(status_code=400, detail=f"Error al leer el archivo CSV: {str(e)}")
-        
-        if df.empty:
-            raise HTTPException(status_code=400, detail="El archivo CSV está vacío")
-        
-        # Función para obtener valor de manera segura
-        def get_safe_value(row, column_name, convert_to=str, default=None):
-            """Obtener valor de columna de manera segura"""
-            if column_name in df.columns and not pd.isna(row[column_name]):
-                try:
-                    value = row[column_name]
-                    if convert_to == str:
-                        return str(value).strip() if str(value).strip() not in ['nan', 'None', 'null'] else default
-                    elif convert_to == float:
-                        # Limpiar valor numérico
-                        if isinstance(value, (int, float)):
-                            return float(value)
-                        else:
-                            value_str = str(value).replace(',', '').replace('$', '').replace('%', '').strip()
-                            import re
-                            value_str = re.sub(r'[^\d.-]', '', value_str)
-                            return float(value_str) if value_str else default
-                    elif convert_to == datetime:
-                        parsed_date = pd.to_datetime(value, errors='coerce')
-                        return parsed_date.to_pydatetime() if not pd.isna(parsed_date) else default
-                except Exception as e:
-                    logger.warning(f"Error convirtiendo {column_name}: {e}")
-                    return default
-            return default
-        
-        # Procesar registros
-        processed_records = []
-        errors = []
-        
-        logger.info(f"Procesando {len(df)} filas con todas las columnas...")
-        
-        for index, row in df.iterrows():
-            try:
-                # Crear registro con TODAS las columnas del CSV
-                client_record = ClientData(
-                    # Metadatos
-                    uploaded_at=datetime.utcnow(),
-                    filename=file.filename,
-                    
-                    # ===== TODAS LAS COLUMNAS DEL CSV =====
-                    fecha=get_safe_value(row, 'Fecha', str),
-                    tipo_de_venta=get_safe_value(row, 'Tipo de Venta', str),
-                    documento=get_safe_value(row, 'Documento', str),
-                    factura=get_safe_value(row, 'Factura', str),
-                    codigo=get_safe_value(row, 'Codigo', str),
-                    cliente=get_safe_value(row, 'Cliente', str),
-                    tipo_de_cliente=get_safe_value(row, 'Tipo de Cliente', str),
-                    sku=get_safe_value(row, 'SKU', str),
-                    articulo=get_safe_value(row, 'Articulo', str),
-                    proveedor=get_safe_value(row, 'Proveedor', str),
-                    almacen=get_safe_value(row, 'Almacen', str),
-                    cantidad=get_safe_value(row, 'Cantidad', float, 0.0),
-                    um=get_safe_value(row, 'U.M.', str),
-                    p_venta=get_safe_value(row, 'P. Venta', float, 0.0),
-                    c_unit=get_safe_value(row, 'C. Unit', float, 0.0),
-                    venta=get_safe_value(row, 'Venta', float, 0.0),
-                    costo=get_safe_value(row, 'Costo', float, 0.0),
-                    mb=get_safe_value(row, 'MB', float, 0.0),
-                    mb_percent=get_safe_value(row, '%MB', str),
-                    sociedad=get_safe_value(row, 'Sociedad', str),
-                    bc=get_safe_value(row, 'BC', str),
-                    bt=get_safe_value(row, 'BT', str),
-                    bu=get_safe_value(row, 'BU', str),
-                    bs=get_safe_value(row, 'BS', str),
-                    comercial=get_safe_value(row, 'Comercial', str),
-                    tipo_cliente=get_safe_value(row, 'Tipo_Cliente', str),
-                    categoria=get_safe_value(row, 'CATEGORIA', str),
-                    supercategoria=get_safe_value(row, 'SUPERCATEGORIA', str),
-                    cruce=get_safe_value(row, 'CRUCE', str),
-                    
-                    # ===== CAMPOS DE COMPATIBILIDAD =====
-                    client_name=get_safe_value(row, 'Cliente', str, "Sin nombre"),
-                    client_type=get_safe_value(row, 'Tipo de Cliente', str, "No especificado"),
-                    executive=get_safe_value(row, 'Comercial', str, "No asignado"),
-                    product=get_safe_value(row, 'Articulo', str, "No especificado"),
-                    value=get_safe_value(row, 'Venta', float, 0.0),
-                    date=get_safe_value(row, 'Fecha', datetime, datetime.utcnow()),
-                    description=f"Importado desde {file.filename} - Fila {index + 1}"
-                )
-                
-                processed_records.append(client_record)
-                
-                if (index + 1) % 1000 == 0:
-                    logger.info(f"Procesadas {index + 1} filas...")
-                    
-            except Exception as e:
-                logger.error(f"Error procesando fila {index + 1}: {str(e)}")
-                errors.append(f"Fila {index + 1}: Error procesando datos - {str(e)}")
-                continue
-        
-        if not processed_records:
-            error_message = f"No se pudieron procesar registros. Errores: {'; '.join(errors[:5])}"
-            logger.error(error_message)
-            raise HTTPException(status_code=400, detail=error_message)
-        
-        logger.info(f"Registros procesados exitosamente: {len(processed_records)}")
-        
-        # Guardar en lotes
-        saved_count = 0
-        try:
-            batch_size = 1000
-            total_batches = (len(processed_records) + batch_size - 1) // batch_size
-            
-            for i in range(0, len(processed_records), batch_size):
-                batch = processed_records[i:i + batch_size]
-                db.add_all(batch)
-                db.commit()
-                saved_count += len(batch)
-                logger.info(f"Lote {(i // batch_size) + 1}/{total_batches} guardado: {len(batch)} registros")
-            
-            logger.info(f"✅ {saved_count} registros guardados exitosamente con todas las columnas")
-            
         except Exception as e:
-            db.rollback()
             error_msg = f"Error guardando en base de datos: {str(e)}"
             logger.error(error_msg)
             logger.error(traceback.format_exc())
             raise HTTPException(status_code=500, detail=error_msg)
         
+        saved_count = stats["saved_rows"]
+        
         # Preparar respuesta detallada
         response_data = {
             "success": True,
             "message": f"Archivo procesado exitosamente con todas las columnas. {saved_count} registros guardados.",
             "details": {
                 "filename": file.filename,
-                "total_rows": len(df),
-                "processed_rows": len(processed_records),
+                "total_rows": stats["total_rows"],
+                "processed_rows": saved_count,
                 "saved_rows": saved_count,
-                "errors_count": len(errors),
+                "errors_count": 0,
                 "all_columns_mapped": True,
-                "columns_found": list(df.columns),
-                "columns_count": len(df.columns),
-                "storage_method": "Todas las columnas en campos individuales"
+                "columns_found": stats["columns_found"],
+                "columns_count": len(stats["columns_found"]),
+                "storage_method": "Todas las columnas en campos individuales",
+                "load_method": stats["load_method"],
+                "load_seconds": stats["load_seconds"],
+                "rows_per_second": stats["rows_per_second"],
+                "chunks": stats["chunks"],
+                "chunk_size": chunk_size,
+                "replace_method": stats["replace_method"],
+                "validation": stats["validation"]
             }
         }
         
-        if errors:
-            response_data["errors"] = errors[:10]
-            if len(errors) > 10:
-                response_data["errors"].append(f"... y {len(errors) - 10} errores más")
+        if incremental:
+            response_data["details"].update({
+                "inserted_rows": stats["inserted_rows"],
+                "updated_rows": stats["updated_rows"],
+                "skipped_rows": stats["skipped_rows"]
+            })
         
         logger.info(f"Respuesta enviada: {response_data['message']}")
         return JSONResponse(content=response_data)
@@ -772,103 +639,70 @@ async def upload_csv(
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=error_msg)
 
+@app.get("/upload-csv/jobs")
+async def list_upload_jobs():
+    """Listar las cargas de CSV en segundo plano"""
+    jobs = ingestion_jobs.list_jobs()
+    return {
+        "success": True,
+        "total": len(jobs),
+        "jobs": jobs
+    }
+
+@app.get("/upload-csv/jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """Progreso de una carga de CSV en segundo plano"""
+    job = ingestion_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job de carga no encontrado")
+    return {
+        "success": job["status"] != "failed",
+        "job": job
+    }
+
 @app.get("/client-data")
-async def get_client_data(
+@bounded_executor.offload("db")
+def get_client_data(
     limit: int = 100,
     offset: int = 0,
     include_all_fields: bool = False,
+    cursor: Optional[str] = None,
+    count_mode: str = "exact",
+    fields: Optional[str] = None,
     db: Session = Depends(get_database)
 ):
-    """Obtener datos de clientes con opción de incluir todos los campos"""
+    """
+    Obtener datos de clientes con opción de incluir todos los campos.
+
+    Paginación por cursor: pasar el next_cursor de la respuesta anterior en
+    cursor (offset se ignora). count_mode: exact, estimated o none.
+    fields: columnas a devolver separadas por comas (id siempre se incluye);
+    solo esas columnas se leen de la base de datos.
+    """
     try:
-        total_count = db.query(ClientData).count()
-        clients = db.query(ClientData).offset(offset).limit(limit).all()
-        
-        logger.info(f"Consultando datos: {len(clients)} registros (de {total_count} totales)")
-        
-        if include_all_fields:
-            # Devolver TODOS los campos
-            client_data = []
-            for client in clients:
-                client_dict = {
-                    "id": client.id,
-                    "uploaded_at": client.uploaded_at.isoformat() if client.uploaded_at else None,
-                    "filename": client.filename,
-                    
-                    # Campos del CSV
-                    "fecha": client.fecha,
-                    "tipo_de_venta": client.tipo_de_venta,
-                    "documento": client.documento,
-                    "factura": client.factura,
-                    "codigo": client.codigo,
-                    "cliente": client.cliente,
-                    "tipo_de_cliente": client.tipo_de_cliente,
-                    "sku": client.sku,
-                    "articulo": client.articulo,
-                    "proveedor": client.proveedor,
-                    "almacen": client.almacen,
-                    "cantidad": float(client.cantidad) if client.cantidad else None,
-                    "um": client.um,
-                    "p_venta": float(client.p_venta) if client.p_venta else None,
-                    "c_unit": float(client.c_unit) if client.c_unit else None,
-                    "venta": float(client.venta) if client.venta else None,
-                    "costo": float(client.costo) if client.costo else None,
-                    "mb": float(client.mb) if client.mb else None,
-                    "mb_percent": client.mb_percent,
-                    "sociedad": client.sociedad,
-                    "bc": client.bc,
-                    "bt": client.bt,
-                    "bu": client.bu,
-                    "bs": client.bs,
-                    "comercial": client.comercial,
-                    "tipo_cliente": client.tipo_cliente,
-                    "categoria": client.categoria,
-                    "supercategoria": client.supercategoria,
-                    "cruce": client.cruce,
-                    
-                    # Campos de compatibilidad
-                    "client_name": client.client_name,
-                    "client_type": client.client_type,
-                    "executive": client.executive,
-                    "product": client.product,
-                    "value": client.value,
-                    "date": client.date.isoformat() if client.date else None,
-                    "description": client.description
-                }
-                client_data.append(client_dict)
-        else:
-            # Devolver solo campos básicos para compatibilidad
-            client_data = [
-                {
-                    "id": client.id,
-                    "client_name": client.client_name,
-                    "client_type": client.client_type,
-                    "executive": client.executive,
-                    "product": client.product,
-                    "value": client.value,
-                    "date": client.date.isoformat() if client.date else None,
-                    "description": client.description,
-                    
-                    # Campos principales del CSV
-                    "cliente": client.cliente,
-                    "factura": client.factura,
-                    "venta": float(client.venta) if client.venta else None,
-                    "fecha": client.fecha,
-                    "comercial": client.comercial,
-                    "categoria": client.categoria
-                }
-                for client in clients
-            ]
+        total_count = count_client_data(db, count_mode)
+        selected_fields = resolve_fields(fields, include_all_fields)
+        client_data = fetch_client_data(
+            db, selected_fields, limit, offset,
+            after_id=decode_cursor(cursor) if cursor else None
+        )
+        
+        logger.info(f"Consultando datos: {len(client_data)} registros (de {total_count} totales)")
         
         return {
             "success": True,
             "total_count": total_count,
-            "count": len(clients),
+            "count": len(client_data),
             "offset": offset,
             "limit": limit,
+            "count_mode": count_mode,
+            "next_cursor": next_cursor(client_data, limit),
             "include_all_fields": include_all_fields,
+            "fields": selected_fields,
             "data": client_data
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error consultando datos: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -877,13 +711,18 @@ async def get_client_data(
 async def get_client_data_full(
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    count_mode: str = "exact",
+    fields: Optional[str] = None,
     db: Session = Depends(get_database)
 ):
-    """Obtener datos completos con todas las columnas del CSV"""
-    return await get_client_data(limit, offset, include_all_fields=True, db=db)
+    """Obtener datos completos con todas las columnas del CSV (o solo las de fields)"""
+    return await get_client_data(limit, offset, include_all_fields=True, cursor=cursor,
+                                 count_mode=count_mode, fields=fields, db=db)
 
 @app.get("/client-data/search")
-async def search_client_data(
+@bounded_executor.offload("db")
+def search_client_data(
     cliente: str = None,
     factura: str = None,
     fecha_desde: str = None,
@@ -893,41 +732,34 @@ async def search_client_data(
     proveedor: str = None,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_database)
 ):
-    """Buscar datos con filtros específicos"""
+    """Buscar datos con filtros específicos (paginación por offset o por cursor)"""
     try:
-        query = db.query(ClientData)
-        
-        # Aplicar filtros
-        if cliente:
-            query = query.filter(ClientData.cliente.ilike(f'%{cliente}%'))
-        
-        if factura:
-            query = query.filter(ClientData.factura.ilike(f'%{factura}%'))
-        
-        if fecha_desde:
-            query = query.filter(ClientData.fecha >= fecha_desde)
-        
-        if fecha_hasta:
-            query = query.filter(ClientData.fecha <= fecha_hasta)
-        
-        if comercial:
-            query = query.filter(ClientData.comercial.ilike(f'%{comercial}%'))
-        
-        if categoria:
-            query = query.filter(ClientData.categoria.ilike(f'%{categoria}%'))
-        
-        if proveedor:
-            query = query.filter(ClientData.proveedor.ilike(f'%{proveedor}%'))
-        
-        total_count = query.count()
-        records = query.offset(offset).limit(limit).all()
+        # Filtros de subcadena: índices pg_trgm en PostgreSQL, índice n-grama en memoria en SQLite
+        total_count, total_capped, records = search_engine.search(
+            db,
+            {
+                "cliente": cliente,
+                "factura": factura,
+                "comercial": comercial,
+                "categoria": categoria,
+                "proveedor": proveedor
+            },
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            limit=limit,
+            offset=offset,
+            after_id=decode_cursor(cursor) if cursor else None
+        )
         
         return {
             "success": True,
             "total_count": total_count,
+            "total_count_capped": total_capped,
             "count": len(records),
+            "next_cursor": next_cursor(records, limit),
             "filters_applied": {
                 "cliente": cliente,
                 "factura": factura,
@@ -955,16 +787,61 @@ async def search_client_data(
             ]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en búsqueda: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/client-data/export")
+@bounded_executor.offload("db")
+def export_client_data(
+    format: str = "csv",
+    fields: Optional[str] = None,
+    cliente: str = None,
+    factura: str = None,
+    fecha_desde: str = None,
+    fecha_hasta: str = None,
+    comercial: str = None,
+    categoria: str = None,
+    proveedor: str = None
+):
+    """
+    Exportar client_data completo en streaming (csv, ndjson o parquet).
+
+    Acepta los filtros de /client-data/search y la selección de columnas de
+    /client-data (fields=). Las filas se leen con un cursor del lado del
+    servidor y se envían por lotes, sin cargar la tabla en memoria.
+    """
+    chunks, media_type, filename = build_export(
+        format,
+        fields=fields,
+        filters={
+            "cliente": cliente,
+            "factura": factura,
+            "comercial": comercial,
+            "categoria": categoria,
+            "proveedor": proveedor
+        },
+        fecha_desde=fecha_desde,
+        fecha_hasta=fecha_hasta
+    )
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @app.delete("/client-data/clear")
-async def clear_client_data(db: Session = Depends(get_database)):
+@bounded_executor.offload("db")
+def clear_client_data(db: Session = Depends(get_database)):
     """Limpiar todos los datos de clientes"""
     try:
         deleted_count = db.query(ClientData).delete()
+        refresh_aggregates(db)
         db.commit()
+        analytics_cache.bump_version()
+        run_post_ingest_hooks(db)
         logger.info(f"Se eliminaron {deleted_count} registros")
         return {
             "success": True,
@@ -975,8 +852,19 @@ async def clear_client_data(db: Session = Depends(get_database)):
         logger.error(f"Error eliminando datos: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/debug/analytics-cache")
+async def debug_analytics_cache():
+    """Contadores de la caché de resultados de analítica"""
+    return {"success": True, "cache": analytics_cache.stats()}
+
+@app.get("/debug/executors")
+async def debug_executors():
+    """Hilos ocupados, profundidad de cola y tiempos de espera por categoría"""
+    return {"success": True, "executors": bounded_executor.stats()}
+
 @app.get("/debug/count")
-async def debug_count(db: Session = Depends(get_database)):
+@bounded_executor.offload("db")
+def debug_count(db: Session = Depends(get_database)):
     """Endpoint de debug para verificar el conteo de registros"""
     try:
         count = db.query(ClientData).count()
@@ -1031,36 +919,21 @@ async def debug_columns():
     }
 
 @app.post("/preview-csv")
-async def preview_csv(file: UploadFile = File(...)):
+@bounded_executor.offload("ingest")
+def preview_csv(file: UploadFile = File(...)):
     """Previsualizar un CSV sin guardarlo"""
     try:
         if not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail="El archivo debe ser un CSV (.csv)")
         
-        contents = await file.read()
-        csv_string = contents.decode('utf-8')
-        csv_io = io.StringIO(csv_string)
-        
-        # Leer solo las primeras 10 filas
-        df = pd.read_csv(
-            csv_io,
-            encoding='utf-8',
-            skipinitialspace=True,
-            na_values=['', 'NA', 'N/A', 'null', 'NULL', 'None', 'NONE'],
-            keep_default_na=True,
-            nrows=10
-        )
+        # Leer solo las primeras 10 filas directamente del archivo temporal
+        file.file.seek(0)
+        df = pd.read_csv(file.file, nrows=10, **CSV_READ_OPTIONS)
         
         original_columns = list(df.columns)
         
         # Verificar mapeo de columnas
-        expected_columns = [
-            "Fecha", "Tipo de Venta", "Documento", "Factura", "Codigo", "Cliente", 
-            "Tipo de Cliente", "SKU", "Articulo", "Proveedor", "Almacen", "Cantidad", 
-            "U.M.", "P. Venta", "C. Unit", "Venta", "Costo", "MB", "%MB", 
-            "Sociedad", "BC", "BT", "BU", "BS", "Comercial", "Tipo_Cliente", 
-            "CATEGORIA", "SUPERCATEGORIA", "CRUCE"
-        ]
+        expected_columns = EXPECTED_CSV_COLUMNS
         
         matched_columns = [col for col in expected_columns if col in original_columns]
         missing_columns = [col for col in expected_columns if col not in original_columns]
@@ -1119,6 +992,27 @@ async def get_ml_status():
             "message": f"Error: {str(e)}"
         }
 
+@app.get("/ml/models")
+async def list_ml_models():
+    """Versiones de modelo en ml_models/ con estado, tiempo de carga y memoria"""
+    if not hasattr(ml_service, "list_models"):
+        return {"success": False, "message": "Registro de modelos no disponible", "models": []}
+    
+    models = ml_service.list_models()
+    return {
+        "success": True,
+        "active_version": next((m["version"] for m in models if m["active"]), None),
+        "demo_mode": ml_service.demo_mode,
+        "models": models
+    }
+
+@app.post("/ml/models/reload")
+async def reload_ml_model(version: Optional[str] = None):
+    """Cargar una versión (por defecto la más reciente) en segundo plano y activarla al terminar"""
+    if not hasattr(ml_service, "reload"):
+        return {"success": False, "message": "Registro de modelos no disponible"}
+    return ml_service.reload(version)
+
 @app.get("/ml/model-performance")
 async def get_model_performance_real():
     """Obtener métricas de rendimiento del modelo (reales o de metadatos)"""
@@ -1238,9 +1132,11 @@ async def get_model_performance_real():
         }
 
 @app.get("/ml/cross-sell-recommendations")
-async def get_cross_sell_recommendations_postgresql(
+@bounded_executor.offload("ml")
+def get_cross_sell_recommendations_postgresql(
     limit: int = 50,
     min_probability: float = 0.3,
+    comercial: Optional[str] = None,
     db: Session = Depends(get_database)
 ):
     """Obtener recomendaciones de venta cruzada - PostgreSQL compatible"""
@@ -1295,40 +1191,51 @@ async def get_cross_sell_recommendations_postgresql(
                 "recommendations": example_recommendations[:limit]
             }
         
+        # Puntajes precalculados tras la última carga (rango indexado por probabilidad)
+        scores = get_cross_sell_scores(db, current_model_version(ml_service), limit, min_probability, comercial)
+        if scores is not None:
+            final_recommendations = scores["recommendations"]
+            return {
+                "success": True,
+                "message": f"Se encontraron {len(final_recommendations)} recomendaciones de alta calidad",
+                "total_evaluated": scores["total_evaluated"],
+                "total_positive": scores["total_positive"],
+                "high_quality_recommendations": len(final_recommendations),
+                "min_probability_filter": min_probability,
+                "filter_comercial": comercial,
+                "dataset_version": scores["dataset_version"],
+                "scored_at": scores["scored_at"],
+                "demo_mode": ml_service.demo_mode,
+                "data_source": "cross_sell_scores",
+                "recommendations": final_recommendations
+            }
+        
         # Si ML está disponible, usar consulta corregida para PostgreSQL
-        active_clients_query = text("""
+        comercial_filter = ""
+        query_params = {"limit_param": limit * 2}
+        if comercial and comercial.strip():
+            comercial_filter = "AND comercial = :comercial"
+            query_params["comercial"] = comercial.strip()
+        
+        active_clients_query = text(f"""
             SELECT 
                 id, cliente, 
-                CASE 
-                    WHEN venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                    THEN venta::numeric
-                    ELSE 0
-                END as venta,
-                CASE 
-                    WHEN costo::text ~ '^[0-9]+\.?[0-9]*$' 
-                    THEN costo::numeric
-                    ELSE 0
-                END as costo,
-                CASE 
-                    WHEN mb::text ~ '^[0-9]+\.?[0-9]*$' 
-                    THEN mb::numeric
-                    ELSE 0
-                END as mb,
-                CASE 
-                    WHEN cantidad::text ~ '^[0-9]+\.?[0-9]*$' 
-                    THEN cantidad::numeric
-                    ELSE 0
-                END as cantidad,
-                tipo_de_cliente, categoria, comercial, proveedor, fecha
+                COALESCE(venta, 0) as venta,
+                COALESCE(costo, 0) as costo,
+                COALESCE(mb, 0) as mb,
+                COALESCE(cantidad, 0) as cantidad,
+                p_venta, c_unit, sku, codigo,
+                tipo_de_cliente, tipo_cliente, categoria, supercategoria, comercial, proveedor, fecha
             FROM client_data 
             WHERE cliente IS NOT NULL 
             AND TRIM(cliente) != ''
             AND venta IS NOT NULL
+            {comercial_filter}
             ORDER BY venta DESC
             LIMIT :limit_param
         """)
         
-        result = db.execute(active_clients_query, {"limit_param": limit * 2}).fetchall()
+        result = db.execute(active_clients_query, query_params).fetchall()
         
         if not result:
             return {
@@ -1347,8 +1254,14 @@ async def get_cross_sell_recommendations_postgresql(
                 "costo": float(row.costo or 0),
                 "mb": float(row.mb or 0),
                 "cantidad": float(row.cantidad or 0),
+                "p_venta": float(row.p_venta or 0),
+                "c_unit": float(row.c_unit or 0),
+                "sku": row.sku,
+                "codigo": row.codigo,
                 "tipo_de_cliente": row.tipo_de_cliente or "Unknown",
+                "tipo_cliente": row.tipo_cliente,
                 "categoria": row.categoria or "Unknown",
+                "supercategoria": row.supercategoria,
                 "comercial": row.comercial or "Unknown",
                 "proveedor": row.proveedor or "Unknown",
                 "fecha": row.fecha
@@ -1364,11 +1277,8 @@ async def get_cross_sell_recommendations_postgresql(
             if pred['prediction'] == 1 and pred['probability'] >= min_probability
         ]
         
-        # Ordenar por probabilidad descendente
-        filtered_recommendations.sort(key=lambda x: x['probability'], reverse=True)
-        
-        # Limitar resultados
-        final_recommendations = filtered_recommendations[:limit]
+        # Top-k por probabilidad descendente sin ordenar la lista completa
+        final_recommendations = heapq.nlargest(limit, filtered_recommendations, key=lambda x: x['probability'])
         
         logger.info(f"✅ {len(final_recommendations)} recomendaciones generadas")
         
@@ -1376,7 +1286,7 @@ async def get_cross_sell_recommendations_postgresql(
             "success": True,
             "message": f"Se encontraron {len(final_recommendations)} recomendaciones de alta calidad",
             "total_evaluated": len(client_data),
-            "total_positive": len([p for p in all_predictions if p['prediction'] == 1]),
+            "total_positive": sum(1 for p in all_predictions if p['prediction'] == 1),
             "high_quality_recommendations": len(final_recommendations),
             "min_probability_filter": min_probability,
             "demo_mode": ml_service.demo_mode,
@@ -1396,7 +1306,8 @@ async def get_cross_sell_recommendations_postgresql(
 
 
 @app.post("/ml/predict-cross-sell")
-async def predict_cross_sell_batch(
+@bounded_executor.offload("ml")
+def predict_cross_sell_batch(
     request: PredictionRequest,
     db: Session = Depends(get_database)
 ):
@@ -1438,8 +1349,14 @@ async def predict_cross_sell_batch(
                 "costo": float(client.costo or 0),
                 "mb": float(client.mb or 0),
                 "cantidad": float(client.cantidad or 0),
+                "p_venta": float(client.p_venta or 0),
+                "c_unit": float(client.c_unit or 0),
+                "sku": client.sku,
+                "codigo": client.codigo,
                 "tipo_de_cliente": client.tipo_de_cliente or "Unknown",
+                "tipo_cliente": client.tipo_cliente,
                 "categoria": client.categoria or "Unknown",
+                "supercategoria": client.supercategoria,
                 "comercial": client.comercial or "Unknown",
                 "proveedor": client.proveedor or "Unknown"
             }
@@ -1477,7 +1394,9 @@ async def predict_cross_sell_batch(
 # ===== ENDPOINTS DE ANALYTICS ADICIONALES =====
 
 @app.get("/clients/analytics/segmentation-stacked")
-async def get_client_segmentation_stacked(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_client_segmentation_stacked(db: Session = Depends(get_database)):
     """
     Gráfico de barras apiladas: Segmentación de clientes por tipo y supercategoría
     Variables: Tipo de Cliente, CATEGORIA, Cantidad
@@ -1489,7 +1408,7 @@ async def get_client_segmentation_stacked(db: Session = Depends(get_database)):
                 COALESCE(categoria, 'Sin categoría') as categoria,
                 COALESCE(tipo_de_cliente, 'Sin tipo') as tipo_cliente,
                 COUNT(DISTINCT cliente) as cantidad_clientes,
-                ROUND(CAST(SUM(COALESCE(venta, 0)) AS NUMERIC), 2) as total_ventas
+                ROUND(COALESCE(SUM(venta), 0), 2) as total_ventas
             FROM client_data 
             WHERE cliente IS NOT NULL AND cliente != ''
             GROUP BY categoria, tipo_de_cliente
@@ -1521,43 +1440,41 @@ async def get_client_segmentation_stacked(db: Session = Depends(get_database)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/clients/analytics/frequency-scatter")
-async def get_client_frequency_scatter(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_client_frequency_scatter(
+    layout: Literal["rows", "columnar"] = "rows",
+    db: Session = Depends(get_database)
+):
     """
     Gráfico de dispersión: Relación entre la frecuencia de compra y el tipo de cliente
     Variables: Cliente, Fecha, Cantidad, Tipo de Cliente
+    layout=columnar devuelve un arreglo de valores por columna
     """
     try:
-        # Consulta para calcular frecuencia de compra por cliente (PostgreSQL)
+        # Frecuencia de compra por cliente desde los agregados (client_rollup)
         query = text("""
             SELECT 
                 cliente,
                 COALESCE(tipo_de_cliente, 'Sin tipo') as tipo_cliente,
-                COUNT(DISTINCT factura) as numero_facturas,
-                COUNT(DISTINCT fecha) as dias_unicos_compra,
-                SUM(COALESCE(cantidad, 0)) as cantidad_total,
-                SUM(COALESCE(venta, 0)) as total_ventas,
-                MIN(fecha) as primera_compra,
-                MAX(fecha) as ultima_compra,
-                CASE 
-                    WHEN COUNT(DISTINCT fecha) > 1 THEN
-                        CAST(COUNT(DISTINCT factura) AS FLOAT) / 
-                        GREATEST(1, COUNT(DISTINCT fecha) / 30.0)
-                    ELSE 0
-                END as frecuencia_compra
-            FROM client_data 
-            WHERE cliente IS NOT NULL AND cliente != '' 
-                AND fecha IS NOT NULL
-            GROUP BY cliente, tipo_de_cliente
-            HAVING COUNT(DISTINCT factura) >= 1
+                num_facturas as numero_facturas,
+                dias_activos as dias_unicos_compra,
+                cantidad_total,
+                total_ventas,
+                primera_compra,
+                ultima_compra,
+                frecuencia_compra
+            FROM client_rollup 
+            WHERE dias_activos > 0
+            AND num_facturas >= 1
             ORDER BY frecuencia_compra DESC, total_ventas DESC
             LIMIT 100
         """)
         
         result = db.execute(query).fetchall()
         
-        data = []
-        for row in result:
-            data.append({
+        data = [
+            {
                 "cliente": row.cliente,
                 "tipo_cliente": row.tipo_cliente,
                 "numero_facturas": row.numero_facturas,
@@ -1565,14 +1482,16 @@ async def get_client_frequency_scatter(db: Session = Depends(get_database)):
                 "cantidad_total": float(row.cantidad_total),
                 "total_ventas": float(row.total_ventas),
                 "frecuencia_compra": float(row.frecuencia_compra)
-            })
+            }
+            for row in result
+        ]
         
-        return {
+        return apply_layout({
             "success": True,
             "data": data,
             "chart_type": "scatter",
             "description": "Relación entre frecuencia de compra y tipo de cliente"
-        }
+        }, layout)
         
     except Exception as e:
         logger.error(f"Error en frecuencia scatter: {str(e)}")
@@ -1583,7 +1502,9 @@ async def get_client_frequency_scatter(db: Session = Depends(get_database)):
 
 
 @app.get("/clients/analytics/top-profitable-detailed")
-async def get_top_profitable_detailed_using_tipo_cliente(
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_top_profitable_detailed_using_tipo_cliente(
     limit: int = 10,
     db: Session = Depends(get_database)
 ):
@@ -1591,85 +1512,33 @@ async def get_top_profitable_detailed_using_tipo_cliente(
     try:
         logger.info(f"💰 Calculando top {limit} clientes con tipo_cliente (categorías)...")
         
-        # Query usando la columna tipo_cliente que contiene las categorías reales
+        # Query usando la columna tipo_cliente (categorías reales) sobre client_category_rollup
         query = text("""
             SELECT 
                 cliente,
                 COALESCE(tipo_cliente, 'Sin categoría') as tipo_cliente,
-                COUNT(*) as num_transacciones,
-                COUNT(DISTINCT factura) as num_facturas,
+                num_transacciones,
+                num_facturas,
                 
-                -- Total de ventas por cliente
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN venta::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as total_ventas,
-                
-                -- Total margen bruto por cliente
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN mb IS NOT NULL AND mb::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN mb::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as total_mb,
+                -- Totales por cliente
+                ROUND(total_ventas, 2) as total_ventas,
+                ROUND(total_mb, 2) as total_mb,
                 
                 -- Venta promedio por transacción
-                ROUND(CAST(AVG(
-                    CASE 
-                        WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN venta::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as venta_promedio_transaccion,
+                ROUND(total_ventas / num_transacciones, 2) as venta_promedio_transaccion,
                 
                 -- Rentabilidad porcentual
                 CASE 
-                    WHEN SUM(
-                        CASE 
-                            WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                            THEN venta::numeric
-                            ELSE 0
-                        END
-                    ) > 0 THEN
-                        ROUND(
-                            CAST(
-                                SUM(
-                                    CASE 
-                                        WHEN mb IS NOT NULL AND mb::text ~ '^[0-9]+\.?[0-9]*$' 
-                                        THEN mb::numeric
-                                        ELSE 0
-                                    END
-                                ) * 100.0 / SUM(
-                                    CASE 
-                                        WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                                        THEN venta::numeric
-                                        ELSE 0
-                                    END
-                                ) AS NUMERIC
-                            ), 1
-                        )
+                    WHEN total_ventas > 0 THEN
+                        ROUND(CAST(total_mb * 100.0 / total_ventas AS NUMERIC), 1)
                     ELSE 0
                 END as rentabilidad_porcentaje,
                 
-                MIN(fecha) as primera_compra,
-                MAX(fecha) as ultima_compra
+                primera_compra,
+                ultima_compra
                 
-            FROM client_data 
-            WHERE cliente IS NOT NULL 
-            AND TRIM(cliente) != ''
-            AND venta IS NOT NULL
-            GROUP BY cliente, tipo_cliente
-            HAVING SUM(
-                CASE 
-                    WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                    THEN venta::numeric
-                    ELSE 0
-                END
-            ) > 0
+            FROM client_category_rollup 
+            WHERE total_ventas > 0
             ORDER BY total_ventas DESC
             LIMIT :limit_param
         """)
@@ -1785,50 +1654,39 @@ async def get_top_profitable_detailed_using_tipo_cliente(
 
 
 @app.get("/clients/analytics/client-type-analysis")
-async def get_client_type_analysis_postgresql(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_client_type_analysis_postgresql(db: Session = Depends(get_database)):
     """Análisis de ventas por tipo de cliente - PostgreSQL compatible"""
     try:
         logger.info("🔍 Analizando tipos de cliente...")
         
-        # Verificar que hay datos
-        total_records = db.execute(text("SELECT COUNT(*) FROM client_data")).scalar()
-        if total_records == 0:
-            return {
-                "success": False,
-                "message": "No hay datos en la tabla client_data",
-                "data": []
-            }
-        
         # Query corregida para PostgreSQL
         query = text("""
             SELECT 
                 COALESCE(tipo_de_cliente, 'Sin tipo') as tipo_cliente,
                 COUNT(DISTINCT cliente) as num_clientes,
                 COUNT(*) as num_transacciones,
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN venta::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as total_ventas
+                ROUND(COALESCE(SUM(venta), 0), 2) as total_ventas
             FROM client_data 
             WHERE cliente IS NOT NULL 
             AND TRIM(cliente) != ''
             GROUP BY tipo_de_cliente
-            HAVING SUM(
-                CASE 
-                    WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                    THEN venta::numeric
-                    ELSE 0
-                END
-            ) > 0
+            HAVING COALESCE(SUM(venta), 0) > 0
             ORDER BY total_ventas DESC
             LIMIT 10
         """)
         
+        # Una sola consulta (sin COUNT(*) aparte): sin grupos no hay datos
         result = db.execute(query).fetchall()
         
+        if not result:
+            return {
+                "success": False,
+                "message": "No hay datos en la tabla client_data",
+                "data": []
+            }
+        
         data = []
         for row in result:
             data.append({
@@ -1856,7 +1714,9 @@ async def get_client_type_analysis_postgresql(db: Session = Depends(get_database
         }
 
 @app.get("/clients/analytics/most-profitable")
-async def get_most_profitable_clients_postgresql(
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_most_profitable_clients_postgresql(
     limit: int = 15,
     db: Session = Depends(get_database)
 ):
@@ -1864,65 +1724,21 @@ async def get_most_profitable_clients_postgresql(
     try:
         logger.info("💰 Analizando clientes más rentables...")
         
-        # Query corregida para PostgreSQL
+        # Ranking desde los agregados por cliente (client_rollup)
         query = text("""
             SELECT 
                 cliente,
                 COALESCE(tipo_de_cliente, 'Sin tipo') as tipo_cliente,
-                COUNT(*) as num_transacciones,
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN venta::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as total_ventas,
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN mb IS NOT NULL AND mb::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN mb::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as total_mb,
+                num_transacciones,
+                ROUND(total_ventas, 2) as total_ventas,
+                ROUND(total_mb, 2) as total_mb,
                 CASE 
-                    WHEN SUM(
-                        CASE 
-                            WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                            THEN venta::numeric
-                            ELSE 0
-                        END
-                    ) > 0 THEN
-                        ROUND(
-                            CAST(
-                                SUM(
-                                    CASE 
-                                        WHEN mb IS NOT NULL AND mb::text ~ '^[0-9]+\.?[0-9]*$' 
-                                        THEN mb::numeric
-                                        ELSE 0
-                                    END
-                                ) * 100.0 / SUM(
-                                    CASE 
-                                        WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                                        THEN venta::numeric
-                                        ELSE 0
-                                    END
-                                ) AS NUMERIC
-                            ), 2
-                        )
+                    WHEN total_ventas > 0 THEN
+                        ROUND(CAST(total_mb * 100.0 / total_ventas AS NUMERIC), 2)
                     ELSE 0
                 END as rentabilidad_porcentaje
-            FROM client_data 
-            WHERE cliente IS NOT NULL 
-            AND TRIM(cliente) != ''
-            AND venta IS NOT NULL
-            GROUP BY cliente, tipo_de_cliente
-            HAVING SUM(
-                CASE 
-                    WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                    THEN venta::numeric
-                    ELSE 0
-                END
-            ) > 0
+            FROM client_rollup 
+            WHERE total_ventas > 0
             ORDER BY total_ventas DESC
             LIMIT :limit_param
         """)
@@ -1962,103 +1778,52 @@ async def get_most_profitable_clients_postgresql(
 # REEMPLAZAR el endpoint get_acquisition_trend_real_data_only en main.py con esta versión corregida
 
 @app.get("/clients/analytics/acquisition-trend")
-async def get_acquisition_trend_fixed_final(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_acquisition_trend_fixed_final(db: Session = Depends(get_database)):
     """Tendencia de adquisición de clientes - VERSIÓN FINAL CORREGIDA"""
     try:
         logger.info("📈 Iniciando análisis de tendencia de adquisición CORREGIDO...")
         
-        # Verificar que hay datos en la tabla
-        total_records = db.execute(text("SELECT COUNT(*) FROM client_data")).scalar()
-        if total_records == 0:
-            return {
-                "success": False,
-                "message": "No hay datos cargados. Por favor, sube un archivo CSV primero.",
-                "data": [],
-                "error_type": "NO_DATA"
-            }
-        
-        logger.info(f"📊 Total de registros encontrados: {total_records}")
-        
-        # Query SIMPLIFICADA y ROBUSTA para PostgreSQL
+        # Primera compra por cliente sobre la columna tipada year_month ('YYYY-MM'),
+        # que ordena cronológicamente y usa el índice idx_client_data_year_month
         query = text("""
-            WITH client_first_purchase AS (
+            WITH first_purchases AS (
                 SELECT 
                     cliente,
-                    fecha,
-                    ROW_NUMBER() OVER (PARTITION BY cliente ORDER BY fecha ASC) as rn
+                    MIN(year_month) as mes_ano,
+                    COUNT(*) as registros
                 FROM client_data 
                 WHERE cliente IS NOT NULL 
                 AND TRIM(cliente) != ''
-                AND fecha IS NOT NULL 
-                AND fecha != ''
-                AND LENGTH(TRIM(fecha)) >= 7
-            ),
-            first_purchases_only AS (
-                SELECT 
-                    cliente,
-                    fecha as primera_compra
-                FROM client_first_purchase
-                WHERE rn = 1
-            ),
-            monthly_grouping AS (
-                SELECT 
-                    cliente,
-                    primera_compra,
-                    CASE 
-                        -- Formato YYYY-MM-DD (ISO)
-                        WHEN primera_compra ~ '^[0-9]{4}-[0-9]{1,2}-[0-9]{1,2}' THEN
-                            LEFT(primera_compra, 7)
-                        -- Formato DD/MM/YYYY
-                        WHEN primera_compra ~ '^[0-9]{1,2}/[0-9]{1,2}/[0-9]{4}' THEN
-                            RIGHT(primera_compra, 4) || '-' || 
-                            LPAD(SPLIT_PART(primera_compra, '/', 2), 2, '0')
-                        -- Formato MM/DD/YYYY (estilo americano)
-                        WHEN primera_compra ~ '^[0-9]{1,2}/[0-9]{1,2}/[0-9]{4}' AND 
-                             CAST(SPLIT_PART(primera_compra, '/', 1) AS INTEGER) > 12 THEN
-                            RIGHT(primera_compra, 4) || '-' || 
-                            LPAD(SPLIT_PART(primera_compra, '/', 1), 2, '0')
-                        -- Cualquier otro formato que contenga año de 4 dígitos
-                        WHEN primera_compra ~ '[0-9]{4}' THEN
-                            SUBSTRING(primera_compra FROM '[0-9]{4}') || '-01'
-                        -- Fallback
-                        ELSE '2024-01'
-                    END as mes_ano
-                FROM first_purchases_only
-            ),
-            monthly_summary AS (
-                SELECT 
-                    mes_ano,
-                    COUNT(DISTINCT cliente) as nuevos_clientes
-                FROM monthly_grouping
-                WHERE mes_ano IS NOT NULL 
-                AND mes_ano != ''
-                AND LENGTH(mes_ano) = 7
-                AND mes_ano ~ '^[0-9]{4}-[0-9]{2}$'
-                GROUP BY mes_ano
+                AND year_month IS NOT NULL
+                GROUP BY cliente
             )
             SELECT 
                 mes_ano as mes,
-                nuevos_clientes
-            FROM monthly_summary
-            WHERE nuevos_clientes > 0
+                COUNT(*) as nuevos_clientes,
+                SUM(SUM(registros)) OVER () as total_registros
+            FROM first_purchases
+            GROUP BY mes_ano
             ORDER BY mes_ano
             LIMIT 24
         """)
         
+        # Una sola consulta (sin COUNT(*) aparte); total_registros sale de la misma agregación
         result = db.execute(query).fetchall()
         logger.info(f"📊 Query ejecutada, {len(result)} períodos encontrados")
         
-        if not result or len(result) == 0:
+        if not result:
             logger.warning("⚠️ No se encontraron datos válidos para tendencia")
             
-            # Intentar consulta de diagnóstico
+            # Consulta de diagnóstico: distingue tabla vacía de fechas inválidas
             diagnostic_query = text("""
                 SELECT 
                     COUNT(*) as total_clientes,
-                    COUNT(DISTINCT fecha) as fechas_unicas,
-                    MIN(fecha) as fecha_min,
-                    MAX(fecha) as fecha_max,
-                    COUNT(CASE WHEN fecha IS NOT NULL AND fecha != '' THEN 1 END) as fechas_validas
+                    COUNT(DISTINCT fecha_date) as fechas_unicas,
+                    MIN(fecha_date) as fecha_min,
+                    MAX(fecha_date) as fecha_max,
+                    COUNT(fecha_date) as fechas_validas
                 FROM client_data
                 WHERE cliente IS NOT NULL 
                 AND TRIM(cliente) != ''
@@ -2066,6 +1831,14 @@ async def get_acquisition_trend_fixed_final(db: Session = Depends(get_database))
             
             diagnostic = db.execute(diagnostic_query).fetchone()
             
+            if not diagnostic.total_clientes:
+                return {
+                    "success": False,
+                    "message": "No hay datos cargados. Por favor, sube un archivo CSV primero.",
+                    "data": [],
+                    "error_type": "NO_DATA"
+                }
+            
             return {
                 "success": False,
                 "message": "No se encontraron datos válidos para generar tendencia",
@@ -2073,13 +1846,16 @@ async def get_acquisition_trend_fixed_final(db: Session = Depends(get_database))
                 "diagnostic": {
                     "total_clientes": diagnostic.total_clientes,
                     "fechas_unicas": diagnostic.fechas_unicas,
-                    "fecha_min": diagnostic.fecha_min,
-                    "fecha_max": diagnostic.fecha_max,
+                    "fecha_min": str(diagnostic.fecha_min) if diagnostic.fecha_min else None,
+                    "fecha_max": str(diagnostic.fecha_max) if diagnostic.fecha_max else None,
                     "fechas_validas": diagnostic.fechas_validas
                 },
                 "error_type": "NO_VALID_DATES"
             }
         
+        total_records = int(result[0].total_registros or 0)
+        logger.info(f"📊 Registros analizados: {total_records}")
+        
         # Procesar resultados
         data = []
         for row in result:
@@ -2129,7 +1905,8 @@ async def get_acquisition_trend_fixed_final(db: Session = Depends(get_database))
 # ENDPOINT TEMPORAL PARA DIAGNÓSTICO - agregar a main.py
 
 @app.get("/debug/date-analysis")
-async def debug_date_analysis(db: Session = Depends(get_database)):
+@bounded_executor.offload("db")
+def debug_date_analysis(db: Session = Depends(get_database)):
     """Endpoint temporal para analizar el formato de fechas en tus datos"""
     try:
         logger.info("🔍 Analizando formato de fechas...")
@@ -2229,7 +2006,8 @@ async def debug_date_analysis(db: Session = Depends(get_database)):
         # AGREGAR este endpoint temporalmente en main.py para debug
 
 @app.get("/debug/check-tipo-cliente")
-async def debug_check_tipo_cliente_column(db: Session = Depends(get_database)):
+@bounded_executor.offload("db")
+def debug_check_tipo_cliente_column(db: Session = Depends(get_database)):
     """Debug: Revisar qué datos hay en la columna tipo_cliente"""
     try:
         # Revisar todas las columnas disponibles
@@ -2248,7 +2026,7 @@ async def debug_check_tipo_cliente_column(db: Session = Depends(get_database)):
                 tipo_cliente,
                 COUNT(*) as cantidad_registros,
                 COUNT(DISTINCT cliente) as clientes_unicos,
-                SUM(CASE WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' THEN venta::numeric ELSE 0 END) as total_ventas
+                COALESCE(SUM(venta), 0) as total_ventas
             FROM client_data 
             WHERE tipo_cliente IS NOT NULL 
             AND TRIM(tipo_cliente) != ''
@@ -2263,7 +2041,7 @@ async def debug_check_tipo_cliente_column(db: Session = Depends(get_database)):
                 tipo_de_cliente,
                 COUNT(*) as cantidad_registros,
                 COUNT(DISTINCT cliente) as clientes_unicos,
-                SUM(CASE WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' THEN venta::numeric ELSE 0 END) as total_ventas
+                COALESCE(SUM(venta), 0) as total_ventas
             FROM client_data 
             WHERE tipo_de_cliente IS NOT NULL 
             AND TRIM(tipo_de_cliente) != ''
@@ -2310,7 +2088,9 @@ async def debug_check_tipo_cliente_column(db: Session = Depends(get_database)):
 # REEMPLAZAR el endpoint get_sales_by_type_detailed_robust con esta versión corregida
 
 @app.get("/clients/analytics/sales-by-type-detailed")
-async def get_sales_by_type_detailed_robust(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_sales_by_type_detailed_robust(db: Session = Depends(get_database)):
     """Análisis detallado ROBUSTO usando tipo_cliente con tipos de datos corregidos"""
     try:
         logger.info("🔍 Iniciando análisis robusto de tipo_cliente...")
@@ -2350,27 +2130,9 @@ async def get_sales_by_type_detailed_robust(db: Session = Depends(get_database))
                 END as tipo_cliente_clean,
                 COUNT(DISTINCT cliente) as num_clientes,
                 COUNT(*) as num_transacciones,
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN venta::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as total_ventas,
-                ROUND(CAST(AVG(
-                    CASE 
-                        WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN venta::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as venta_promedio,
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN mb IS NOT NULL AND mb::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN mb::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as total_mb
+                ROUND(COALESCE(SUM(venta), 0), 2) as total_ventas,
+                ROUND(AVG(COALESCE(venta, 0)), 2) as venta_promedio,
+                ROUND(COALESCE(SUM(mb), 0), 2) as total_mb
             FROM client_data 
             WHERE cliente IS NOT NULL 
             AND TRIM(cliente) != ''
@@ -2380,13 +2142,7 @@ async def get_sales_by_type_detailed_robust(db: Session = Depends(get_database))
                     WHEN tipo_cliente IS NULL OR TRIM(tipo_cliente) = '' THEN 'Sin categoría'
                     ELSE TRIM(tipo_cliente)
                 END
-            HAVING SUM(
-                CASE 
-                    WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                    THEN venta::numeric
-                    ELSE 0
-                END
-            ) > 0
+            HAVING COALESCE(SUM(venta), 0) > 0
             ORDER BY total_ventas DESC
         """)
         
@@ -2556,7 +2312,8 @@ async def get_sales_by_type_detailed_robust(db: Session = Depends(get_database))
 
 # TAMBIÉN AGREGA ESTE ENDPOINT DE DIAGNÓSTICO TEMPORAL
 @app.get("/debug/test-acquisition")
-async def debug_test_acquisition(db: Session = Depends(get_database)):
+@bounded_executor.offload("db")
+def debug_test_acquisition(db: Session = Depends(get_database)):
     """Endpoint temporal para debuggear la adquisición de clientes"""
     try:
         # Datos básicos
@@ -2619,23 +2376,24 @@ async def debug_test_acquisition(db: Session = Depends(get_database)):
 
 
 @app.get("/products/analytics/top_products_6")
-async def get_top_products_6(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_top_products_6(db: Session = Depends(get_database)):
     """Top 6 productos - SIN SessionLocal"""
     try:
         logger.info("🏆 [TOP6] Obteniendo top 6 productos...")
         
+        # Agregados por producto (product_rollup, solo ventas > 0), sumando sus categorías y proveedores
         query = text("""
             SELECT 
                 articulo as producto,
-                SUM(venta) as total_ventas,
-                SUM(mb) as total_margen,
-                COUNT(*) as cantidad,
-                AVG(venta) as promedio_venta
-            FROM client_data
-            WHERE articulo IS NOT NULL 
-            AND venta IS NOT NULL
-            AND venta > 0
+                SUM(total_ventas) as total_ventas,
+                SUM(total_mb) as total_margen,
+                SUM(num_transacciones) as cantidad,
+                SUM(total_ventas) / SUM(num_transacciones) as promedio_venta
+            FROM product_rollup
             GROUP BY articulo
+            HAVING SUM(num_transacciones) > 0
             ORDER BY total_ventas DESC
             LIMIT 6
         """)
@@ -2670,8 +2428,11 @@ async def get_top_products_6(db: Session = Depends(get_database)):
 
 # ===== ENDPOINT 1: COMPARATIVE BARS (CORREGIDO) =====
 @app.get("/products/analytics/comparative-bars")
-async def get_products_comparative_bars(
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_products_comparative_bars(
     limit: int = 10,
+    layout: Literal["rows", "columnar"] = "rows",
     db: Session = Depends(get_database)
 ):
     """
@@ -2684,40 +2445,20 @@ async def get_products_comparative_bars(
     try:
         logger.info(f"🔍 [COMPARATIVE] Obteniendo top {limit} productos...")
         
-        # Verificar datos
-        total_check = db.execute(text("SELECT COUNT(*) FROM client_data")).scalar()
-        logger.info(f"📊 [COMPARATIVE] Total registros: {total_check}")
-        
-        if total_check == 0:
-            logger.warning("⚠️ [COMPARATIVE] No hay datos")
-            return []
-        
-        # Query CORREGIDA para PostgreSQL - Sin usar ~ en NUMERIC
+        # Agregados por producto (product_rollup, solo ventas > 0)
         query = text("""
             SELECT 
-                COALESCE(articulo, 'Sin nombre') as producto,
+                articulo as producto,
                 COALESCE(categoria, 'Sin categoría') as categoria,
                 COALESCE(proveedor, 'Sin proveedor') as proveedor,
-                
-                -- Ventas: sumar directamente sin validación regex
-                ROUND(CAST(COALESCE(SUM(venta), 0) AS NUMERIC), 2) as total_ventas,
-                
-                -- Margen: sumar directamente
-                ROUND(CAST(COALESCE(SUM(mb), 0) AS NUMERIC), 2) as total_margen,
-                
-                -- Métricas adicionales
-                COUNT(DISTINCT factura) as num_facturas,
-                COUNT(DISTINCT cliente) as num_clientes,
-                ROUND(CAST(COALESCE(SUM(cantidad), 0) AS NUMERIC), 2) as cantidad_total
-                
-            FROM client_data
-            WHERE articulo IS NOT NULL 
-            AND TRIM(articulo) != ''
-            AND articulo != 'N/A'
-            AND venta IS NOT NULL
-            AND venta > 0
-            GROUP BY articulo, categoria, proveedor
-            HAVING SUM(venta) > 100
+                ROUND(total_ventas, 2) as total_ventas,
+                ROUND(total_mb, 2) as total_margen,
+                num_facturas,
+                num_clientes,
+                ROUND(cantidad_total, 2) as cantidad_total
+            FROM product_rollup
+            WHERE articulo != 'N/A'
+            AND total_ventas > 100
             ORDER BY total_ventas DESC
             LIMIT :limit_param
         """)
@@ -2751,8 +2492,8 @@ async def get_products_comparative_bars(
         
         logger.info(f"✅ [COMPARATIVE] Retornando {len(data)} productos")
         
-        # RETORNAR ARRAY DIRECTO
-        return data
+        # RETORNAR ARRAY DIRECTO (o columnar con layout=columnar)
+        return apply_layout(data, layout)
         
     except Exception as e:
         logger.error(f"❌ [COMPARATIVE] Error: {str(e)}")
@@ -2764,8 +2505,11 @@ async def get_products_comparative_bars(
 
 # ===== ENDPOINT 2: TREND LINES (CORREGIDO) =====
 @app.get("/products/analytics/trend-lines")
-async def get_products_trend_lines(
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_products_trend_lines(
     top_products: int = 6,
+    layout: Literal["rows", "columnar"] = "rows",
     db: Session = Depends(get_database)
 ):
     """
@@ -2774,55 +2518,37 @@ async def get_products_trend_lines(
     try:
         logger.info(f"📈 [TREND] Obteniendo tendencias para top {top_products}...")
         
-        # 1. Obtener los productos más vendidos
-        top_query = text("""
-            SELECT 
-                COALESCE(articulo, 'Sin nombre') as producto,
-                SUM(venta) as total_ventas
-            FROM client_data
-            WHERE articulo IS NOT NULL 
-            AND TRIM(articulo) != ''
-            AND fecha IS NOT NULL
-            AND venta IS NOT NULL
-            AND venta > 0
-            GROUP BY articulo
-            HAVING SUM(venta) > 0
-            ORDER BY total_ventas DESC
-            LIMIT :limit_param
-        """)
-        
-        top_result = db.execute(top_query, {"limit_param": top_products}).fetchall()
-        
-        if not top_result or len(top_result) == 0:
-            logger.warning("⚠️ [TREND] No se encontraron productos")
-            return []
-        
-        top_product_names = [row.producto for row in top_result]
-        logger.info(f"📋 [TREND] Top productos: {top_product_names[:3]}...")
-        
-        # 2. Obtener tendencias mensuales para estos productos
+        # Top productos y sus tendencias mensuales en una sola consulta (CTE),
+        # sin ida y vuelta intermedia a la base de datos
         trend_query = text("""
+            WITH top_products AS (
+                SELECT articulo
+                FROM client_data
+                WHERE articulo IS NOT NULL 
+                AND TRIM(articulo) != ''
+                AND year_month IS NOT NULL
+                AND venta IS NOT NULL
+                AND venta > 0
+                GROUP BY articulo
+                HAVING SUM(venta) > 0
+                ORDER BY SUM(venta) DESC
+                LIMIT :limit_param
+            )
             SELECT 
-                COALESCE(articulo, 'Sin nombre') as producto,
-                CASE 
-                    WHEN fecha ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}' THEN
-                        SUBSTRING(fecha, 1, 7)
-                    WHEN fecha ~ '^[0-9]{2}/[0-9]{2}/[0-9]{4}' THEN
-                        SUBSTRING(fecha, 7, 4) || '-' || SUBSTRING(fecha, 4, 2)
-                    ELSE '2024-01'
-                END as mes,
-                SUM(venta) as ventas_mes,
-                COUNT(DISTINCT factura) as facturas_mes
-            FROM client_data
-            WHERE articulo = ANY(:product_names)
-            AND fecha IS NOT NULL
-            AND venta IS NOT NULL
-            AND venta > 0
-            GROUP BY articulo, mes
+                COALESCE(cd.articulo, 'Sin nombre') as producto,
+                cd.year_month as mes,
+                SUM(cd.venta) as ventas_mes,
+                COUNT(DISTINCT cd.factura) as facturas_mes
+            FROM client_data cd
+            JOIN top_products tp ON tp.articulo = cd.articulo
+            WHERE cd.year_month IS NOT NULL
+            AND cd.venta IS NOT NULL
+            AND cd.venta > 0
+            GROUP BY cd.articulo, cd.year_month
             ORDER BY mes ASC, ventas_mes DESC
         """)
         
-        result = db.execute(trend_query, {"product_names": top_product_names}).fetchall()
+        result = db.execute(trend_query, {"limit_param": top_products}).fetchall()
         
         logger.info(f"📊 [TREND] Query ejecutada: {len(result)} registros")
         
@@ -2846,8 +2572,8 @@ async def get_products_trend_lines(
         
         logger.info(f"✅ [TREND] Retornando {len(data)} registros de tendencia")
         
-        # RETORNAR ARRAY DIRECTO
-        return data
+        # RETORNAR ARRAY DIRECTO (o columnar con layout=columnar)
+        return apply_layout(data, layout)
         
     except Exception as e:
         logger.error(f"❌ [TREND] Error: {str(e)}")
@@ -2859,7 +2585,9 @@ async def get_products_trend_lines(
 
 
 @app.get("/products/analytics/rotation-speed")
-async def get_rotation_speed(limit: int = 10, db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_rotation_speed(limit: int = 10, db: Session = Depends(get_database)):
     """
     Análisis de velocidad de rotación de productos basado en datos reales del CSV
     Calcula rotación basada en:
@@ -2869,58 +2597,26 @@ async def get_rotation_speed(limit: int = 10, db: Session = Depends(get_database
     - Distribución temporal de ventas
     """
     try:
-        # Query mejorada para calcular velocidad de rotación real
+        # Métricas de rotación desde product_rollup (transacciones con venta y cantidad > 0)
         query = text("""
             WITH product_metrics AS (
                 SELECT 
-                    COALESCE(articulo, 'Producto sin nombre') as producto,
+                    articulo as producto,
                     COALESCE(categoria, 'Sin categoría') as categoria,
                     COALESCE(proveedor, 'Sin proveedor') as proveedor,
                     
                     -- Métricas de transacciones
-                    COUNT(DISTINCT factura) as total_facturas,
-                    COUNT(DISTINCT cliente) as clientes_unicos,
-                    SUM(COALESCE(cantidad, 0)) as cantidad_total,
-                    SUM(COALESCE(venta, 0)) as ventas_totales,
-                    
-                    -- Métricas temporales
-                    COUNT(DISTINCT 
-                        CASE 
-                            WHEN fecha IS NOT NULL AND fecha != '' THEN
-                                SUBSTRING(fecha, 1, 7)  -- Extraer YYYY-MM
-                            ELSE NULL
-                        END
-                    ) as meses_activos,
+                    rotacion_facturas as total_facturas,
+                    rotacion_clientes as clientes_unicos,
+                    rotacion_cantidad as cantidad_total,
+                    rotacion_ventas as ventas_totales,
                     
-                    -- Calcular días únicos de actividad
-                    COUNT(DISTINCT 
-                        CASE 
-                            WHEN fecha IS NOT NULL AND fecha != '' THEN
-                                SUBSTRING(fecha, 1, 10)  -- Extraer YYYY-MM-DD
-                            ELSE NULL
-                        END
-                    ) as dias_activos,
+                    -- Meses y días únicos de actividad (fechas tipadas)
+                    rotacion_meses as meses_activos,
+                    rotacion_dias as dias_activos
                     
-                    -- Primera y última venta para calcular período
-                    MIN(
-                        CASE 
-                            WHEN fecha IS NOT NULL AND fecha != '' THEN fecha
-                            ELSE NULL
-                        END
-                    ) as primera_venta,
-                    MAX(
-                        CASE 
-                            WHEN fecha IS NOT NULL AND fecha != '' THEN fecha
-                            ELSE NULL
-                        END
-                    ) as ultima_venta
-                    
-                FROM client_data 
-                WHERE articulo IS NOT NULL AND articulo != ''
-                    AND cantidad IS NOT NULL AND cantidad > 0
-                    AND venta IS NOT NULL AND venta > 0
-                GROUP BY articulo, categoria, proveedor
-                HAVING SUM(COALESCE(venta, 0)) > 500  -- Filtrar productos con ventas mínimas
+                FROM product_rollup 
+                WHERE rotacion_ventas > 500  -- Filtrar productos con ventas mínimas
             ),
             rotation_analysis AS (
                 SELECT 
@@ -2933,8 +2629,6 @@ async def get_rotation_speed(limit: int = 10, db: Session = Depends(get_database
                     ventas_totales,
                     meses_activos,
                     dias_activos,
-                    primera_venta,
-                    ultima_venta,
                     
                     -- Calcular velocidad de rotación (transacciones por mes)
                     CASE 
@@ -3037,6 +2731,7 @@ async def get_rotation_speed(limit: int = 10, db: Session = Depends(get_database
                     {"producto": "TITANIO DIOXIDO", "velocidad_rotacion": 3.2, "categoria": "Media"},
                     {"producto": "HEXAMETAFOSFATO DE SODIO", "velocidad_rotacion": 2.9, "categoria": "Lenta"}
                 ],
+                "fallback": True,
                 "chart_type": "rotation_analysis",
                 "description": "Análisis de velocidad de rotación (datos de ejemplo)",
                 "note": "Usando datos de ejemplo - verificar conexión con base de datos"
@@ -3133,23 +2828,28 @@ async def get_rotation_speed(limit: int = 10, db: Session = Depends(get_database
 # ===== MODIFICAR ENDPOINTS EXISTENTES PARA SOPORTAR FILTROS DE PERÍODO =====
 # 3. Modificar pareto-80-20 existente:
 @app.get("/products/analytics/pareto-80-20")
-async def get_products_pareto_analysis(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_products_pareto_analysis(
+    layout: Literal["rows", "columnar"] = "rows",
+    db: Session = Depends(get_database)
+):
     """
     Gráfico de Pareto (80/20): 20% de productos que generan 80% de las ventas
     Variables: Articulo, Venta, participación acumulada
+    layout=columnar devuelve un arreglo de valores por columna
     """
     try:
-        # Consulta para análisis de Pareto
+        # Pareto sobre los totales netos de product_rollup (devoluciones incluidas)
         query = text("""
             WITH product_sales AS (
                 SELECT 
-                    COALESCE(articulo, 'Producto sin nombre') as producto,
+                    articulo as producto,
                     COALESCE(categoria, 'Sin categoría') as categoria,
-                    SUM(COALESCE(venta, 0)) as total_ventas,
-                    SUM(COALESCE(cantidad, 0)) as total_cantidad,
-                    SUM(COALESCE(mb, 0)) as total_margen
-                FROM client_data 
-                WHERE articulo IS NOT NULL AND articulo != ''
+                    SUM(ventas_netas) as total_ventas,
+                    SUM(cantidad_neta) as total_cantidad,
+                    SUM(mb_neto) as total_margen
+                FROM product_rollup 
                 GROUP BY articulo, categoria
             ),
             ranked_products AS (
@@ -3204,16 +2904,8 @@ async def get_products_pareto_analysis(db: Session = Depends(get_database)):
         
         result = db.execute(query).fetchall()
         
-        data = []
-        top_80_count = 0
-        total_products = 0
-        
-        for row in result:
-            total_products = row.total_productos
-            if row.es_top_80:
-                top_80_count += 1
-                
-            data.append({
+        data = [
+            {
                 "producto": row.producto,
                 "categoria": row.categoria,
                 "total_ventas": float(row.total_ventas),
@@ -3224,7 +2916,11 @@ async def get_products_pareto_analysis(db: Session = Depends(get_database)):
                 "participacion_acumulada": float(row.participacion_acumulada),
                 "categoria_pareto": row.categoria_pareto,
                 "es_top_80": row.es_top_80
-            })
+            }
+            for row in result
+        ]
+        total_products = result[-1].total_productos if result else 0
+        top_80_count = sum(1 for row in result if row.es_top_80)
         
         # Calcular estadísticas del Pareto
         pareto_stats = {
@@ -3234,13 +2930,13 @@ async def get_products_pareto_analysis(db: Session = Depends(get_database)):
             "cumple_regla_80_20": top_80_count <= (total_products * 0.3)  # Típicamente el 20-30% de productos genera el 80%
         }
         
-        return {
+        return apply_layout({
             "success": True,
             "data": data,
             "pareto_stats": pareto_stats,
             "chart_type": "pareto",
             "description": f"Análisis de Pareto: {top_80_count} productos ({pareto_stats['porcentaje_productos_top_80']}%) generan el 80% de las ventas"
-        }
+        }, layout)
         
     except Exception as e:
         logger.error(f"Error en análisis de Pareto: {str(e)}")
@@ -3252,7 +2948,9 @@ async def get_products_pareto_analysis(db: Session = Depends(get_database)):
 # Agregar este endpoint al archivo main.py o al router correspondiente
 
 @app.get("/analytics/comerciales")
-async def get_comerciales():
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_comerciales():
     """
     Obtiene la lista única de comerciales del CSV cargado
     """
@@ -3325,7 +3023,8 @@ async def get_comerciales():
 # Modificar el endpoint existente de recomendaciones para incluir filtro por comercial
 
 @app.get("/ml/cross-sell-recommendations")
-async def get_cross_sell_recommendations_postgresql(
+@bounded_executor.offload("ml")
+def get_cross_sell_recommendations_postgresql(
     limit: int = 50,
     min_probability: float = 0.3,
     comercial: Optional[str] = None,  # Filtro por comercial
@@ -3335,6 +3034,21 @@ async def get_cross_sell_recommendations_postgresql(
     try:
         logger.info("🤖 Iniciando recomendaciones ML con datos reales...")
         
+        # Puntajes precalculados tras la última carga
+        scores = get_cross_sell_scores(db, current_model_version(ml_service), limit, min_probability, comercial)
+        if scores is not None:
+            return {
+                "success": True,
+                "message": f"Recomendaciones generadas usando datos reales del CSV",
+                "total_evaluated": scores["total_evaluated"],
+                "total_recommendations": len(scores["recommendations"]),
+                "filter_comercial": comercial,
+                "min_probability_used": min_probability,
+                "dataset_version": scores["dataset_version"],
+                "recommendations": scores["recommendations"],
+                "data_source": "cross_sell_scores"
+            }
+        
         # Query base para obtener datos agregados por cliente
         base_query = """
             SELECT 
@@ -3344,36 +3058,20 @@ async def get_cross_sell_recommendations_postgresql(
                 COALESCE(categoria, 'Sin categoría') as categoria,
                 COALESCE(codigo, 'Sin código') as codigo_cliente,
                 COALESCE(proveedor, 'Sin proveedor') as proveedor,
+                MAX(tipo_cliente) as tipo_cliente,
+                MAX(supercategoria) as supercategoria,
                 
                 -- Métricas agregadas
                 COUNT(*) as num_transacciones,
                 COUNT(DISTINCT factura) as num_facturas,
-                SUM(COALESCE(cantidad, 0)) as cantidad_total,
+                COALESCE(SUM(cantidad), 0) as cantidad_total,
                 
                 -- Valores monetarios
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN venta::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as venta_total,
+                ROUND(COALESCE(SUM(venta), 0), 2) as venta_total,
                 
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN costo IS NOT NULL AND costo::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN costo::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as costo_total,
+                ROUND(COALESCE(SUM(costo), 0), 2) as costo_total,
                 
-                ROUND(CAST(SUM(
-                    CASE 
-                        WHEN mb IS NOT NULL AND mb::text ~ '^[0-9]+\.?[0-9]*$' 
-                        THEN mb::numeric
-                        ELSE 0
-                    END
-                ) AS NUMERIC), 2) as mb_total,
+                ROUND(COALESCE(SUM(mb), 0), 2) as mb_total,
                 
                 -- Fechas
                 MIN(fecha) as primera_compra,
@@ -3384,13 +3082,7 @@ async def get_cross_sell_recommendations_postgresql(
             AND TRIM(cliente) != ''
             {comercial_filter}
             GROUP BY cliente, tipo_de_cliente, comercial, categoria, codigo, proveedor
-            HAVING SUM(
-                CASE 
-                    WHEN venta IS NOT NULL AND venta::text ~ '^[0-9]+\.?[0-9]*$' 
-                    THEN venta::numeric
-                    ELSE 0
-                END
-            ) > 0
+            HAVING COALESCE(SUM(venta), 0) > 0
             ORDER BY venta_total DESC
             LIMIT :limit_param
         """
@@ -3428,6 +3120,8 @@ async def get_cross_sell_recommendations_postgresql(
                 "comercial": row.comercial,
                 "proveedor": row.proveedor,
                 "codigo_cliente": row.codigo_cliente,
+                "tipo_cliente": row.tipo_cliente,
+                "supercategoria": row.supercategoria,
                 "num_transacciones": row.num_transacciones,
                 "num_facturas": row.num_facturas,
                 "primera_compra": row.primera_compra,
@@ -3442,12 +3136,10 @@ async def get_cross_sell_recommendations_postgresql(
         all_predictions = ml_service.predict_cross_sell(client_data)
         
         # Filtrar por probabilidad mínima y enriquecer con datos reales
+        # (predict_cross_sell conserva el orden del lote: predicción i <-> client_data[i])
         filtered_recommendations = []
-        for pred in all_predictions:
+        for pred, original_data in zip(all_predictions, client_data):
             if pred['prediction'] == 1 and pred['probability'] >= min_probability:
-                # Encontrar datos originales del cliente
-                original_data = next((c for c in client_data if c['cliente'] == pred['client_name']), {})
-                
                 # Enriquecer predicción con datos reales
                 enriched_pred = {
                     **pred,
@@ -3468,8 +3160,8 @@ async def get_cross_sell_recommendations_postgresql(
                 
                 filtered_recommendations.append(enriched_pred)
         
-        # Ordenar por probabilidad descendente
-        filtered_recommendations.sort(key=lambda x: x['probability'], reverse=True)
+        # Top-k por probabilidad sin ordenar la lista completa
+        filtered_recommendations = heapq.nlargest(limit, filtered_recommendations, key=lambda x: x['probability'])
         
         logger.info(f"✅ {len(filtered_recommendations)} recomendaciones generadas con datos reales")
         
@@ -3495,7 +3187,9 @@ async def get_cross_sell_recommendations_postgresql(
         # AGREGAR ESTE ENDPOINT AL ARCHIVO main.py del backend
 
 @app.get("/analytics/comerciales")
-async def get_comerciales_from_csv(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_comerciales_from_csv(db: Session = Depends(get_database)):
     """
     Obtiene la lista única de comerciales del CSV cargado
     """
@@ -3551,7 +3245,9 @@ async def get_comerciales_from_csv(db: Session = Depends(get_database)):
 # (después de los otros endpoints existentes)
 
 @app.get("/analytics/comerciales")
-async def get_comerciales_from_csv(db: Session = Depends(get_database)):
+@analytics_cache.cached()
+@bounded_executor.offload("analytics")
+def get_comerciales_from_csv(db: Session = Depends(get_database)):
     """
     Obtiene la lista única de comerciales del CSV cargado
     """
@@ -3606,14 +3302,17 @@ async def get_comerciales_from_csv(db: Session = Depends(get_database)):
 
 
 @app.get("/clients/analytics/sales-by-type-detailed")
+@analytics_cache.cached()
 async def get_sales_by_type_detailed(db: Session = Depends(get_database)):
     return await get_sales_by_type_detailed_robust(db)
 
 @app.get("/clients/analytics/acquisition-trend")
+@analytics_cache.cached()
 async def get_acquisition_trend(db: Session = Depends(get_database)):
     return await get_acquisition_trend_fixed_final(db)
 
 @app.get("/clients/analytics/client-type-analysis")
+@analytics_cache.cached()
 async def get_client_type_analysis(db: Session = Depends(get_database)):
     return await get_client_type_analysis_postgresql(db)
 
@@ -3621,6 +3320,83 @@ async def get_client_type_analysis(db: Session = Depends(get_database)):
 async def debug_test_acquisition_endpoint(db: Session = Depends(get_database)):
     return await debug_test_acquisition(db)
 
+# ===== BUNDLE DEL DASHBOARD =====
+
+# Widget -> (endpoint, parámetros con los que lo llama el frontend)
+DASHBOARD_WIDGETS = {
+    "summary": (get_summary_analytics_postgresql, {}),
+    "comerciales": (get_comerciales, {}),
+    "segmentation-stacked": (get_client_segmentation_stacked, {}),
+    "frequency-scatter": (get_client_frequency_scatter, {}),
+    "top-profitable-detailed": (get_top_profitable_detailed_using_tipo_cliente, {"limit": 10}),
+    "sales-by-type-detailed": (get_sales_by_type_detailed, {}),
+    "acquisition-trend": (get_acquisition_trend, {}),
+    "client-type-analysis": (get_client_type_analysis, {}),
+    "top_products_6": (get_top_products_6, {}),
+    "comparative-bars": (get_products_comparative_bars, {"limit": 10}),
+    "trend-lines": (get_products_trend_lines, {"top_products": 6}),
+    "rotation-speed": (get_rotation_speed, {"limit": 10}),
+    "pareto-80-20": (get_products_pareto_analysis, {}),
+}
+
+async def _run_dashboard_widget(name: str):
+    """Calcular un widget con su propia sesión (las sesiones no se comparten entre hilos)"""
+    endpoint, params = DASHBOARD_WIDGETS[name]
+    if "db" not in inspect.signature(endpoint).parameters:
+        return await endpoint(**params)
+    db = SessionLocal()
+    try:
+        return await endpoint(**params, db=db)
+    finally:
+        db.close()
+
+@app.get("/dashboard/bundle")
+async def get_dashboard_bundle(widgets: Optional[str] = None):
+    """
+    Varios widgets del dashboard en una sola petición.
+
+    widgets es una lista separada por comas (por defecto, todos). Cada widget
+    llama a su endpoint con caché (@analytics_cache.cached), así el bundle y
+    los endpoints individuales comparten resultados por versión del dataset.
+    Los widgets no guardados se calculan en paralelo. Los de productos
+    (top_products_6, comparative-bars, pareto-80-20, rotation-speed) se
+    derivan del mismo agregado por producto (product_rollup, calculado una
+    vez por carga) y no agrupan client_data.
+
+    success es false si algún widget falló o devolvió datos de respaldo
+    (success=false o fallback=true en su respuesta); esos widgets se listan
+    en degraded.
+    """
+    requested = [w.strip() for w in widgets.split(",") if w.strip()] if widgets else list(DASHBOARD_WIDGETS)
+    unknown = [w for w in requested if w not in DASHBOARD_WIDGETS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Widgets desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(DASHBOARD_WIDGETS)}"
+        )
+    requested = list(dict.fromkeys(requested))
+
+    start = datetime.now()
+    results = await asyncio.gather(*(_run_dashboard_widget(w) for w in requested), return_exceptions=True)
+
+    data, errors, degraded = {}, {}, []
+    for name, result in zip(requested, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ Error en widget {name}: {result}")
+            errors[name] = result.detail if isinstance(result, HTTPException) else str(result)
+        else:
+            data[name] = result
+            if is_fallback_payload(result):
+                degraded.append(name)
+
+    return {
+        "success": not errors and not degraded,
+        "widgets": data,
+        "errors": errors,
+        "degraded": degraded,
+        "elapsed_seconds": round((datetime.now() - start).total_seconds(), 3)
+    }
+
 # AGREGAR ESTOS ENDPOINTS AL ARCHIVO main.py
 
 from fastapi import Depends, HTTPException, status
@@ -3683,7 +3459,8 @@ class UserResponse(BaseModel):
 # ===== ENDPOINTS DE AUTENTICACIÓN =====
 
 @app.post("/auth/login", response_model=Token)
-async def login(
+@bounded_executor.offload("auth")
+def login(
     login_data: UserLogin,
     db: Session = Depends(get_database)
 ):
@@ -3758,7 +3535,8 @@ async def login(
         )
 
 @app.post("/auth/register")
-async def register_user(
+@bounded_executor.offload("auth")
+def register_user(
     register_data: UserRegister,
     db: Session = Depends(get_database)
 ):
@@ -3834,7 +3612,8 @@ async def register_user(
 # AGREGAR ESTE ENDPOINT EN main.py (después de los otros endpoints de usuarios)
 
 @app.post("/users/analysts")
-async def create_analyst(
+@bounded_executor.offload("auth")
+def create_analyst(
     user_data: UserCreate,
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_database)
@@ -3905,7 +3684,8 @@ async def create_analyst(
 
 
 @app.get("/users/analysts")
-async def get_analysts(
+@bounded_executor.offload("auth")
+def get_analysts(
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_database)
 ):
@@ -3955,7 +3735,8 @@ async def get_analysts(
 
 
 @app.put("/users/analysts/{analyst_id}")
-async def update_analyst(
+@bounded_executor.offload("auth")
+def update_analyst(
     analyst_id: int,
     user_data: UserUpdate,
     current_user: User = Depends(get_current_admin_user),
@@ -4012,7 +3793,8 @@ async def update_analyst(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/users/analysts/{analyst_id}")
-async def delete_analyst(
+@bounded_executor.offload("auth")
+def delete_analyst(
     analyst_id: int,
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_database)
@@ -1,102 +1,120 @@
 # backend/ml_service.py (Versión corregida para usar modelo real)
 import pandas as pd
 import numpy as np
-import xgboost as xgb
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime
+import threading
 import logging
 import json
-import os
 from pathlib import Path
 
+from config import settings
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from feature_encoder import CATEGORY_COLUMNS, FeatureEncoder
+from model_registry import LoadedModel, _version_number, discover_model_versions, load_model_version
+
 logger = logging.getLogger(__name__)
 
 class MLService:
     def __init__(self):
-        self.model = None
-        self.model_metadata = None
-        self.feature_names = []
+        self.models_dir = Path(settings.ml_models_dir)
+        self.active: Optional[LoadedModel] = None
         self.is_loaded = False
-        self.demo_mode = False  # Cambiar default a False
+        
+        # Recargas en segundo plano: una a la vez, estado por versión
+        # (load_status solo se lee o modifica con self.lock tomado)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-load")
+        self.lock = threading.Lock()
+        self.load_status: Dict[str, Dict[str, Any]] = {}
+        self.swap_callbacks: List[Callable[[LoadedModel], Any]] = []
+        
+        # Valores distintos de cada categoría en client_data (base de los códigos)
+        self.category_values: Dict[str, List[str]] = {}
         
         # Intentar cargar modelo
         self._initialize()
     
+    # La versión activa se reemplaza con una sola asignación; estos
+    # atributos siempre leen la versión vigente
+    @property
+    def model(self):
+        return self.active.model if self.active else None
+    
+    @property
+    def model_metadata(self) -> Optional[Dict[str, Any]]:
+        return self.active.metadata if self.active else None
+    
+    @property
+    def feature_names(self) -> List[str]:
+        return self.active.feature_names if self.active else []
+    
+    @property
+    def encoder(self) -> Optional[FeatureEncoder]:
+        return self.active.encoder if self.active else None
+    
+    @property
+    def demo_mode(self) -> bool:
+        return self.active.demo_mode if self.active else True
+    
     def _initialize(self):
-        """Inicializar el servicio ML"""
+        """Inicializar el servicio ML con la versión más reciente de ml_models/"""
         try:
-            # Verificar si existen archivos de modelo
-            model_paths = [
-                Path("ml_models/xgboost_model_v1.pkl"),
-                Path("ml_models/xgboost_model_v1.json"),
-            ]
-            metadata_path = Path("ml_models/model_metadata.json")
-            
-            # Cargar metadatos primero
-            if metadata_path.exists():
-                try:
-                    with open(metadata_path, 'r', encoding='utf-8') as f:
-                        self.model_metadata = json.load(f)
-                    logger.info("✅ Metadatos ML cargados")
-                    
-                    # Obtener nombres de features
-                    self.feature_names = self.model_metadata.get('feature_names', [])
-                    
-                except Exception as e:
-                    logger.warning(f"⚠️ Error cargando metadatos: {e}")
-                    self._activate_demo_mode()
-                    return
-            else:
-                logger.warning("⚠️ Archivo de metadatos no encontrado")
+            versions = discover_model_versions(self.models_dir)
+            if not versions:
+                logger.warning(f"⚠️ No hay modelos versionados en {self.models_dir}")
                 self._activate_demo_mode()
                 return
             
-            # Intentar cargar modelo XGBoost
-            model_loaded = False
-            
-            # Primero intentar .json
-            json_path = Path("ml_models/xgboost_model_v1.json")
-            if json_path.exists():
+            # Probar de la más nueva a la más antigua
+            for entry in reversed(versions):
                 try:
-                    self.model = xgb.XGBClassifier()
-                    self.model.load_model(str(json_path))
-                    model_loaded = True
-                    logger.info("✅ Modelo XGBoost cargado desde JSON")
+                    self._swap(load_model_version(entry))
+                    logger.info("🎯 Modelo REAL cargado y listo para predicciones")
+                    return
                 except Exception as e:
-                    logger.warning(f"⚠️ Error cargando modelo JSON: {e}")
+                    logger.warning(f"⚠️ Error cargando modelo {entry['version']}: {e}")
+                    self._set_status(entry["version"], "failed", str(e))
             
-            # Si no funciona JSON, intentar .pkl
-            if not model_loaded:
-                pkl_path = Path("ml_models/xgboost_model_v1.pkl")
-                if pkl_path.exists():
-                    try:
-                        import pickle
-                        with open(pkl_path, 'rb') as f:
-                            self.model = pickle.load(f)
-                        model_loaded = True
-                        logger.info("✅ Modelo XGBoost cargado desde PKL")
-                    except Exception as e:
-                        logger.warning(f"⚠️ Error cargando modelo PKL: {e}")
-            
-            if model_loaded:
-                self.is_loaded = True
-                self.demo_mode = False
-                logger.info("🎯 Modelo REAL cargado y listo para predicciones")
-            else:
-                logger.warning("⚠️ No se pudo cargar modelo real, activando modo DEMO")
-                self._activate_demo_mode()
+            logger.warning("⚠️ No se pudo cargar modelo real, activando modo DEMO")
+            self._activate_demo_mode(self._read_metadata(versions[-1]["metadata_path"]))
                 
         except Exception as e:
             logger.error(f"❌ Error inicializando ML Service: {e}")
             self._activate_demo_mode()
     
-    def _activate_demo_mode(self):
+    @staticmethod
+    def _read_metadata(metadata_path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"⚠️ Error cargando metadatos: {e}")
+            return None
+    
+    def _set_status(self, version: str, status: str, error: Optional[str] = None):
+        with self.lock:
+            self.load_status[version] = {"status": status, "error": error}
+    
+    def _swap(self, loaded: LoadedModel) -> Optional[str]:
+        """Activar una versión ya cargada y calentada (reemplazo atómico); devuelve la anterior"""
+        if self.category_values:
+            loaded.set_categories(self.category_values)
+        with self.lock:
+            previous = self.active.version if self.active else None
+            self.active = loaded
+            self.is_loaded = True
+            self.load_status[loaded.version] = {"status": "active", "error": None}
+            if previous and previous != loaded.version:
+                self.load_status[previous] = {"status": "available", "error": None}
+        return previous
+    
+    def _activate_demo_mode(self, metadata: Optional[Dict[str, Any]] = None):
         """Activar modo demo con predicciones simuladas"""
-        self.demo_mode = True
-        self.is_loaded = True
-        
-        if not self.model_metadata:
-            self.model_metadata = {
+        if not metadata:
+            metadata = {
                 "model_version": "DEMO-1.0",
                 "training_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "threshold": 0.5,  # Usar el threshold de los metadatos reales
@@ -118,96 +136,180 @@ class MLService:
                 "demo_mode": True
             }
         
-        self.feature_names = self.model_metadata.get('feature_names', [])
+        self.active = LoadedModel("demo", None, metadata)
+        self.is_loaded = True
         logger.info("✅ Modo DEMO ML activado")
     
+    def refresh_categories(self, db: Session) -> Dict[str, int]:
+        """
+        Leer los valores distintos de las columnas categóricas de client_data y
+        fijar con ellos los códigos del modelo activo.
+
+        Se llama al arrancar y después de cada carga, nunca por request; las
+        versiones que se activen después reciben los mismos valores.
+        """
+        self.category_values = {
+            name: [row[0] for row in db.execute(text(
+                f"SELECT DISTINCT {column} FROM client_data WHERE {column} IS NOT NULL"
+            ))]
+            for name, column in CATEGORY_COLUMNS.items()
+        }
+        if self.active:
+            self.active.set_categories(self.category_values)
+        counts = {name: len(values) for name, values in self.category_values.items()}
+        logger.info(f"🏷️ Diccionarios de categorías construidos: {counts}")
+        return counts
+    
+    def on_swap(self, callback: Callable[[LoadedModel], Any]):
+        """Registrar una tarea a ejecutar después de activar una versión nueva"""
+        self.swap_callbacks.append(callback)
+    
+    def reload(self, version: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Cargar una versión en segundo plano y activarla cuando esté caliente.
+        
+        Sin version se toma la más reciente de ml_models/. Mientras carga,
+        las predicciones siguen usando la versión activa.
+        """
+        versions = {entry["version"]: entry for entry in discover_model_versions(self.models_dir)}
+        if not versions:
+            return {"success": False, "message": f"No hay modelos versionados en {self.models_dir}"}
+        
+        if version is None:
+            version = max(versions, key=_version_number)
+        if version not in versions:
+            return {"success": False, "message": f"Versión {version} no encontrada"}
+        
+        with self.lock:
+            if self.load_status.get(version, {}).get("status") == "loading":
+                return {"success": True, "message": f"La versión {version} ya se está cargando", "version": version, "status": "loading"}
+            self.load_status[version] = {"status": "loading", "error": None}
+        
+        self.executor.submit(self._load_and_swap, versions[version])
+        return {"success": True, "message": f"Cargando versión {version} en segundo plano", "version": version, "status": "loading"}
+    
+    def _load_and_swap(self, entry: Dict[str, Any]):
+        version = entry["version"]
+        try:
+            loaded = load_model_version(entry)
+        except Exception as e:
+            logger.error(f"❌ Error cargando modelo {version}: {e}")
+            self._set_status(version, "failed", str(e))
+            return
+        
+        previous = self._swap(loaded)
+        logger.info(f"🔄 Modelo activo: {previous} -> {version}")
+        
+        for callback in self.swap_callbacks:
+            try:
+                callback(loaded)
+            except Exception as e:
+                logger.warning(f"⚠️ Error en tarea posterior al cambio de modelo: {e}")
+    
+    def list_models(self) -> List[Dict[str, Any]]:
+        """Versiones disponibles en ml_models/ con su estado, tiempo de carga y memoria"""
+        with self.lock:
+            active = self.active
+            load_status = dict(self.load_status)
+        models = []
+        for entry in discover_model_versions(self.models_dir):
+            version = entry["version"]
+            status = load_status.get(version, {})
+            item = {
+                "version": version,
+                "model_file": entry["model_path"].name,
+                "metadata_file": entry["metadata_path"].name,
+                "format": entry["format"],
+                "active": active is not None and active.version == version,
+                "status": status.get("status", "available"),
+                "error": status.get("error")
+            }
+            if item["active"]:
+                item.update(active.info())
+            models.append(item)
+        return models
+    
     def predict_cross_sell(self, client_data: List[Dict], threshold: Optional[float] = None) -> List[Dict]:
-        """Realizar predicciones de venta cruzada"""
+        """Realizar predicciones de venta cruzada para un lote de clientes"""
         if not self.is_loaded:
             raise Exception("Modelo no está cargado")
         
+        # Versión fija durante todo el lote aunque se active otra en paralelo
+        active = self.active
+        
         try:
             if threshold is None:
-                threshold = self.model_metadata.get('threshold', 0.5)
+                threshold = active.metadata.get('threshold', 0.5)
             
-            results = []
+            if not client_data:
+                return []
             
-            for i, client_info in enumerate(client_data):
-                if self.demo_mode:
-                    # Usar lógica demo
-                    prob = self._calculate_demo_probability(client_info)
-                else:
-                    # Usar modelo REAL
-                    prob = self._predict_with_real_model(client_info)
-                
-                pred = 1 if prob >= threshold else 0
-                
-                # Determinar prioridad
-                if prob >= 0.7:
-                    priority = "Alta"
-                elif prob >= 0.5:
-                    priority = "Media"
-                elif prob >= 0.3:
-                    priority = "Baja"
-                else:
-                    priority = "Muy Baja"
-                
-                result = {
+            # Probabilidades de todo el lote (una sola llamada al modelo)
+            if active.demo_mode:
+                probs = np.array([self._calculate_demo_probability(c) for c in client_data], dtype=float)
+            else:
+                probs = self._predict_batch_with_real_model(client_data, active)
+            
+            # Etiquetas vectorizadas
+            preds = (probs >= threshold).astype(int)
+            priorities = np.select(
+                [probs >= 0.7, probs >= 0.5, probs >= 0.3],
+                ["Alta", "Media", "Baja"],
+                default="Muy Baja"
+            )
+            confidences = np.where((probs > 0.6) | (probs < 0.4), "Alta", "Media")
+            rounded = np.round(probs, 4)
+            
+            prediction_date = datetime.now().isoformat()
+            model_version = active.metadata.get('model_version', '1.0')
+            
+            return [
+                {
                     "client_id": client_info.get('id', i),
                     "client_name": client_info.get('cliente', f"Cliente_{i}"),
-                    "probability": round(float(prob), 4),
-                    "prediction": int(pred),
-                    "recommendation": "Sí" if pred == 1 else "No",
-                    "priority": priority,
+                    "probability": float(rounded[i]),
+                    "prediction": int(preds[i]),
+                    "recommendation": "Sí" if preds[i] == 1 else "No",
+                    "priority": str(priorities[i]),
                     "threshold_used": threshold,
-                    "confidence": "Alta" if prob > 0.6 or prob < 0.4 else "Media",
+                    "confidence": str(confidences[i]),
                     "venta_actual": client_info.get('venta', 0),
                     "categoria": client_info.get('categoria', 'N/A'),
                     "tipo_cliente": client_info.get('tipo_de_cliente', 'N/A'),
                     "comercial": client_info.get('comercial', 'N/A'),
-                    "prediction_date": datetime.now().isoformat(),
-                    "model_version": self.model_metadata.get('model_version', '1.0'),
-                    "demo_mode": self.demo_mode
+                    "prediction_date": prediction_date,
+                    "model_version": model_version,
+                    "demo_mode": active.demo_mode
                 }
-                
-                results.append(result)
-            
-            return results
+                for i, client_info in enumerate(client_data)
+            ]
             
         except Exception as e:
             logger.error(f"❌ Error en predicción: {str(e)}")
             raise
     
-    def _predict_with_real_model(self, client_info: Dict) -> float:
-        """Hacer predicción con el modelo XGBoost real"""
+    def encode_features(self, frame: pd.DataFrame) -> np.ndarray:
+        """Codificar un DataFrame de clientes con el encoder de feature_names"""
+        return self.encoder.encode(frame)
+    
+    def _build_feature_matrix(self, client_data: List[Dict]) -> np.ndarray:
+        """Construir la matriz de features (clientes x feature_names) del lote"""
+        return self.encode_features(pd.DataFrame.from_records(client_data))
+    
+    def _predict_batch_with_real_model(self, client_data: List[Dict], active: Optional[LoadedModel] = None) -> np.ndarray:
+        """Probabilidades del modelo XGBoost real para todo el lote"""
         try:
-            # Preparar datos según los feature_names del modelo
-            feature_data = []
-            
-            # Mapear datos del cliente a las features esperadas
-            for feature_name in self.feature_names:
-                if feature_name in client_info:
-                    feature_data.append(client_info[feature_name])
-                else:
-                    # Valor por defecto para features faltantes
-                    feature_data.append(0.0)
-            
-            # Convertir a formato que espera XGBoost
-            X = np.array([feature_data])
-            
-            # Obtener probabilidad (para clasificación binaria)
-            if hasattr(self.model, 'predict_proba'):
-                prob = self.model.predict_proba(X)[0][1]  # Probabilidad de clase positiva
-            else:
-                # Si es un booster directo
-                prob = self.model.predict(X)[0]
-            
-            return float(prob)
+            active = active or self.active
+            return active.predict_proba(pd.DataFrame.from_records(client_data))
             
         except Exception as e:
             logger.error(f"❌ Error en predicción real: {e}")
             # Fallback a demo si hay error
-            return self._calculate_demo_probability(client_info)
+            return np.array([self._calculate_demo_probability(c) for c in client_data], dtype=float)
+    
+    def _predict_with_real_model(self, client_info: Dict) -> float:
+        """Hacer predicción con el modelo XGBoost real para un solo cliente"""
+        return float(self._predict_batch_with_real_model([client_info])[0])
     
     def _calculate_demo_probability(self, client_info: Dict) -> float:
         """Calcular probabilidad demo basada en reglas de negocio"""
@@ -282,7 +384,16 @@ class MLService:
             "feature_count": len(self.feature_names),
             "feature_names": self.feature_names,
             "model_type": "XGBoost Classifier" if not self.demo_mode else "Demo Mode",
-            "demo_mode": self.demo_mode
+            "inference_engine": self.active.engine,
+            "registry_version": self.active.version,
+            "demo_mode": self.demo_mode,
+            "encoder": {
+                "numeric_features": list(self.encoder.numeric) if self.encoder else [],
+                "categorical_features": list(self.encoder.categorical) if self.encoder else [],
+                "one_hot_features": {source: len(columns) for source, columns in self.encoder.one_hot.items()} if self.encoder else {},
+                "category_mappings_from_metadata": set(self.encoder.categorical) <= self.encoder.metadata_mappings if self.encoder else False,
+                "category_mapping_sizes": {name: len(mapping) for name, mapping in self.encoder.category_mappings.items()} if self.encoder else {}
+            }
         }
         
         if self.demo_mode:
@@ -0,0 +1,194 @@
+# backend/model_registry.py
+"""
+Registro de versiones del modelo de venta cruzada.
+
+Cada versión es un par de archivos en ml_models/:
+
+    xgboost_model_v2.json  (o .pkl)   +   model_metadata_v2.json
+
+Si no existe model_metadata_<versión>.json se usa model_metadata.json, que
+es el formato con el que se publicó la v1. load_model_version() carga el
+par completo (metadatos, encoder, modelo), lo calienta con un lote de
+prueba y mide tiempo de carga y memoria; MLService lo activa reemplazando
+una sola referencia, así las predicciones en curso terminan con la versión
+con la que empezaron.
+"""
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime
+from pathlib import Path
+import tracemalloc
+import logging
+import json
+import time
+import re
+
+from feature_encoder import FeatureEncoder
+from tree_ensemble import TreeEnsemble
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = Path("ml_models")
+MODEL_FILE_PATTERN = re.compile(r"^xgboost_model_(v\d+)\.(json|pkl)$")
+SHARED_METADATA_FILE = "model_metadata.json"
+
+# Formatos en orden de preferencia cuando una versión tiene ambos
+MODEL_FORMATS = ("json", "pkl")
+
+# Lote sintético para el calentamiento antes de activar una versión
+WARMUP_BATCH_SIZE = 64
+
+
+def _version_number(version: str) -> int:
+    return int(version.lstrip("v"))
+
+
+def discover_model_versions(models_dir: Path = MODELS_DIR) -> List[Dict[str, Any]]:
+    """Pares modelo/metadatos disponibles en models_dir, de la versión más antigua a la más nueva"""
+    if not models_dir.is_dir():
+        return []
+
+    found: Dict[str, Dict[str, Path]] = {}
+    for path in models_dir.iterdir():
+        match = MODEL_FILE_PATTERN.match(path.name)
+        if match:
+            found.setdefault(match.group(1), {})[match.group(2)] = path
+
+    versions = []
+    for version, files in found.items():
+        metadata_path = models_dir / f"model_metadata_{version}.json"
+        if not metadata_path.exists():
+            metadata_path = models_dir / SHARED_METADATA_FILE
+        if not metadata_path.exists():
+            logger.warning(f"⚠️ {version} no tiene archivo de metadatos, se omite")
+            continue
+
+        model_format = next(fmt for fmt in MODEL_FORMATS if fmt in files)
+        versions.append({
+            "version": version,
+            "model_path": files[model_format],
+            "metadata_path": metadata_path,
+            "format": model_format
+        })
+
+    versions.sort(key=lambda v: _version_number(v["version"]))
+    return versions
+
+
+class LoadedModel:
+    """Una versión cargada: modelo, metadatos y encoder que se usan juntos"""
+
+    def __init__(self, version: str, model: Any, metadata: Dict[str, Any],
+                 model_path: Optional[Path] = None, metadata_path: Optional[Path] = None):
+        self.version = version
+        self.model = model
+        self.metadata = metadata
+        self.feature_names: List[str] = metadata.get("feature_names", [])
+        self.encoder = FeatureEncoder(self.feature_names, metadata.get("category_mappings"))
+        self.model_path = model_path
+        self.metadata_path = metadata_path
+        self.loaded_at = datetime.now()
+        self.load_seconds: Optional[float] = None
+        self.memory_bytes: Optional[int] = None
+
+    @property
+    def demo_mode(self) -> bool:
+        return self.model is None
+
+    @property
+    def engine(self) -> Optional[str]:
+        if self.model is None:
+            return None
+        return "numpy" if isinstance(self.model, TreeEnsemble) else "xgboost"
+
+    def predict_proba(self, frame: pd.DataFrame) -> np.ndarray:
+        """Probabilidad de la clase positiva para un DataFrame de clientes"""
+        X = self.encoder.encode(frame)
+        if hasattr(self.model, "predict_proba"):
+            probs = self.model.predict_proba(X)[:, 1]
+        else:
+            # Si es un booster directo
+            probs = self.model.predict(X)
+        return np.asarray(probs, dtype=float)
+
+    def set_categories(self, values: Dict[str, Iterable]) -> None:
+        """Fijar los diccionarios de categorías de esta versión (reemplazo atómico del encoder)"""
+        self.encoder = self.encoder.with_categories(values)
+
+    def warm_up(self, batch_size: int = WARMUP_BATCH_SIZE) -> None:
+        """Predecir un lote sintético y validar que las probabilidades sean válidas"""
+        rng = np.random.default_rng(0)
+        frame = pd.DataFrame({
+            "venta": rng.uniform(0, 50000, batch_size),
+            "costo": rng.uniform(0, 40000, batch_size),
+            "mb": rng.uniform(-1000, 10000, batch_size),
+            "cantidad": rng.uniform(0, 500, batch_size),
+            "p_venta": rng.uniform(0, 100, batch_size),
+            "c_unit": rng.uniform(0, 80, batch_size),
+            "tipo_de_cliente": rng.choice(["Fabricante químicos", "Distribuidor"], batch_size),
+            "categoria": rng.choice(["RESINAS", "SOLVENTES"], batch_size)
+        })
+        probs = self.predict_proba(frame)
+        if probs.shape != (batch_size,) or not np.all(np.isfinite(probs)) \
+                or probs.min() < 0 or probs.max() > 1:
+            raise ValueError(f"El calentamiento de {self.version} devolvió probabilidades inválidas")
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "model_version": self.metadata.get("model_version"),
+            "training_date": self.metadata.get("training_date"),
+            "model_file": self.model_path.name if self.model_path else None,
+            "metadata_file": self.metadata_path.name if self.metadata_path else None,
+            "inference_engine": self.engine,
+            "demo_mode": self.demo_mode,
+            "loaded_at": self.loaded_at.isoformat(),
+            "load_seconds": round(self.load_seconds, 4) if self.load_seconds is not None else None,
+            "memory_bytes": self.memory_bytes
+        }
+
+
+def _load_model_file(model_path: Path, model_format: str) -> Any:
+    """Cargar el archivo del modelo; el JSON usa el evaluador NumPy y xgboost solo como respaldo"""
+    if model_format == "json":
+        try:
+            return TreeEnsemble.from_json(str(model_path))
+        except Exception as e:
+            logger.warning(f"⚠️ Evaluador NumPy no pudo cargar {model_path.name}: {e}")
+            import xgboost as xgb
+            model = xgb.XGBClassifier()
+            model.load_model(str(model_path))
+            return model
+
+    import pickle
+    with open(model_path, "rb") as f:
+        return pickle.load(f)
+
+
+def load_model_version(entry: Dict[str, Any], warm_up: bool = True) -> LoadedModel:
+    """Cargar, calentar y medir una versión devuelta por discover_model_versions"""
+    start = time.perf_counter()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+
+    try:
+        with open(entry["metadata_path"], "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        model = _load_model_file(entry["model_path"], entry["format"])
+        loaded = LoadedModel(entry["version"], model, metadata, entry["model_path"], entry["metadata_path"])
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    loaded.memory_bytes = model.memory_bytes() if isinstance(model, TreeEnsemble) else max(after - before, 0)
+    if warm_up:
+        loaded.warm_up()
+    loaded.load_seconds = time.perf_counter() - start
+
+    logger.info(f"✅ Modelo {entry['version']} cargado desde {entry['model_path'].name} "
+                f"({loaded.engine}, {loaded.load_seconds:.3f}s, {loaded.memory_bytes:,} bytes)")
+    return loaded
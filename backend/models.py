@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, func, text, DECIMAL
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Float, Date, DateTime, Text, Index, func, text, DECIMAL
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -28,8 +28,8 @@ engine = create_engine(
     echo=False,
     pool_pre_ping=True,
     pool_recycle=300,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
     connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
 )
 
@@ -100,6 +100,14 @@ class ClientData(Base):
     date = Column(DateTime, nullable=True)                          # Mapea a 'fecha' convertida
     description = Column(Text, nullable=True)                      # Campo libre
     
+    # Fecha tipada (parseada una sola vez al cargar) para analítica
+    fecha_date = Column(Date, nullable=True)        # 'fecha' como DATE
+    year_month = Column(String(7), nullable=True)   # 'YYYY-MM' derivado de fecha_date
+    
+    # Claves de deduplicación para cargas incrementales
+    row_key = Column(BigInteger, nullable=True)     # Hash de (factura, codigo, sku, fecha)
+    row_hash = Column(BigInteger, nullable=True)    # Hash del contenido de la fila
+    
     def __repr__(self):
         return f"<ClientData(id={self.id}, cliente='{self.cliente}', factura='{self.factura}', venta={self.venta})>"
 
@@ -167,6 +175,159 @@ class AuthorizedEmail(Base):
     def __repr__(self):
         return f"<AuthorizedEmail(id={self.id}, email='{self.email}')>"
 
+# Resumen precalculado de client_data para /analytics/summary
+class AnalyticsSummary(Base):
+    __tablename__ = "analytics_summary"
+    
+    id = Column(Integer, primary_key=True)
+    total_records = Column(Integer, default=0)
+    unique_clients = Column(Integer, default=0)
+    total_sales = Column(Float, default=0.0)
+    total_margin = Column(Float, default=0.0)
+    unique_invoices = Column(Integer, default=0)
+    unique_products = Column(Integer, default=0)
+    top_clients = Column(Text, nullable=True)       # JSON con los 3 clientes de mayor venta
+    dataset_version = Column(Integer, default=0)    # Se incrementa con cada carga o limpieza
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<AnalyticsSummary(total_records={self.total_records}, refreshed_at={self.refreshed_at})>"
+
+# Agregados por cliente y tipo_de_cliente (se reconstruyen al terminar cada carga)
+class ClientRollup(Base):
+    __tablename__ = "client_rollup"
+    
+    id = Column(Integer, primary_key=True)
+    cliente = Column(String(255), nullable=False, index=True)
+    tipo_de_cliente = Column(String(100), nullable=True)
+    num_transacciones = Column(Integer, default=0)
+    num_facturas = Column(Integer, default=0)
+    dias_activos = Column(Integer, default=0)
+    meses_activos = Column(Integer, default=0)
+    cantidad_total = Column(DECIMAL(18,4), default=0)
+    total_ventas = Column(DECIMAL(18,4), default=0, index=True)
+    total_mb = Column(DECIMAL(18,4), default=0)
+    frecuencia_compra = Column(Float, default=0.0)  # Facturas por mes de actividad
+    primera_compra = Column(Date, nullable=True)
+    ultima_compra = Column(Date, nullable=True)
+    
+    def __repr__(self):
+        return f"<ClientRollup(cliente='{self.cliente}', total_ventas={self.total_ventas})>"
+
+# Agregados por cliente y tipo_cliente (categoría)
+class ClientCategoryRollup(Base):
+    __tablename__ = "client_category_rollup"
+    
+    id = Column(Integer, primary_key=True)
+    cliente = Column(String(255), nullable=False, index=True)
+    tipo_cliente = Column(String(100), nullable=True)
+    num_transacciones = Column(Integer, default=0)
+    num_facturas = Column(Integer, default=0)
+    total_ventas = Column(DECIMAL(18,4), default=0, index=True)
+    total_mb = Column(DECIMAL(18,4), default=0)
+    primera_compra = Column(Date, nullable=True)
+    ultima_compra = Column(Date, nullable=True)
+    
+    def __repr__(self):
+        return f"<ClientCategoryRollup(cliente='{self.cliente}', tipo_cliente='{self.tipo_cliente}')>"
+
+# Agregados por producto, categoría y proveedor: base común de los widgets
+# de productos (top_products_6, comparative-bars, pareto-80-20, rotation-speed)
+class ProductRollup(Base):
+    __tablename__ = "product_rollup"
+    
+    id = Column(Integer, primary_key=True)
+    articulo = Column(String(500), nullable=False, index=True)
+    categoria = Column(String(255), nullable=True)
+    proveedor = Column(String(255), nullable=True)
+    # Transacciones con venta > 0
+    num_transacciones = Column(Integer, default=0)
+    num_facturas = Column(Integer, default=0)
+    num_clientes = Column(Integer, default=0)
+    meses_activos = Column(Integer, default=0)
+    cantidad_total = Column(DECIMAL(18,4), default=0)
+    total_ventas = Column(DECIMAL(18,4), default=0, index=True)
+    total_mb = Column(DECIMAL(18,4), default=0)
+    primera_venta = Column(Date, nullable=True)
+    ultima_venta = Column(Date, nullable=True)
+    # Todas las transacciones, devoluciones incluidas (pareto)
+    ventas_netas = Column(DECIMAL(18,4), default=0)
+    cantidad_neta = Column(DECIMAL(18,4), default=0)
+    mb_neto = Column(DECIMAL(18,4), default=0)
+    # Transacciones con venta > 0 y cantidad > 0 (velocidad de rotación)
+    rotacion_facturas = Column(Integer, default=0)
+    rotacion_clientes = Column(Integer, default=0)
+    rotacion_cantidad = Column(DECIMAL(18,4), default=0)
+    rotacion_ventas = Column(DECIMAL(18,4), default=0)
+    rotacion_meses = Column(Integer, default=0)
+    rotacion_dias = Column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<ProductRollup(articulo='{self.articulo}', total_ventas={self.total_ventas})>"
+
+# Puntajes de venta cruzada precalculados al terminar cada carga
+class CrossSellScore(Base):
+    __tablename__ = "cross_sell_scores"
+    __table_args__ = (
+        Index("idx_cross_sell_scores_model_probability", "model_version", "probability"),
+        Index("idx_cross_sell_scores_comercial_probability", "comercial", "probability"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    cliente = Column(String(255), nullable=False, index=True)
+    comercial = Column(String(255), nullable=True)
+    codigo_cliente = Column(String(100), nullable=True)
+    tipo_de_cliente = Column(String(100), nullable=True)
+    tipo_cliente = Column(String(100), nullable=True)
+    categoria = Column(String(255), nullable=True)
+    supercategoria = Column(String(255), nullable=True)
+    proveedor = Column(String(255), nullable=True)
+    num_transacciones = Column(Integer, default=0)
+    num_facturas = Column(Integer, default=0)
+    cantidad_total = Column(Float, default=0.0)
+    venta_total = Column(Float, default=0.0)
+    costo_total = Column(Float, default=0.0)
+    mb_total = Column(Float, default=0.0)
+    primera_compra = Column(Date, nullable=True)
+    ultima_compra = Column(Date, nullable=True)
+    
+    probability = Column(Float, nullable=False)
+    prediction = Column(Integer, nullable=False)
+    priority = Column(String(20), nullable=True)
+    confidence = Column(String(20), nullable=True)
+    threshold = Column(Float, nullable=True)
+    demo_mode = Column(Boolean, default=False)
+    model_version = Column(String(50), nullable=False)
+    dataset_version = Column(Integer, nullable=True)
+    scored_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<CrossSellScore(cliente='{self.cliente}', probability={self.probability})>"
+
+# Índices adicionales de client_data (migración y recarga por staging)
+CLIENT_DATA_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_client_data_fecha ON client_data(fecha)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_cliente ON client_data(cliente)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_factura ON client_data(factura)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_codigo ON client_data(codigo)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_proveedor ON client_data(proveedor)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_venta ON client_data(venta)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_comercial ON client_data(comercial)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_categoria ON client_data(categoria)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_supercategoria ON client_data(supercategoria)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_client_data_row_key_unique ON client_data(row_key)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_fecha_date ON client_data(fecha_date)",
+    "CREATE INDEX IF NOT EXISTS idx_client_data_year_month ON client_data(year_month)"
+]
+
+# Cada clave natural (row_key) pertenece a la última fila cargada con ella;
+# las anteriores la pierden (NULL) y conservan su row_hash
+RELEASE_DUPLICATE_ROW_KEYS_SQL = """
+    UPDATE {table} SET row_key = NULL
+    WHERE row_key IS NOT NULL
+    AND id NOT IN (SELECT MAX(id) FROM {table} WHERE row_key IS NOT NULL GROUP BY row_key)
+"""
+
 def create_tables():
     """Función para crear todas las tablas incluyendo clients"""
     try:
@@ -236,7 +397,11 @@ def migrate_add_new_columns():
             ("tipo_cliente", "VARCHAR(100)"),
             ("categoria", "VARCHAR(255)"),
             ("supercategoria", "VARCHAR(255)"),
-            ("cruce", "VARCHAR(10)")
+            ("cruce", "VARCHAR(10)"),
+            ("fecha_date", "DATE"),
+            ("year_month", "VARCHAR(7)"),
+            ("row_key", "BIGINT"),
+            ("row_hash", "BIGINT")
         ]
         
         with engine.connect() as conn:
@@ -275,20 +440,18 @@ def migrate_add_new_columns():
             
             conn.commit()
             
-            # Crear índices importantes
-            indexes = [
-                "CREATE INDEX IF NOT EXISTS idx_client_data_fecha ON client_data(fecha)",
-                "CREATE INDEX IF NOT EXISTS idx_client_data_cliente ON client_data(cliente)",
-                "CREATE INDEX IF NOT EXISTS idx_client_data_factura ON client_data(factura)",
-                "CREATE INDEX IF NOT EXISTS idx_client_data_codigo ON client_data(codigo)",
-                "CREATE INDEX IF NOT EXISTS idx_client_data_proveedor ON client_data(proveedor)",
-                "CREATE INDEX IF NOT EXISTS idx_client_data_venta ON client_data(venta)",
-                "CREATE INDEX IF NOT EXISTS idx_client_data_comercial ON client_data(comercial)",
-                "CREATE INDEX IF NOT EXISTS idx_client_data_categoria ON client_data(categoria)",
-                "CREATE INDEX IF NOT EXISTS idx_client_data_supercategoria ON client_data(supercategoria)"
-            ]
+            # row_key pasa a ser única: liberar las claves repetidas de cargas
+            # anteriores y reemplazar el índice no único
+            try:
+                conn.execute(text(RELEASE_DUPLICATE_ROW_KEYS_SQL.format(table="client_data")))
+                conn.execute(text("DROP INDEX IF EXISTS idx_client_data_row_key"))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.warning(f"  ⚠️  No se pudieron liberar las claves repetidas: {e}")
             
-            for index_sql in indexes:
+            # Crear índices importantes
+            for index_sql in CLIENT_DATA_INDEXES:
                 try:
                     conn.execute(text(index_sql))
                     logger.info(f"  ✅ Índice creado")
@@ -296,7 +459,39 @@ def migrate_add_new_columns():
                     logger.warning(f"  ⚠️  Error creando índice: {e}")
             
             conn.commit()
-            
+
+            # analytics_summary.dataset_version (versión del dataset para los puntajes de ML)
+            if "postgresql" in settings.database_url:
+                summary_columns = [row[0] for row in conn.execute(text(
+                    "SELECT column_name FROM information_schema.columns WHERE table_name = 'analytics_summary'"
+                ))]
+            else:
+                summary_columns = [row[1] for row in conn.execute(text("PRAGMA table_info(analytics_summary)"))]
+            if summary_columns and "dataset_version" not in summary_columns:
+                try:
+                    conn.execute(text("ALTER TABLE analytics_summary ADD COLUMN dataset_version INTEGER DEFAULT 0"))
+                    conn.commit()
+                    logger.info("  ✅ Agregada columna: analytics_summary.dataset_version")
+                except Exception as e:
+                    conn.rollback()
+                    logger.warning(f"  ⚠️  No se pudo agregar dataset_version: {e}")
+
+            # Agregados por cliente/producto con columnas que faltan (p. ej. la
+            # clave anterior sin id): se recrean vacíos y ensure_aggregates los
+            # vuelve a llenar
+            for rollup in (ClientRollup, ProductRollup):
+                if "postgresql" in settings.database_url:
+                    rollup_columns = [row[0] for row in conn.execute(text(
+                        "SELECT column_name FROM information_schema.columns WHERE table_name = :table"
+                    ), {"table": rollup.__tablename__})]
+                else:
+                    rollup_columns = [row[1] for row in conn.execute(text(f"PRAGMA table_info({rollup.__tablename__})"))]
+                if rollup_columns and set(rollup.__table__.columns.keys()) - set(rollup_columns):
+                    rollup.__table__.drop(bind=conn)
+                    rollup.__table__.create(bind=conn)
+                    conn.commit()
+                    logger.info(f"  ✅ Tabla {rollup.__tablename__} recreada con las nuevas columnas")
+
             logger.info(f"✅ Migración completada. {added_count} columnas agregadas")
             
         return True
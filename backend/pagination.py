@@ -0,0 +1,79 @@
+# backend/pagination.py
+"""
+Paginación por cursor y conteos rápidos para los endpoints /client-data.
+
+OFFSET obliga a la base de datos a leer y descartar todas las filas
+anteriores, y count() recorre la tabla en cada página. Con keyset sobre id
+cada página continúa desde el último id devuelto (WHERE id > :ultimo
+ORDER BY id LIMIT :n), que usa la clave primaria y cuesta lo mismo en la
+página 1 y en la 10.000. El cursor que recibe el cliente es opaco
+(base64 de {"id": ultimo_id}).
+
+Modos de conteo de total_count:
+    exact      conteo exacto, guardado en analytics_cache por versión del dataset
+    estimated  estimación del planificador (pg_class.reltuples) en PostgreSQL;
+               en otros motores, el conteo guardado o uno exacto
+    none       sin conteo (total_count es None)
+"""
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Optional
+import base64
+import json
+import logging
+
+from models import ClientData
+from cache import analytics_cache
+
+logger = logging.getLogger(__name__)
+
+COUNT_MODES = ("exact", "estimated", "none")
+
+
+def encode_cursor(last_id: int) -> str:
+    """Cursor opaco que apunta a la fila siguiente a last_id"""
+    payload = json.dumps({"id": int(last_id)}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Último id de un cursor emitido por encode_cursor (400 si no es válido)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded.encode()))["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+
+def next_cursor(records: list, limit: int) -> Optional[str]:
+    """Cursor de la página siguiente, o None si esta página fue la última"""
+    if limit <= 0 or len(records) < limit:
+        return None
+    last = records[-1]
+    return encode_cursor(last["id"] if isinstance(last, dict) else last.id)
+
+
+def count_client_data(db: Session, mode: str = "exact") -> Optional[int]:
+    """total_count de client_data según el modo de conteo"""
+    if mode not in COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count_mode debe ser uno de: {', '.join(COUNT_MODES)}")
+    if mode == "none":
+        return None
+
+    key = ("client_data_count", (), analytics_cache.current_version())
+    found, cached = analytics_cache.get(key)
+    if found:
+        return cached
+
+    if mode == "estimated" and db.get_bind().dialect.name == "postgresql":
+        estimate = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'client_data'::regclass")
+        ).scalar()
+        # reltuples es -1 si la tabla nunca se analizó
+        if estimate is not None and estimate >= 0:
+            return int(estimate)
+
+    total = db.query(ClientData).count()
+    analytics_cache.set(key, total)
+    return total
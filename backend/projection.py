@@ -0,0 +1,114 @@
+# backend/projection.py
+"""
+Proyección de columnas para los endpoints /client-data.
+
+Cargar entidades ClientData completas trae más de 40 columnas (incluida
+description, de tipo Text) y las registra en el identity map de la sesión,
+aunque la respuesta solo use unas pocas. Aquí se arma un select() de Core
+con únicamente las columnas pedidas y cada fila (una tupla) se serializa
+directamente a dict con el conversor de su campo.
+
+El campo id siempre se incluye: lo necesita la paginación por cursor.
+Las columnas internas de la carga incremental (row_key, row_hash) no se
+exponen.
+"""
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from typing import Any, Callable, Dict, List, Optional
+
+from models import ClientData
+
+
+def _decimal(value: Any) -> Optional[float]:
+    return float(value) if value else None
+
+
+def _isoformat(value: Any) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+# Conversores de los campos que no se devuelven tal cual
+FIELD_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "uploaded_at": _isoformat,
+    "date": _isoformat,
+    "fecha_date": _isoformat,
+    "cantidad": _decimal,
+    "p_venta": _decimal,
+    "c_unit": _decimal,
+    "venta": _decimal,
+    "costo": _decimal,
+    "mb": _decimal
+}
+
+# Campos de include_all_fields=True, en el orden de la respuesta
+FULL_FIELDS = [
+    "id", "uploaded_at", "filename",
+    # Campos del CSV
+    "fecha", "tipo_de_venta", "documento", "factura", "codigo", "cliente",
+    "tipo_de_cliente", "sku", "articulo", "proveedor", "almacen", "cantidad",
+    "um", "p_venta", "c_unit", "venta", "costo", "mb", "mb_percent",
+    "sociedad", "bc", "bt", "bu", "bs", "comercial", "tipo_cliente",
+    "categoria", "supercategoria", "cruce",
+    # Campos de compatibilidad
+    "client_name", "client_type", "executive", "product", "value", "date",
+    "description"
+]
+
+# Campos que se pueden pedir en fields: los completos más las columnas
+# tipadas derivadas de fecha
+PROJECTABLE_FIELDS = FULL_FIELDS + ["fecha_date", "year_month"]
+
+# Campos básicos (include_all_fields=False)
+BASIC_FIELDS = [
+    "id", "client_name", "client_type", "executive", "product", "value",
+    "date", "description",
+    # Campos principales del CSV
+    "cliente", "factura", "venta", "fecha", "comercial", "categoria"
+]
+
+
+def resolve_fields(fields: Optional[str], include_all_fields: bool = False) -> List[str]:
+    """
+    Lista de campos a devolver: los de fields (separados por comas) o, si no
+    se indica, los completos o básicos según include_all_fields.
+    """
+    if not fields:
+        return FULL_FIELDS if include_all_fields else BASIC_FIELDS
+
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in PROJECTABLE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(PROJECTABLE_FIELDS)}"
+        )
+    return ["id"] + [name for name in dict.fromkeys(requested) if name != "id"]
+
+
+def select_client_data(fields: List[str]):
+    """select() de Core con solo las columnas de fields, ordenado por id"""
+    return select(*[getattr(ClientData, name) for name in fields]).order_by(ClientData.id)
+
+
+def serialize_rows(rows, fields: List[str]) -> List[Dict[str, Any]]:
+    """Convertir las tuplas de select_client_data en dicts de respuesta"""
+    converters = [FIELD_CONVERTERS.get(name) for name in fields]
+    return [
+        {
+            name: convert(value) if convert else value
+            for name, convert, value in zip(fields, converters, row)
+        }
+        for row in rows
+    ]
+
+
+def fetch_client_data(db: Session, fields: List[str], limit: int, offset: int = 0,
+                      after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Página de client_data con las columnas de fields (after_id: paginación por cursor)"""
+    statement = select_client_data(fields)
+    if after_id is not None:
+        statement = statement.where(ClientData.id > after_id)
+    else:
+        statement = statement.offset(offset)
+    return serialize_rows(db.execute(statement.limit(limit)), fields)
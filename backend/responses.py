@@ -0,0 +1,132 @@
+# backend/responses.py
+"""
+Serialización JSON rápida para las respuestas de la API.
+
+Por defecto FastAPI pasa cada dict devuelto por jsonable_encoder (que
+recorre y copia toda la estructura en Python) y luego lo serializa con el
+json de la biblioteca estándar. Aquí:
+
+- FastJSONResponse serializa con orjson, que maneja de forma nativa
+  datetime, date y los tipos de numpy; Decimal se convierte siempre a
+  float, así el tipo JSON de un valor numérico no depende del driver de la
+  base de datos (Decimal en PostgreSQL, float en SQLite). Sin orjson se usa
+  json con el mismo conversor.
+- FastJSONRoute entrega los dicts y listas de los endpoints sin
+  response_model directamente a FastJSONResponse, sin pasar por
+  jsonable_encoder. Los endpoints con response_model se validan igual que
+  antes.
+- apply_layout() ofrece el formato columnar ("layout=columnar") para los
+  gráficos: en vez de una lista de objetos con las claves repetidas en cada
+  punto, un objeto con un arreglo de valores por columna.
+"""
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from fastapi.datastructures import DefaultPlaceholder
+from decimal import Decimal
+from datetime import date, datetime, time
+from typing import Any, Callable, Dict, List, Union
+import functools
+import inspect
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.warning("⚠️ orjson no disponible, se usará json estándar para las respuestas")
+
+
+def _default(obj: Any) -> Any:
+    """Tipos que ni orjson ni json serializan por sí solos"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "tolist"):
+        # Escalares y arreglos de numpy
+        return obj.tolist()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Tipo no serializable a JSON: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serializar content a JSON (bytes)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializada con orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _direct_response(endpoint: Callable, status_code: int) -> Callable:
+    """Envolver endpoint para que sus dicts/listas se respondan sin jsonable_encoder"""
+
+    def respond(result: Any) -> Any:
+        if isinstance(result, (dict, list)):
+            return FastJSONResponse(result, status_code=status_code)
+        return result
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            return respond(await endpoint(*args, **kwargs))
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            return respond(endpoint(*args, **kwargs))
+    return wrapper
+
+
+class FastJSONRoute(APIRoute):
+    """
+    Ruta que responde con FastJSONResponse sin jsonable_encoder.
+
+    Solo aplica a endpoints sin response_model (ni explícito ni por anotación
+    de retorno) y sin código de estado personalizado por decorador.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        response_model = kwargs.get("response_model")
+        status_code = kwargs.get("status_code")
+        inferred = response_model is None or isinstance(response_model, DefaultPlaceholder)
+        no_annotation = inspect.signature(endpoint).return_annotation is inspect.Signature.empty
+        if inferred and no_annotation:
+            endpoint = _direct_response(endpoint, status_code or 200)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def columnar(records: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Lista de objetos -> un arreglo de valores por columna"""
+    if not records:
+        return {}
+    return {key: [record.get(key) for record in records] for key in records[0]}
+
+
+def apply_layout(payload: Union[Dict[str, Any], List[Dict[str, Any]]], layout: str = "rows") -> Any:
+    """
+    Devolver payload en el formato pedido: "rows" (sin cambios) o "columnar".
+
+    Si payload es una lista se convierte entera; si es un dict, se convierte
+    su clave "data".
+    """
+    if layout != "columnar":
+        return payload
+    if isinstance(payload, list):
+        return columnar(payload)
+    if isinstance(payload.get("data"), list):
+        return {**payload, "data": columnar(payload["data"]), "layout": "columnar"}
+    return payload
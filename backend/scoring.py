@@ -0,0 +1,248 @@
+# backend/scoring.py
+"""
+Puntajes de venta cruzada precalculados.
+
+Después de cada carga exitosa (y al limpiar los datos) se agrupa client_data
+por cliente, se evalúa el modelo UNA vez para todo el conjunto y el resultado
+se guarda en cross_sell_scores, etiquetado con la versión del modelo y la del
+dataset (analytics_summary.dataset_version).
+
+Los endpoints de recomendaciones leen esa tabla con un rango indexado sobre
+probability (opcionalmente filtrado por comercial) en lugar de volver a
+ejecutar el modelo en cada request. Si la tabla no tiene puntajes del modelo
+activo para la versión actual del dataset, los endpoints usan el cálculo en
+vivo como respaldo.
+"""
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional
+from datetime import date, datetime
+import logging
+
+from models import CrossSellScore, AnalyticsSummary
+
+logger = logging.getLogger(__name__)
+
+# Clientes agregados con las mismas columnas que el endpoint de recomendaciones
+SCORING_CLIENTS_QUERY = """
+    SELECT
+        cliente,
+        COALESCE(tipo_de_cliente, 'Sin tipo') as tipo_de_cliente,
+        COALESCE(comercial, 'Sin asignar') as comercial,
+        COALESCE(categoria, 'Sin categoría') as categoria,
+        COALESCE(codigo, 'Sin código') as codigo_cliente,
+        COALESCE(proveedor, 'Sin proveedor') as proveedor,
+        MAX(tipo_cliente) as tipo_cliente,
+        MAX(supercategoria) as supercategoria,
+        MAX(sku) as sku,
+        COUNT(*) as num_transacciones,
+        COUNT(DISTINCT factura) as num_facturas,
+        COALESCE(SUM(cantidad), 0) as cantidad_total,
+        ROUND(COALESCE(SUM(venta), 0), 2) as venta_total,
+        ROUND(COALESCE(SUM(costo), 0), 2) as costo_total,
+        ROUND(COALESCE(SUM(mb), 0), 2) as mb_total,
+        AVG(p_venta) as p_venta,
+        AVG(c_unit) as c_unit,
+        MIN(fecha_date) as primera_compra,
+        MAX(fecha_date) as ultima_compra
+    FROM client_data
+    WHERE cliente IS NOT NULL
+    AND TRIM(cliente) != ''
+    GROUP BY cliente, tipo_de_cliente, comercial, categoria, codigo, proveedor
+    HAVING COALESCE(SUM(venta), 0) > 0
+"""
+
+
+def _as_date(value) -> Optional[date]:
+    """MIN/MAX de fecha_date llega como date (PostgreSQL) o como texto (SQLite)"""
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def current_model_version(service) -> str:
+    """
+    Versión del modelo activo tal como se guarda en cross_sell_scores.
+
+    Es la versión del registro (LoadedModel.version, p. ej. "v2"): varias
+    versiones pueden compartir model_metadata.json y su "model_version".
+    """
+    active = getattr(service, "active", None)
+    if active is not None:
+        return str(active.version)
+    metadata = getattr(service, "model_metadata", None) or {}
+    return str(metadata.get("model_version", "1.0"))
+
+
+def current_dataset_version(db: Session) -> int:
+    """Versión del dataset según la fila de resumen (0 si aún no existe)"""
+    summary = db.query(AnalyticsSummary).filter(AnalyticsSummary.id == 1).first()
+    return (summary.dataset_version or 0) if summary else 0
+
+
+def score_cross_sell(db: Session, service) -> Dict[str, Any]:
+    """
+    Recalcular cross_sell_scores para todos los clientes con el modelo activo.
+
+    Reemplaza la tabla completa dentro de la transacción de la sesión; el
+    llamador hace commit. Sin modelo cargado solo se vacía la tabla.
+    """
+    start = datetime.now()
+    db.execute(CrossSellScore.__table__.delete())
+
+    if not getattr(service, "is_loaded", False):
+        logger.warning("⚠️ Modelo ML no disponible, cross_sell_scores queda vacía")
+        return {"scored_clients": 0, "model_version": None, "dataset_version": None}
+
+    rows = db.execute(text(SCORING_CLIENTS_QUERY)).fetchall()
+    model_version = current_model_version(service)
+    dataset_version = current_dataset_version(db)
+
+    if not rows:
+        return {"scored_clients": 0, "model_version": model_version, "dataset_version": dataset_version}
+
+    client_data = [
+        {
+            "id": i + 1,
+            "cliente": row.cliente,
+            "venta": float(row.venta_total or 0),
+            "costo": float(row.costo_total or 0),
+            "mb": float(row.mb_total or 0),
+            "cantidad": float(row.cantidad_total or 0),
+            "p_venta": float(row.p_venta or 0),
+            "c_unit": float(row.c_unit or 0),
+            "sku": row.sku,
+            "codigo": row.codigo_cliente,
+            "tipo_de_cliente": row.tipo_de_cliente,
+            "tipo_cliente": row.tipo_cliente,
+            "categoria": row.categoria,
+            "supercategoria": row.supercategoria,
+            "comercial": row.comercial
+        }
+        for i, row in enumerate(rows)
+    ]
+
+    predictions = service.predict_cross_sell(client_data)
+    scored_at = datetime.utcnow()
+
+    records = [
+        {
+            "cliente": row.cliente,
+            "comercial": row.comercial,
+            "codigo_cliente": row.codigo_cliente,
+            "tipo_de_cliente": row.tipo_de_cliente,
+            "tipo_cliente": row.tipo_cliente,
+            "categoria": row.categoria,
+            "supercategoria": row.supercategoria,
+            "proveedor": row.proveedor,
+            "num_transacciones": int(row.num_transacciones or 0),
+            "num_facturas": int(row.num_facturas or 0),
+            "cantidad_total": float(row.cantidad_total or 0),
+            "venta_total": float(row.venta_total or 0),
+            "costo_total": float(row.costo_total or 0),
+            "mb_total": float(row.mb_total or 0),
+            "primera_compra": _as_date(row.primera_compra),
+            "ultima_compra": _as_date(row.ultima_compra),
+            "probability": float(pred["probability"]),
+            "prediction": int(pred["prediction"]),
+            "priority": pred.get("priority"),
+            "confidence": pred.get("confidence"),
+            "threshold": pred.get("threshold_used"),
+            "demo_mode": bool(pred.get("demo_mode", False)),
+            "model_version": model_version,
+            "dataset_version": dataset_version,
+            "scored_at": scored_at
+        }
+        for row, pred in zip(rows, predictions)
+    ]
+    db.execute(insert(CrossSellScore.__table__), records)
+
+    elapsed = (datetime.now() - start).total_seconds()
+    logger.info(f"🎯 {len(records)} clientes puntuados (modelo {model_version}, dataset v{dataset_version}) en {elapsed:.2f}s")
+    return {"scored_clients": len(records), "model_version": model_version, "dataset_version": dataset_version}
+
+
+def get_cross_sell_scores(
+    db: Session,
+    model_version: str,
+    limit: int = 50,
+    min_probability: float = 0.3,
+    comercial: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Leer recomendaciones precalculadas (prediction = 1) ordenadas por probabilidad.
+
+    Devuelve None si no hay puntajes del modelo indicado para la versión
+    actual del dataset (p. ej. el recálculo posterior a una carga falló y se
+    revirtió), para que el endpoint recurra al cálculo en vivo.
+    """
+    filters = "WHERE model_version = :model_version AND dataset_version = :dataset_version"
+    params: Dict[str, Any] = {"model_version": model_version, "dataset_version": current_dataset_version(db)}
+    if comercial and comercial.strip():
+        filters += " AND comercial = :comercial"
+        params["comercial"] = comercial.strip()
+
+    totals = db.execute(text(f"""
+        SELECT COUNT(*) as total_evaluated,
+               COALESCE(SUM(prediction), 0) as total_positive,
+               MAX(dataset_version) as dataset_version,
+               MAX(scored_at) as scored_at
+        FROM cross_sell_scores
+        {filters}
+    """), params).first()
+
+    if not totals or not totals.total_evaluated:
+        has_scores = db.execute(text(
+            "SELECT 1 FROM cross_sell_scores "
+            "WHERE model_version = :model_version AND dataset_version = :dataset_version LIMIT 1"
+        ), {"model_version": model_version, "dataset_version": params["dataset_version"]}).first()
+        if not has_scores:
+            return None
+
+    rows = db.execute(text(f"""
+        SELECT *
+        FROM cross_sell_scores
+        {filters}
+        AND prediction = 1
+        AND probability >= :min_probability
+        ORDER BY probability DESC
+        LIMIT :limit_param
+    """), {**params, "min_probability": min_probability, "limit_param": limit}).fetchall()
+
+    recommendations: List[Dict[str, Any]] = [
+        {
+            "client_id": row.id,
+            "client_name": row.cliente,
+            "probability": row.probability,
+            "prediction": row.prediction,
+            "recommendation": "Sí" if row.prediction == 1 else "No",
+            "priority": row.priority,
+            "threshold_used": row.threshold,
+            "confidence": row.confidence,
+            "venta_actual": row.venta_total,
+            "codigo_cliente": row.codigo_cliente,
+            "tipo_cliente": row.tipo_de_cliente,
+            "categoria": row.categoria,
+            "comercial": row.comercial,
+            "proveedor": row.proveedor,
+            "num_transacciones": row.num_transacciones,
+            "num_facturas": row.num_facturas,
+            "primera_compra": str(row.primera_compra) if row.primera_compra else None,
+            "ultima_compra": str(row.ultima_compra) if row.ultima_compra else None,
+            "cantidad_total": row.cantidad_total,
+            "costo_total": row.costo_total,
+            "mb_total": row.mb_total,
+            "prediction_date": str(row.scored_at) if row.scored_at else None,
+            "model_version": row.model_version,
+            "demo_mode": bool(row.demo_mode)
+        }
+        for row in rows
+    ]
+
+    return {
+        "total_evaluated": int(totals.total_evaluated or 0),
+        "total_positive": int(totals.total_positive or 0),
+        "dataset_version": totals.dataset_version,
+        "scored_at": str(totals.scored_at) if totals.scored_at else None,
+        "recommendations": recommendations
+    }
@@ -0,0 +1,234 @@
+# backend/search.py
+"""
+Búsqueda por subcadena sobre client_data para /client-data/search.
+
+Los filtros de texto (cliente, factura, comercial, categoria, proveedor) son
+ILIKE '%texto%', que un índice B-tree no puede resolver. En PostgreSQL se
+crean índices GIN con pg_trgm sobre esas columnas, que sí sirven ILIKE con
+comodín inicial; el conteo total se corta en SEARCH_COUNT_CAP filas para no
+recorrer todo el resultado solo para contarlo.
+
+En SQLite (desarrollo) se usa un índice n-grama en memoria: por columna se
+guardan los valores distintos en minúsculas, los trigramas de cada valor y
+las filas de cada valor. Una búsqueda intersecta las listas de los
+trigramas del texto, verifica la subcadena solo en los valores candidatos y
+devuelve sus ids. El índice se reconstruye cuando cambia la versión del
+dataset (analytics_cache.current_version(), que cada carga o limpieza incrementa).
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+import threading
+import logging
+import time
+
+from models import ClientData
+from cache import analytics_cache
+from pagination import count_client_data
+
+logger = logging.getLogger(__name__)
+
+# Columnas con filtro por subcadena en /client-data/search
+SEARCH_COLUMNS = ["cliente", "factura", "comercial", "categoria", "proveedor"]
+
+# Índices GIN de trigramas (PostgreSQL, extensión pg_trgm)
+TRIGRAM_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS idx_client_data_{column}_trgm ON client_data USING gin ({column} gin_trgm_ops)"
+    for column in SEARCH_COLUMNS
+]
+
+# Máximo de filas que se cuentan para total_count
+SEARCH_COUNT_CAP = 10000
+
+NGRAM_SIZE = 3
+
+
+def _escape_like(value: str) -> str:
+    """Escapar los comodines de LIKE para buscar el texto literal"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_conditions(filters: Dict[str, Optional[str]], fecha_desde: Optional[str] = None,
+                      fecha_hasta: Optional[str] = None) -> list:
+    """Condiciones WHERE de una búsqueda: ILIKE por subcadena y rango de fecha"""
+    conditions = [
+        getattr(ClientData, column).ilike(f"%{_escape_like(term)}%", escape="\\")
+        for column, term in filters.items() if term
+    ]
+    if fecha_desde:
+        conditions.append(ClientData.fecha >= fecha_desde)
+    if fecha_hasta:
+        conditions.append(ClientData.fecha <= fecha_hasta)
+    return conditions
+
+
+def _ngrams(value: str, size: int = NGRAM_SIZE) -> set:
+    return {value[i:i + size] for i in range(len(value) - size + 1)}
+
+
+class ColumnNGramIndex:
+    """Índice n-grama de una columna: valores distintos, sus trigramas y sus filas"""
+
+    def __init__(self, ids: np.ndarray, values: pd.Series, size: int = NGRAM_SIZE):
+        self.size = size
+        codes, uniques = pd.factorize(values.str.lower(), use_na_sentinel=True)
+        self.values: List[str] = list(uniques)
+
+        # Filas agrupadas por valor: ids ordenados por código + desplazamientos
+        valid = codes >= 0
+        order = np.argsort(codes[valid], kind="stable")
+        self.row_ids = ids[valid][order]
+        counts = np.bincount(codes[valid], minlength=len(self.values))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        postings: Dict[str, List[int]] = {}
+        for code, value in enumerate(self.values):
+            for gram in _ngrams(value, size):
+                postings.setdefault(gram, []).append(code)
+        self.postings = {gram: np.asarray(codes_, dtype=np.int64) for gram, codes_ in postings.items()}
+
+    def matching_values(self, term: str) -> List[int]:
+        """Códigos de los valores que contienen term (sin distinguir mayúsculas)"""
+        term = term.lower()
+        grams = _ngrams(term, self.size)
+        if grams:
+            lists = sorted((self.postings.get(gram) for gram in grams), key=lambda p: 0 if p is None else len(p))
+            if lists[0] is None:
+                return []
+            candidates = lists[0]
+            for posting in lists[1:]:
+                candidates = np.intersect1d(candidates, posting, assume_unique=True)
+                if len(candidates) == 0:
+                    return []
+        else:
+            # Texto más corto que un n-grama: revisar todos los valores distintos
+            candidates = range(len(self.values))
+        return [int(code) for code in candidates if term in self.values[code]]
+
+    def search(self, term: str) -> np.ndarray:
+        """Ids (ordenados) de las filas cuyo valor contiene term"""
+        codes = self.matching_values(term)
+        if not codes:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([self.row_ids[self.offsets[c]:self.offsets[c + 1]] for c in codes]))
+
+    def memory_bytes(self) -> int:
+        return int(self.row_ids.nbytes + self.offsets.nbytes + sum(p.nbytes for p in self.postings.values()))
+
+
+class ClientDataSearch:
+    """Búsqueda por subcadena con trigramas de PostgreSQL o índice n-grama en memoria"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes: Dict[str, ColumnNGramIndex] = {}
+        self.version: Optional[int] = None
+
+    def ensure_indexes(self, db: Session) -> bool:
+        """Crear pg_trgm y los índices GIN de búsqueda (solo PostgreSQL)"""
+        if db.get_bind().dialect.name != "postgresql":
+            return False
+        try:
+            db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for index_sql in TRIGRAM_INDEXES:
+                db.execute(text(index_sql))
+            db.commit()
+            logger.info("✅ Índices de trigramas para búsqueda listos")
+            return True
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"⚠️ No se pudieron crear los índices pg_trgm (la búsqueda usará escaneo): {e}")
+            return False
+
+    def _ngram_indexes(self, db: Session) -> Dict[str, ColumnNGramIndex]:
+        """Índices en memoria de la versión actual del dataset (se reconstruyen si cambió)"""
+        version = analytics_cache.current_version()
+        with self.lock:
+            if self.version != version:
+                started = time.perf_counter()
+                frame = pd.read_sql(text(f"SELECT id, {', '.join(SEARCH_COLUMNS)} FROM client_data"), db.connection())
+                ids = frame["id"].to_numpy(dtype=np.int64)
+                self.indexes = {column: ColumnNGramIndex(ids, frame[column].astype("string")) for column in SEARCH_COLUMNS}
+                self.version = version
+                logger.info(f"🔎 Índice n-grama construido: {len(ids)} filas en {time.perf_counter() - started:.2f}s "
+                            f"({sum(i.memory_bytes() for i in self.indexes.values()):,} bytes)")
+            return self.indexes
+
+    def search(
+        self,
+        db: Session,
+        filters: Dict[str, Optional[str]],
+        fecha_desde: Optional[str] = None,
+        fecha_hasta: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0,
+        after_id: Optional[int] = None
+    ) -> Tuple[int, bool, List[ClientData]]:
+        """
+        Buscar filas de client_data, ordenadas por id.
+
+        Con after_id (paginación por cursor) la página empieza después de ese
+        id y offset se ignora; total_count sigue siendo el de toda la búsqueda.
+        Devuelve (total_count, total_capped, registros de la página);
+        total_capped indica que total_count se cortó en SEARCH_COUNT_CAP.
+        """
+        filters = {column: term for column, term in filters.items() if term}
+        if db.get_bind().dialect.name == "postgresql":
+            return self._search_sql(db, filters, fecha_desde, fecha_hasta, limit, offset, after_id)
+        return self._search_ngram(db, filters, fecha_desde, fecha_hasta, limit, offset, after_id)
+
+    def _search_sql(self, db, filters, fecha_desde, fecha_hasta, limit, offset, after_id):
+        query = db.query(ClientData).filter(*search_conditions(filters, fecha_desde, fecha_hasta))
+
+        # Conteo acotado: se detiene al llegar al tope en lugar de contar todo
+        capped_ids = query.with_entities(ClientData.id).limit(SEARCH_COUNT_CAP + 1).subquery()
+        total_count = db.query(func.count()).select_from(capped_ids).scalar()
+        capped = total_count > SEARCH_COUNT_CAP
+
+        query = query.order_by(ClientData.id)
+        if after_id is not None:
+            query = query.filter(ClientData.id > after_id)
+        else:
+            query = query.offset(offset)
+        records = query.limit(limit).all()
+        return min(total_count, SEARCH_COUNT_CAP), capped, records
+
+    def _search_ngram(self, db, filters, fecha_desde, fecha_hasta, limit, offset, after_id):
+        ids: Optional[np.ndarray] = None
+        if filters:
+            indexes = self._ngram_indexes(db)
+            for column, term in filters.items():
+                matches = indexes[column].search(term)
+                ids = matches if ids is None else np.intersect1d(ids, matches, assume_unique=True)
+                if len(ids) == 0:
+                    return 0, False, []
+
+        if fecha_desde or fecha_hasta:
+            date_query = db.query(ClientData.id)
+            if fecha_desde:
+                date_query = date_query.filter(ClientData.fecha >= fecha_desde)
+            if fecha_hasta:
+                date_query = date_query.filter(ClientData.fecha <= fecha_hasta)
+            date_ids = np.fromiter((row.id for row in date_query), dtype=np.int64)
+            ids = np.unique(date_ids) if ids is None else np.intersect1d(ids, date_ids)
+
+        if ids is None:
+            # Sin filtros: página directa sobre la tabla
+            total_count = count_client_data(db)
+            query = db.query(ClientData).order_by(ClientData.id)
+            if after_id is not None:
+                query = query.filter(ClientData.id > after_id)
+            else:
+                query = query.offset(offset)
+            return total_count, False, query.limit(limit).all()
+
+        start = int(np.searchsorted(ids, after_id, side="right")) if after_id is not None else offset
+        page_ids = [int(i) for i in ids[start:start + limit]]
+        rows = {row.id: row for row in db.query(ClientData).filter(ClientData.id.in_(page_ids)).all()} if page_ids else {}
+        return len(ids), False, [rows[i] for i in page_ids if i in rows]
+
+
+# Instancia global usada por /client-data/search
+search_engine = ClientDataSearch()
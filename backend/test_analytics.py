@@ -0,0 +1,34 @@
+# backend/test_analytics.py
+"""Pruebas de los endpoints de analítica de clientes (SQLite)"""
+from conftest import build_csv_rows, write_csv
+
+TREND = "/clients/analytics/acquisition-trend"
+TYPES = "/clients/analytics/client-type-analysis"
+
+
+def test_empty_table_reports_no_data(client):
+    trend = client.get(TREND).json()
+    assert trend["success"] is False
+    assert trend["error_type"] == "NO_DATA"
+    assert client.get(TYPES).json() == {"success": False, "message": "No hay datos en la tabla client_data", "data": []}
+
+
+def test_trend_and_types_come_from_a_single_aggregate(client):
+    client.post("/upload-csv", files={"file": ("ventas.csv", write_csv(build_csv_rows(30)), "text/csv")})
+
+    trend = client.get(TREND).json()
+    assert trend["success"] is True
+    assert trend["total_records_analyzed"] == 30
+    assert sum(item["nuevos_clientes"] for item in trend["data"]) == 7
+
+    types = client.get(TYPES).json()
+    assert types["success"] is True
+    assert sum(item["num_transacciones"] for item in types["data"]) == 30
+
+
+def test_trend_and_types_run_in_the_analytics_pool(client):
+    from executors import bounded_executor
+    completed = bounded_executor.stats()["analytics"]["completed"]
+    client.get(TREND)
+    client.get(TYPES)
+    assert bounded_executor.stats()["analytics"]["completed"] == completed + 2
@@ -0,0 +1,68 @@
+# backend/test_cache.py
+"""Pruebas de la caché de analítica y su versionado por dataset (SQLite)"""
+from sqlalchemy import text
+
+from conftest import build_csv_rows, write_csv
+from cache import analytics_cache
+
+BARS = "/products/analytics/comparative-bars"
+
+
+def upload(client, rows):
+    response = client.post("/upload-csv", files={"file": ("ventas.csv", write_csv(rows), "text/csv")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def cached_endpoints():
+    return {key[0] for key in analytics_cache.entries}
+
+
+def test_results_are_cached_until_upload_or_clear(client):
+    upload(client, build_csv_rows(30))
+    first = client.get(BARS).json()
+    hits = analytics_cache.hits
+    assert client.get(BARS).json() == first
+    assert analytics_cache.hits == hits + 1
+
+    # Otra carga cambia las ventas: el resultado guardado no debe servirse
+    rows = build_csv_rows(30)
+    for row in rows:
+        row[15] = "5000.00"
+    version = analytics_cache.version
+    upload(client, rows)
+    assert analytics_cache.version > version
+    after_upload = client.get(BARS).json()
+    assert after_upload != first
+    assert all(item["total_ventas"] >= 5000 for item in after_upload)
+
+    client.delete("/client-data/clear")
+    assert client.get(BARS).json() == []
+
+
+def test_version_written_by_another_instance_invalidates_cache(client):
+    upload(client, build_csv_rows(30))
+    client.get(BARS)
+    assert "get_products_comparative_bars" in cached_endpoints()
+
+    # Otra instancia confirmó una carga: solo cambia la versión persistida
+    from models import engine
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE analytics_summary SET dataset_version = dataset_version + 1 WHERE id = 1"))
+
+    ttl = analytics_cache.version_ttl
+    analytics_cache.version_ttl = 0
+    try:
+        misses = analytics_cache.misses
+        client.get(BARS)
+        assert analytics_cache.misses == misses + 1
+    finally:
+        analytics_cache.version_ttl = ttl
+
+
+def test_fallback_payloads_are_not_cached(client):
+    upload(client, build_csv_rows(30))
+    # La consulta de rotación usa GREATEST (solo PostgreSQL): en SQLite cae a los datos de ejemplo
+    response = client.get("/products/analytics/rotation-speed").json()
+    assert response["fallback"] is True
+    assert "get_rotation_speed" not in cached_endpoints()
@@ -0,0 +1,68 @@
+# backend/test_client_data.py
+"""Pruebas de paginación y proyección de /client-data (SQLite)"""
+from conftest import build_csv_rows, write_csv
+
+
+def upload(client, count):
+    response = client.post("/upload-csv", files={"file": ("ventas.csv", write_csv(build_csv_rows(count)), "text/csv")})
+    assert response.status_code == 200, response.text
+
+
+def collect_pages(client, path, limit, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        query = {"limit": limit, **params, **({"cursor": cursor} if cursor else {})}
+        body = client.get(path, params=query).json()
+        ids += [row["id"] for row in body["data"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+def test_cursor_pages_cover_every_row_once(client):
+    upload(client, 53)
+    all_ids = [row["id"] for row in client.get("/client-data", params={"limit": 1000}).json()["data"]]
+
+    ids, pages = collect_pages(client, "/client-data", 10)
+    assert ids == sorted(all_ids)
+    assert len(ids) == 53
+    assert pages == 6
+
+    # Las páginas por cursor coinciden con las de offset
+    for offset in (0, 20, 50):
+        by_offset = client.get("/client-data", params={"limit": 10, "offset": offset}).json()["data"]
+        assert [row["id"] for row in by_offset] == ids[offset:offset + 10]
+
+
+def test_search_cursor_pages_match_the_full_result(client):
+    upload(client, 60)
+    full = client.get("/client-data/search", params={"cliente": "cliente 3", "limit": 1000}).json()
+    expected = [row["id"] for row in full["data"]]
+    assert full["total_count"] == len(expected) > 0
+
+    ids, _ = collect_pages(client, "/client-data/search", 3, cliente="cliente 3")
+    assert ids == expected
+
+
+def test_invalid_cursor_is_rejected(client):
+    upload(client, 5)
+    assert client.get("/client-data", params={"cursor": "no-es-un-cursor"}).status_code == 400
+
+
+def test_projection_returns_only_requested_fields(client):
+    upload(client, 5)
+    body = client.get("/client-data/full", params={"fields": "fecha_date,year_month,venta", "limit": 2}).json()
+    assert body["fields"] == ["id", "fecha_date", "year_month", "venta"]
+    first = body["data"][0]
+    assert set(first) == {"id", "fecha_date", "year_month", "venta"}
+    assert first["fecha_date"].startswith(first["year_month"])
+    assert isinstance(first["venta"], float)
+
+
+def test_projection_hides_internal_columns(client):
+    upload(client, 5)
+    for field in ("row_key", "row_hash"):
+        assert client.get("/client-data/full", params={"fields": field}).status_code == 400
+    full = client.get("/client-data/full", params={"limit": 1}).json()["data"][0]
+    assert "row_key" not in full and "row_hash" not in full
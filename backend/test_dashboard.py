@@ -0,0 +1,81 @@
+# backend/test_dashboard.py
+"""Pruebas de /dashboard/bundle (SQLite)"""
+import pytest
+from sqlalchemy import event, text
+
+from conftest import CSV_HEADER, build_csv_rows, write_csv
+from cache import analytics_cache
+from models import engine
+
+
+def test_bundle_shares_the_endpoint_cache(client):
+    client.post("/upload-csv", files={"file": ("ventas.csv", write_csv(build_csv_rows(30)), "text/csv")})
+    # sales-by-type-detailed consulta information_schema (solo PostgreSQL)
+    widgets = "acquisition-trend,client-type-analysis"
+
+    bundle = client.get("/dashboard/bundle", params={"widgets": widgets}).json()
+    assert bundle["success"] is True
+    assert bundle["degraded"] == []
+
+    hits = analytics_cache.hits
+    assert client.get("/clients/analytics/acquisition-trend").json() == bundle["widgets"]["acquisition-trend"]
+    assert client.get("/clients/analytics/client-type-analysis").json() == bundle["widgets"]["client-type-analysis"]
+    assert analytics_cache.hits == hits + 2
+
+
+def test_bundle_is_not_successful_with_fallback_widgets(client):
+    client.post("/upload-csv", files={"file": ("ventas.csv", write_csv(build_csv_rows(30)), "text/csv")})
+
+    # rotation-speed usa GREATEST (solo PostgreSQL): en SQLite devuelve datos de ejemplo
+    bundle = client.get("/dashboard/bundle", params={"widgets": "comparative-bars,rotation-speed"}).json()
+    assert bundle["widgets"]["rotation-speed"]["fallback"] is True
+    assert bundle["degraded"] == ["rotation-speed"]
+    assert bundle["success"] is False
+
+
+@pytest.fixture
+def sqlite_greatest():
+    """GREATEST/LEAST de PostgreSQL en las conexiones SQLite (rotation-speed)"""
+    def register(dbapi_connection, _):
+        dbapi_connection.create_function("GREATEST", -1, max)
+        dbapi_connection.create_function("LEAST", -1, min)
+
+    event.listen(engine, "connect", register)
+    engine.dispose()
+    yield
+    event.remove(engine, "connect", register)
+    engine.dispose()
+
+
+def test_product_widgets_are_derived_from_the_product_rollup(client, db, sqlite_greatest):
+    rows = build_csv_rows(200)
+    # Devolución: cuenta en el pareto (ventas netas) pero no en los demás widgets
+    rows[0][CSV_HEADER.index("Venta")] = "-80.00"
+    client.post("/upload-csv", files={"file": ("ventas.csv", write_csv(rows), "text/csv")})
+
+    netas = {(articulo, categoria): total for articulo, categoria, total in db.execute(text("""
+        SELECT articulo, categoria, SUM(venta) FROM client_data GROUP BY articulo, categoria
+    """))}
+    facturas = {}
+    for articulo, proveedor, count in db.execute(text("""
+        SELECT articulo, proveedor, COUNT(DISTINCT factura) FROM client_data
+        WHERE venta > 0 AND cantidad > 0 GROUP BY articulo, categoria, proveedor
+    """)):
+        facturas.setdefault((articulo, proveedor), set()).add(count)
+
+    widgets = "top_products_6,comparative-bars,pareto-80-20,rotation-speed"
+    bundle = client.get("/dashboard/bundle", params={"widgets": widgets}).json()
+    assert bundle["success"] is True
+
+    for item in bundle["widgets"]["pareto-80-20"]["data"]:
+        assert item["total_ventas"] == pytest.approx(float(netas[(item["producto"], item["categoria"])]))
+    rotation = bundle["widgets"]["rotation-speed"]["data"]
+    assert rotation
+    for item in rotation:
+        assert item["total_facturas"] in facturas[(item["producto"], item["proveedor"])]
+
+    # Sin volver a agrupar client_data: vaciarla no cambia los widgets
+    db.execute(text("DELETE FROM client_data"))
+    db.commit()
+    analytics_cache.entries.clear()
+    assert client.get("/dashboard/bundle", params={"widgets": widgets}).json()["widgets"] == bundle["widgets"]
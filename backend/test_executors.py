@@ -0,0 +1,53 @@
+# backend/test_executors.py
+"""Pruebas de los pools de hilos por categoría"""
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from executors import BoundedExecutor
+
+
+def test_full_queue_is_rejected_with_503():
+    executor = BoundedExecutor({"analytics": 1}, max_queue=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return "ok"
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run("analytics", blocking))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        queued = asyncio.ensure_future(executor.run("analytics", lambda: "queued"))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(HTTPException) as rejected:
+            await executor.run("analytics", lambda: "rejected")
+        assert rejected.value.status_code == 503
+
+        release.set()
+        return await running, await queued
+
+    assert asyncio.run(scenario()) == ("ok", "queued")
+    stats = executor.stats()["analytics"]
+    assert (stats["completed"], stats["rejected"], stats["queue_depth"]) == (2, 1, 0)
+
+
+def test_offload_keeps_the_endpoint_signature():
+    executor = BoundedExecutor({"db": 2})
+
+    @executor.offload("db")
+    def endpoint(limit: int = 10):
+        """Docstring del endpoint"""
+        return threading.current_thread().name, limit
+
+    thread_name, limit = asyncio.run(endpoint(limit=3))
+    assert thread_name.startswith("exec-db")
+    assert limit == 3
+    assert endpoint.__doc__ == "Docstring del endpoint"
+    assert asyncio.iscoroutinefunction(endpoint)
@@ -0,0 +1,67 @@
+# backend/test_export.py
+"""Pruebas de /client-data/export en CSV, NDJSON y Parquet (SQLite)"""
+import csv
+import io
+import json
+
+import pytest
+
+from conftest import build_csv_rows, write_csv
+from projection import FULL_FIELDS
+
+ROWS = 47
+
+
+@pytest.fixture
+def loaded(client):
+    response = client.post("/upload-csv", files={"file": ("ventas.csv", write_csv(build_csv_rows(ROWS)), "text/csv")})
+    assert response.status_code == 200, response.text
+    return client
+
+
+def test_csv_export_row_count(loaded):
+    response = loaded.get("/client-data/export", params={"format": "csv"})
+    assert response.status_code == 200
+    assert "client_data.csv" in response.headers["content-disposition"]
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == FULL_FIELDS
+    assert len(rows) == ROWS + 1
+
+
+def test_ndjson_export_row_count_and_filters(loaded):
+    response = loaded.get("/client-data/export", params={"format": "ndjson", "fields": "cliente,venta"})
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert len(records) == ROWS
+    assert set(records[0]) == {"id", "cliente", "venta"}
+    assert len({record["id"] for record in records}) == ROWS
+
+    filtered = loaded.get("/client-data/export", params={"format": "ndjson", "cliente": "Cliente 2"})
+    expected = sum(1 for i in range(ROWS) if i % 7 == 2)
+    assert len(filtered.text.splitlines()) == expected
+
+
+def test_parquet_export_row_count(loaded):
+    pq = pytest.importorskip("pyarrow.parquet")
+    response = loaded.get("/client-data/export", params={"format": "parquet", "fields": "fecha,venta,uploaded_at"})
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == ROWS
+    assert table.column_names == ["id", "fecha", "venta", "uploaded_at"]
+    assert sum(table.column("venta").to_pylist()) == pytest.approx(
+        sum(100 + (i % 17) * 25.5 for i in range(ROWS))
+    )
+
+
+def test_empty_export_has_only_the_header(client):
+    response = client.get("/client-data/export", params={"format": "csv", "fields": "cliente"})
+    assert response.text.splitlines() == ["id,cliente"]
+
+
+def test_unknown_format_is_rejected(client):
+    assert client.get("/client-data/export", params={"format": "xlsx"}).status_code == 400
+
+
+def test_export_runs_in_the_db_pool(loaded):
+    from executors import bounded_executor
+    completed = bounded_executor.stats()["db"]["completed"]
+    loaded.get("/client-data/export", params={"format": "csv"})
+    assert bounded_executor.stats()["db"]["completed"] == completed + 1
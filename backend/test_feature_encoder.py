@@ -0,0 +1,64 @@
+# backend/test_feature_encoder.py
+"""Pruebas de los diccionarios de categorías del encoder del modelo (SQLite)"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from conftest import BACKEND_DIR, build_csv_rows, write_csv
+from config import settings
+from feature_encoder import FeatureEncoder
+from ingestion import load_csv_upload
+from ml_service import MLService
+
+METADATA_PATH = BACKEND_DIR.parent / "ml_models" / "model_metadata.json"
+
+
+def feature_names():
+    with open(METADATA_PATH, encoding="utf-8") as f:
+        return json.load(f)["feature_names"]
+
+
+def test_client_codes_do_not_depend_on_the_batch():
+    encoder = FeatureEncoder(feature_names()).with_categories({
+        "Tipo de Cliente": ["Fabricante químicos", "Distribuidor"],
+        "CATEGORIA": ["SOLVENTES", "RESINAS"]
+    })
+    client = {"tipo_de_cliente": "Fabricante químicos", "categoria": "SOLVENTES", "venta": 100.0}
+    other = {"tipo_de_cliente": "Distribuidor", "categoria": "RESINAS", "venta": 50.0}
+
+    alone = encoder.encode(pd.DataFrame([client]))
+    in_batch = encoder.encode(pd.DataFrame([other, client]))
+
+    np.testing.assert_array_equal(alone[0], in_batch[1])
+    index = encoder.categorical["Tipo de Cliente"]
+    assert alone[0, index] == 1.0  # ["Distribuidor", "Fabricante químicos"] ordenados
+    # Categoría desconocida: NaN (missing para el modelo), nunca un código nuevo
+    unknown = encoder.encode(pd.DataFrame([{"tipo_de_cliente": "Otro"}]))
+    assert np.isnan(unknown[0, index])
+
+
+def test_metadata_mappings_are_kept():
+    names = feature_names()
+    encoder = FeatureEncoder(names, {"CATEGORIA": {"RESINAS": 7}}).with_categories({"CATEGORIA": ["SOLVENTES"]})
+    assert encoder.category_mappings["CATEGORIA"] == {"RESINAS": 7}
+
+
+def test_service_builds_mappings_from_client_data(db, monkeypatch):
+    load_csv_upload(db, write_csv(build_csv_rows(30)), "ventas.csv")
+    monkeypatch.setattr(settings, "ml_models_dir", str(METADATA_PATH.parent))
+    service = MLService()
+    assert not service.demo_mode
+    service.refresh_categories(db)
+
+    mappings = service.encoder.category_mappings
+    assert mappings["Tipo de Cliente"] == {"Distribuidor": 0, "Fabricante químicos": 1}
+    assert len(mappings["SKU"]) == 11
+
+    clients = [
+        {"id": 1, "cliente": "Cliente 1", "tipo_de_cliente": "Distribuidor", "categoria": "SOLVENTES", "sku": "SKU1", "venta": 500.0},
+        {"id": 2, "cliente": "Cliente 2", "tipo_de_cliente": "Fabricante químicos", "categoria": "RESINAS", "sku": "SKU9", "venta": 90.0}
+    ]
+    alone = service.predict_cross_sell(clients[:1])[0]["probability"]
+    in_batch = service.predict_cross_sell(clients[::-1])[1]["probability"]
+    assert alone == in_batch
@@ -0,0 +1,296 @@
+# backend/test_ingestion.py
+"""Pruebas del pipeline de ingesta de CSV (SQLite)"""
+import csv
+import io
+import time
+
+import pandas as pd
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import IntegrityError
+
+from conftest import CSV_HEADER, build_csv_rows, write_csv
+from models import ClientData, ClientRollup, ClientCategoryRollup, ProductRollup
+from analytics import get_summary, refresh_rollups
+from ingestion import (
+    COPY_NULL_MARKER, _CopyStream, backfill_row_keys, bulk_load_client_data, load_csv_upload, normalize_dataframe
+)
+
+# Columnas que dependen del momento de la carga
+VOLATILE_COLUMNS = {"id", "uploaded_at"}
+
+
+def stored_rows(db):
+    columns = [column for column in ClientData.__table__.columns if column.name not in VOLATILE_COLUMNS]
+    return db.execute(select(*columns).order_by(ClientData.description)).fetchall()
+
+
+def test_chunk_size_does_not_change_stored_rows(db):
+    # Facturas vacías en algunas filas: con tipos inferidos por bloque, el
+    # bloque con NaN guardaba '1003.0' y el resto '1003'
+    rows = build_csv_rows(40, missing_factura_every=7)
+
+    load_csv_upload(db, write_csv(rows), "ventas.csv", chunk_size=6)
+    small_chunks = stored_rows(db)
+
+    load_csv_upload(db, write_csv(rows), "ventas.csv", chunk_size=1000)
+    single_chunk = stored_rows(db)
+
+    assert len(small_chunks) == 40
+    assert small_chunks == single_chunk
+    assert {"1001", "1039"} <= {row.factura for row in single_chunk}
+    assert not any(row.factura and row.factura.endswith(".0") for row in single_chunk)
+
+
+def test_incremental_reupload_with_other_chunk_size_inserts_nothing(db):
+    rows = build_csv_rows(30, missing_factura_every=7)
+    load_csv_upload(db, write_csv(rows), "ventas.csv", chunk_size=4)
+
+    stats = load_csv_upload(db, write_csv(rows), "ventas.csv", chunk_size=1000, incremental=True)
+
+    assert stats["inserted_rows"] == 0
+    assert stats["updated_rows"] == 0
+    assert stats["skipped_rows"] == 30
+    assert db.query(ClientData).count() == 30
+
+
+def test_incremental_reupload_over_backfilled_rows_updates_nothing(db):
+    # Montos con más decimales que DECIMAL(15,4): la base guarda 4
+    rows = build_csv_rows(25)
+    for i, row in enumerate(rows):
+        row[CSV_HEADER.index("Venta")] = f"{100 + i}.123456"
+        row[CSV_HEADER.index("Cantidad")] = f"{i}.00005"
+    load_csv_upload(db, write_csv(rows), "ventas.csv")
+
+    # Filas de antes de existir row_key/row_hash: se calculan desde los DECIMAL guardados
+    db.execute(text("UPDATE client_data SET row_key = NULL, row_hash = NULL"))
+    db.commit()
+    assert backfill_row_keys(db) == 25
+
+    stats = load_csv_upload(db, write_csv(rows), "ventas.csv", incremental=True)
+    assert (stats["inserted_rows"], stats["updated_rows"], stats["skipped_rows"]) == (0, 0, 25)
+
+
+def key_counts(db):
+    keyed = db.query(func.count(ClientData.row_key)).scalar()
+    distinct = db.query(func.count(func.distinct(ClientData.row_key))).scalar()
+    return keyed, distinct
+
+
+def test_repeated_natural_keys_keep_row_key_unique(db):
+    # Misma factura, código, sku y fecha en dos líneas con distinto monto
+    rows = build_csv_rows(10)
+    repeated = list(rows[3])
+    repeated[CSV_HEADER.index("Venta")] = "777.00"
+    rows.append(repeated)
+
+    load_csv_upload(db, write_csv(rows), "ventas.csv", chunk_size=4)
+    assert db.query(ClientData).count() == 11
+    assert key_counts(db) == (10, 10)
+
+    # La última línea es la dueña de la clave: volver a subir el archivo no cambia nada
+    stats = load_csv_upload(db, write_csv(rows), "ventas.csv", incremental=True)
+    assert (stats["inserted_rows"], stats["updated_rows"]) == (0, 0)
+
+    # Agregar el mismo archivo duplica las filas; las nuevas se quedan con las claves
+    load_csv_upload(db, write_csv(rows), "ventas.csv", replace_data=False)
+    assert db.query(ClientData).count() == 22
+    assert key_counts(db) == (10, 10)
+
+    with pytest.raises(IntegrityError):
+        key = db.query(ClientData.row_key).filter(ClientData.row_key.isnot(None)).first()[0]
+        db.execute(text("UPDATE client_data SET row_key = :key WHERE row_key IS NULL"), {"key": key})
+    db.rollback()
+
+
+def test_incremental_upload_updates_changed_rows_and_inserts_new_ones(db):
+    rows = build_csv_rows(20)
+    load_csv_upload(db, write_csv(rows), "ventas.csv", chunk_size=5)
+
+    # Misma clave natural (factura, codigo, sku, fecha) con otra venta, más 3 filas nuevas
+    changed = [list(row) for row in rows]
+    changed[2][CSV_HEADER.index("Venta")] = "999.00"
+    changed += build_csv_rows(3, start=20)
+
+    stats = load_csv_upload(db, write_csv(changed), "ventas.csv", chunk_size=7, incremental=True)
+
+    assert stats["inserted_rows"] == 3
+    assert stats["updated_rows"] == 1
+    assert stats["skipped_rows"] == 19
+    assert db.query(ClientData).count() == 23
+    updated = db.query(ClientData).filter(ClientData.factura == rows[2][CSV_HEADER.index("Factura")]).one()
+    assert float(updated.venta) == 999.0
+
+
+def test_ingest_refreshes_summary_and_rollups(db):
+    rows = build_csv_rows(50)
+    load_csv_upload(db, write_csv(rows), "ventas.csv", chunk_size=8)
+
+    summary = get_summary(db)
+    ventas = [float(row[CSV_HEADER.index("Venta")]) for row in rows]
+    assert summary["total_records"] == 50
+    assert summary["unique_clients"] == 7
+    assert summary["unique_products"] == 11
+    assert summary["total_sales"] == pytest.approx(sum(ventas))
+    assert summary["dataset_version"] == 1
+
+    clients = db.query(ClientRollup).all()
+    assert len({row.cliente for row in clients}) == 7
+    assert sum(row.num_transacciones for row in clients) == 50
+    assert float(sum(row.total_ventas for row in clients)) == pytest.approx(sum(ventas))
+    assert len({row.articulo for row in db.query(ProductRollup)}) == 11
+
+    # Una segunda carga (reemplazo) recalcula todo e incrementa la versión
+    load_csv_upload(db, write_csv(rows[:10]), "ventas.csv")
+    summary = get_summary(db)
+    assert summary["total_records"] == 10
+    assert summary["dataset_version"] == 2
+    assert sum(row.num_transacciones for row in db.query(ClientRollup)) == 10
+
+
+def rollup_rows(db):
+    """Contenido de las tablas de agregados sin su id"""
+    snapshot = {}
+    for rollup in (ClientRollup, ClientCategoryRollup, ProductRollup):
+        columns = [column for column in rollup.__table__.columns if column.name != "id"]
+        snapshot[rollup.__tablename__] = sorted(
+            tuple(str(value) for value in row) for row in db.execute(select(*columns))
+        )
+    return snapshot
+
+
+def test_rollups_keep_each_type_category_and_provider_apart(db):
+    load_csv_upload(db, write_csv(build_csv_rows(50)), "ventas.csv")
+
+    # Misma agrupación que las consultas sobre client_data a las que reemplazan
+    by_type = db.execute(text("""
+        SELECT cliente, tipo_de_cliente, COUNT(*), COUNT(DISTINCT factura) FROM client_data
+        GROUP BY cliente, tipo_de_cliente
+    """)).fetchall()
+    by_category = db.execute(text("""
+        SELECT cliente, tipo_cliente, COUNT(*), COUNT(DISTINCT factura) FROM client_data
+        GROUP BY cliente, tipo_cliente
+    """)).fetchall()
+    by_product = db.execute(text("""
+        SELECT articulo, categoria, proveedor, COUNT(*) FROM client_data
+        WHERE venta > 0 GROUP BY articulo, categoria, proveedor
+    """)).fetchall()
+
+    assert sorted(tuple(row) for row in by_type) == sorted(
+        (row.cliente, row.tipo_de_cliente, row.num_transacciones, row.num_facturas) for row in db.query(ClientRollup)
+    )
+    assert sorted(tuple(row) for row in by_category) == sorted(
+        (row.cliente, row.tipo_cliente, row.num_transacciones, row.num_facturas) for row in db.query(ClientCategoryRollup)
+    )
+    assert sorted(tuple(row) for row in by_product) == sorted(
+        (row.articulo, row.categoria, row.proveedor, row.num_transacciones) for row in db.query(ProductRollup)
+    )
+    # Cliente 0 compra como Distribuidor y como Fabricante químicos: dos filas
+    assert db.query(ClientRollup).filter(ClientRollup.cliente == "Cliente 0").count() == 2
+
+
+def test_append_and_incremental_loads_refresh_only_touched_rollups(db):
+    rows = build_csv_rows(30)
+    load_csv_upload(db, write_csv(rows), "ventas.csv")
+    untouched = {
+        row.id for row in db.query(ClientRollup).filter(ClientRollup.cliente != "Cliente 0")
+    }
+
+    # Carga agregada que solo trae compras de Cliente 0
+    appended = build_csv_rows(6, start=30)
+    for row in appended:
+        row[CSV_HEADER.index("Cliente")] = "Cliente 0"
+    load_csv_upload(db, write_csv(appended), "ventas.csv", replace_data=False)
+
+    assert {row.id for row in db.query(ClientRollup).filter(ClientRollup.cliente != "Cliente 0")} == untouched
+    scoped = rollup_rows(db)
+    refresh_rollups(db)
+    assert rollup_rows(db) == scoped
+
+    # Incremental: una fila existente cambia de cliente; el anterior también se recalcula
+    changed = [list(row) for row in rows[:3]]
+    changed[0][CSV_HEADER.index("Cliente")] = "Cliente nuevo"
+    changed[1][CSV_HEADER.index("Articulo")] = "Producto nuevo"
+    load_csv_upload(db, write_csv(changed), "ventas.csv", incremental=True)
+
+    scoped = rollup_rows(db)
+    refresh_rollups(db)
+    assert rollup_rows(db) == scoped
+    assert db.query(ClientRollup).filter(ClientRollup.cliente == "Cliente nuevo").count() == 1
+
+
+def test_bulk_load_uses_executemany_outside_postgresql(db):
+    chunk = pd.read_csv(write_csv(build_csv_rows(12)), dtype=str)
+    columns = normalize_dataframe(chunk, "ventas.csv")
+
+    stats = bulk_load_client_data(db, columns, batch_size=5)
+    db.commit()
+
+    assert stats["method"] == "executemany"
+    assert stats["rows"] == 12
+    assert db.query(ClientData).count() == 12
+
+
+def test_copy_stream_writes_every_row_with_null_marker():
+    chunk = pd.read_csv(write_csv(build_csv_rows(9, missing_factura_every=4)), dtype=str)
+    columns = normalize_dataframe(chunk, "ventas.csv")
+
+    # Lecturas de tamaño arbitrario, como hace copy_expert
+    stream = _CopyStream(columns, batch_size=4)
+    parts = []
+    while True:
+        part = stream.read(100)
+        if not part:
+            break
+        parts.append(part)
+    rows = list(csv.reader(io.StringIO("".join(parts))))
+
+    assert len(rows) == 9
+    assert all(len(row) == len(columns) for row in rows)
+    factura = list(columns).index("factura")
+    assert [row[factura] for row in rows].count(COPY_NULL_MARKER) == 3
+
+
+def test_failed_replace_upload_keeps_previous_data(db):
+    load_csv_upload(db, write_csv(build_csv_rows(15)), "ventas.csv")
+    before = stored_rows(db)
+
+    # Una fila con una columna de más en el último bloque: falla después de
+    # haber cargado los primeros bloques en la tabla staging
+    rows = build_csv_rows(40)
+    rows[35] = rows[35] + ["extra"]
+    with pytest.raises(pd.errors.ParserError):
+        load_csv_upload(db, write_csv(rows), "ventas.csv", chunk_size=10)
+
+    assert stored_rows(db) == before
+    assert get_summary(db)["total_records"] == 15
+
+
+def test_append_upload_keeps_existing_rows(db):
+    load_csv_upload(db, write_csv(build_csv_rows(10)), "ventas.csv")
+    stats = load_csv_upload(db, write_csv(build_csv_rows(5, start=10)), "ventas.csv", replace_data=False)
+
+    assert stats["replace_method"] == "append"
+    assert db.query(ClientData).count() == 15
+    assert get_summary(db)["total_records"] == 15
+
+
+def test_background_upload_job_reports_progress(client, db):
+    response = client.post(
+        "/upload-csv",
+        params={"background": "true", "chunk_size": 8},
+        files={"file": ("ventas.csv", write_csv(build_csv_rows(30)), "text/csv")}
+    )
+    assert response.status_code == 202
+    status_url = response.json()["status_url"]
+
+    deadline = time.monotonic() + 10
+    job = client.get(status_url).json()["job"]
+    while job["status"] in ("pending", "running") and time.monotonic() < deadline:
+        time.sleep(0.05)
+        job = client.get(status_url).json()["job"]
+
+    assert job["status"] == "completed", job
+    assert (job["rows_parsed"], job["rows_inserted"], job["chunks"]) == (30, 30, 4)
+    assert db.query(ClientData).count() == 30
+    assert client.get("/upload-csv/jobs/no-existe").status_code == 404
@@ -164,6 +164,40 @@ def check_fastapi_integration():
         print(f"❌ Error verificando FastAPI: {e}")
         return False
 
+def test_tree_ensemble_matches_xgboost(n_samples=5000, tolerance=1e-5):
+    """Verificar que el evaluador NumPy reproduzca las probabilidades de xgboost"""
+    import pytest
+    import numpy as np
+    xgb = pytest.importorskip("xgboost")
+
+    model_file = Path(__file__).resolve().parent.parent / "ml_models" / "xgboost_model_v1.json"
+    if not model_file.exists():
+        pytest.skip(f"{model_file} no encontrado")
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from tree_ensemble import TreeEnsemble
+
+    ensemble = TreeEnsemble.from_json(str(model_file))
+    reference = xgb.XGBClassifier()
+    reference.load_model(str(model_file))
+
+    # Lote sintético con escalas variadas, códigos enteros y valores faltantes
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(n_samples, ensemble.n_features))
+    X *= rng.choice([0.1, 1.0, 100.0, 10000.0], size=ensemble.n_features)
+    X[:, :5] = np.round(np.abs(X[:, :5]))
+    X[rng.random(X.shape) < 0.1] = np.nan
+
+    expected = reference.predict_proba(X)[:, 1]
+    actual = ensemble.predict_proba(X)[:, 1]
+    max_diff = float(np.abs(expected - actual).max())
+    importance_diff = float(np.abs(ensemble.feature_importances_ - reference.feature_importances_).max())
+
+    print(f"🌲 {ensemble.n_trees} árboles: diferencia máxima de probabilidad {max_diff:.2e}, "
+          f"de importancia {importance_diff:.2e}")
+    assert max_diff <= tolerance
+    assert importance_diff <= tolerance
+
 def check_dependencies():
     """Verificar dependencias necesarias"""
     print("\n📦 VERIFICANDO DEPENDENCIAS")
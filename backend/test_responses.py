@@ -0,0 +1,42 @@
+# backend/test_responses.py
+"""Pruebas de la serialización orjson y del formato columnar"""
+import json
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+
+from conftest import build_csv_rows, write_csv
+from responses import apply_layout, columnar, dumps
+
+
+def test_decimal_is_always_a_float():
+    payload = json.loads(dumps({"entero": Decimal("250"), "decimal": Decimal("1.5"), "fecha": date(2024, 1, 2),
+                                "numpy": np.float64(2.5), "arreglo": np.arange(2)}))
+    assert payload == {"entero": 250.0, "decimal": 1.5, "fecha": "2024-01-02", "numpy": 2.5, "arreglo": [0, 1]}
+    assert isinstance(payload["entero"], float)
+
+
+def test_columnar_layout():
+    records = [{"producto": "A", "ventas": 1.0}, {"producto": "B", "ventas": 2.0}]
+    assert columnar(records) == {"producto": ["A", "B"], "ventas": [1.0, 2.0]}
+    assert apply_layout(records, "rows") is records
+    wrapped = apply_layout({"success": True, "data": records}, "columnar")
+    assert wrapped["layout"] == "columnar"
+    assert wrapped["data"] == columnar(records)
+    assert columnar([]) == {}
+
+
+def test_chart_endpoints_in_both_layouts(client):
+    client.post("/upload-csv", files={"file": ("ventas.csv", write_csv(build_csv_rows(40)), "text/csv")})
+
+    for path in ("/clients/analytics/frequency-scatter", "/products/analytics/pareto-80-20"):
+        rows = client.get(path).json()
+        assert rows["success"] is True and rows["data"]
+        assert all(isinstance(item["total_ventas"], float) for item in rows["data"])
+
+        columns = client.get(path, params={"layout": "columnar"}).json()
+        assert columns["data"] == columnar(rows["data"])
+
+    bars = client.get("/products/analytics/comparative-bars", params={"layout": "columnar"}).json()
+    assert len(bars["producto"]) == 10
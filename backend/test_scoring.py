@@ -0,0 +1,35 @@
+# backend/test_scoring.py
+"""Pruebas de los puntajes de venta cruzada precalculados (SQLite)"""
+from types import SimpleNamespace
+
+from sqlalchemy import text
+
+from conftest import build_csv_rows, write_csv
+from ingestion import load_csv_upload, run_post_ingest_hooks
+from scoring import current_dataset_version, current_model_version, get_cross_sell_scores
+
+
+def test_scores_are_keyed_on_the_registry_version():
+    # v1 y v2 comparten model_metadata.json ("model_version": "1.0")
+    metadata = {"model_version": "1.0"}
+    v1 = SimpleNamespace(active=SimpleNamespace(version="v1"), model_metadata=metadata)
+    v2 = SimpleNamespace(active=SimpleNamespace(version="v2"), model_metadata=metadata)
+    assert current_model_version(v1) != current_model_version(v2)
+
+
+def test_scores_of_a_previous_dataset_are_not_served(client, db):
+    import main
+    load_csv_upload(db, write_csv(build_csv_rows(40)), "ventas.csv")
+    model_version = current_model_version(main.ml_service)
+
+    scores = get_cross_sell_scores(db, model_version, limit=0)
+    assert scores is not None
+    assert scores["dataset_version"] == current_dataset_version(db)
+
+    # Otra carga confirmada cuyo recálculo de puntajes falló y se revirtió
+    db.execute(text("UPDATE analytics_summary SET dataset_version = dataset_version + 1 WHERE id = 1"))
+    db.commit()
+    assert get_cross_sell_scores(db, model_version, limit=0) is None
+
+    run_post_ingest_hooks(db)
+    assert get_cross_sell_scores(db, model_version, limit=0)["dataset_version"] == current_dataset_version(db)
@@ -0,0 +1,54 @@
+# backend/test_search.py
+"""Pruebas de la búsqueda por subcadena de /client-data/search (SQLite, índice n-grama)"""
+import numpy as np
+import pandas as pd
+
+from conftest import build_csv_rows, write_csv
+from ingestion import load_csv_upload
+from models import ClientData
+from search import ColumnNGramIndex, search_conditions, search_engine
+
+
+def test_ngram_index_matches_substrings_case_insensitively():
+    ids = np.array([10, 11, 12, 13, 14], dtype=np.int64)
+    values = pd.Series(["Química Andes", "ANDES SAC", None, "Pinturas", "andes"], dtype="string")
+    index = ColumnNGramIndex(ids, values)
+
+    assert index.search("andes").tolist() == [10, 11, 14]
+    assert index.search("AN").tolist() == [10, 11, 14]   # más corto que un trigrama
+    assert index.search("turas").tolist() == [13]
+    assert index.search("xyz").tolist() == []
+
+
+def test_ngram_search_matches_ilike(db):
+    load_csv_upload(db, write_csv(build_csv_rows(80)), "ventas.csv")
+    cases = [
+        {"cliente": "ente 3"},
+        {"comercial": "COMERCIAL 1", "categoria": "solv"},
+        {"proveedor": "prov 2", "factura": "10"},
+        {"cliente": "no existe"},
+    ]
+    for filters in cases:
+        expected = [row.id for row in db.query(ClientData.id).filter(*search_conditions(filters)).order_by(ClientData.id)]
+        total, capped, records = search_engine.search(db, filters, limit=1000)
+        assert [record.id for record in records] == expected, filters
+        assert (total, capped) == (len(expected), False)
+
+
+def test_ngram_index_is_rebuilt_after_upload(db):
+    load_csv_upload(db, write_csv(build_csv_rows(10)), "ventas.csv")
+    assert search_engine.search(db, {"cliente": "Cliente 1"})[0] > 0
+
+    rows = build_csv_rows(10)
+    for row in rows:
+        row[5] = "Nuevo Cliente"
+    load_csv_upload(db, write_csv(rows), "ventas.csv")
+
+    assert search_engine.search(db, {"cliente": "Cliente 1"})[0] == 0
+    assert search_engine.search(db, {"cliente": "nuevo"})[0] == 10
+
+
+def test_like_wildcards_are_literal(db):
+    load_csv_upload(db, write_csv(build_csv_rows(10)), "ventas.csv")
+    assert search_engine.search(db, {"cliente": "%"})[0] == 0
+    assert db.query(ClientData).filter(*search_conditions({"cliente": "_"})).count() == 0
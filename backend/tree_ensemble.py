@@ -0,0 +1,153 @@
+# backend/tree_ensemble.py
+"""
+Evaluador NumPy del modelo XGBoost exportado en JSON.
+
+ml_models/xgboost_model_v1.json (binary:logistic, árboles de profundidad 4)
+se parsea una sola vez a arreglos planos con los nodos de todos los árboles
+concatenados: feature de corte, umbral, hijo izquierdo, hijo derecho,
+dirección por defecto para valores faltantes y valor de hoja. predict_proba()
+recorre todos los árboles para todo el lote a la vez, un nivel por paso
+(max_depth pasos en total), sin bucles por fila ni por árbol.
+
+Así la API puede puntuar sin importar la librería nativa de xgboost. Expone
+predict_proba y feature_importances_ con la misma semántica que
+XGBClassifier, de modo que MLService lo usa como reemplazo directo.
+"""
+import numpy as np
+from typing import Any, Dict, List
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Objetivos soportados -> función de enlace (margen -> salida)
+SUPPORTED_OBJECTIVES = ("binary:logistic", "reg:logistic")
+
+
+def _sigmoid(margin: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-margin))
+
+
+class TreeEnsemble:
+    """Árboles de un modelo XGBoost como arreglos NumPy planos"""
+
+    def __init__(self, model: Dict[str, Any]):
+        learner = model["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in SUPPORTED_OBJECTIVES:
+            raise ValueError(f"Objetivo no soportado: {objective}")
+
+        params = learner["learner_model_param"]
+        if int(params.get("num_class", 0)) > 1 or int(params.get("num_target", 1)) > 1:
+            raise ValueError("Solo se soportan modelos de una sola salida")
+
+        self.objective = objective
+        self.feature_names: List[str] = learner.get("feature_names", [])
+        self.n_features = int(params["num_feature"])
+
+        # XGBoost guarda base_score en el espacio de la probabilidad
+        base_score = float(params["base_score"])
+        self.base_margin = float(np.log(base_score / (1.0 - base_score)))
+
+        trees = learner["gradient_booster"]["model"]["trees"]
+        self.n_trees = len(trees)
+        self._build_arrays(trees)
+
+    @classmethod
+    def from_json(cls, path: str) -> "TreeEnsemble":
+        """Cargar el modelo desde el JSON de XGBClassifier.save_model"""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _build_arrays(self, trees: List[Dict[str, Any]]) -> None:
+        """Concatenar los nodos de todos los árboles con índices globales"""
+        features, thresholds, lefts, rights, defaults, gains = [], [], [], [], [], []
+        roots = np.empty(len(trees), dtype=np.int64)
+        offset = 0
+
+        for t, tree in enumerate(trees):
+            if any(tree.get("split_type", [])) or tree.get("categories_nodes"):
+                raise ValueError("Los cortes categóricos nativos no están soportados")
+
+            left = np.asarray(tree["left_children"], dtype=np.int64)
+            right = np.asarray(tree["right_children"], dtype=np.int64)
+            is_leaf = left == -1
+
+            roots[t] = offset
+            features.append(np.asarray(tree["split_indices"], dtype=np.int64))
+            # En las hojas split_conditions guarda el valor de la hoja
+            thresholds.append(np.asarray(tree["split_conditions"], dtype=np.float32))
+            # Las hojas apuntan a sí mismas para que el recorrido se detenga
+            own = np.arange(len(left), dtype=np.int64) + offset
+            lefts.append(np.where(is_leaf, own, left + offset))
+            rights.append(np.where(is_leaf, own, right + offset))
+            defaults.append(np.asarray(tree["default_left"], dtype=bool))
+            gains.append(np.where(is_leaf, 0.0, np.asarray(tree["loss_changes"], dtype=np.float64)))
+            offset += len(left)
+
+        self.roots = roots
+        self.split_feature = np.concatenate(features)
+        self.split_threshold = np.concatenate(thresholds)
+        self.left = np.concatenate(lefts)
+        self.right = np.concatenate(rights)
+        self.default_left = np.concatenate(defaults)
+        self.is_leaf = self.left == np.arange(offset)
+        self.leaf_value = np.where(self.is_leaf, self.split_threshold, 0.0).astype(np.float32)
+        self.split_feature[self.is_leaf] = 0
+        self._gain = np.concatenate(gains)
+        self.max_depth = self._compute_max_depth()
+
+    def _compute_max_depth(self) -> int:
+        """Profundidad máxima real (número de pasos de recorrido necesarios)"""
+        depth = 0
+        frontier = self.roots
+        while not self.is_leaf[frontier].all():
+            frontier = np.unique(np.concatenate([self.left[frontier], self.right[frontier]]))
+            depth += 1
+        return depth
+
+    def predict_margin(self, X: np.ndarray) -> np.ndarray:
+        """Margen (log-odds) del lote: base_score + suma de hojas de todos los árboles"""
+        # XGBoost compara en float32; NaN sigue la dirección por defecto
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Se esperaban {self.n_features} features, se recibieron {X.shape}")
+
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+
+        for _ in range(self.max_depth):
+            values = X[rows, self.split_feature[node]]
+            go_left = np.where(
+                np.isnan(values),
+                self.default_left[node],
+                values < self.split_threshold[node]
+            )
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return self.base_margin + self.leaf_value[node].sum(axis=1, dtype=np.float64)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidades [clase 0, clase 1] como XGBClassifier.predict_proba"""
+        positive = _sigmoid(self.predict_margin(X))
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X: np.ndarray, threshold: float = 0.5) -> np.ndarray:
+        """Etiqueta 0/1 con el umbral indicado"""
+        return (self.predict_proba(X)[:, 1] >= threshold).astype(int)
+
+    @property
+    def feature_importances_(self) -> np.ndarray:
+        """Ganancia promedio por feature normalizada (importance_type='gain' de XGBoost)"""
+        split = ~self.is_leaf
+        total_gain = np.bincount(self.split_feature[split], weights=self._gain[split], minlength=self.n_features)
+        splits = np.bincount(self.split_feature[split], minlength=self.n_features)
+        avg_gain = np.divide(total_gain, splits, out=np.zeros(self.n_features), where=splits > 0)
+        total = avg_gain.sum()
+        return (avg_gain / total if total > 0 else avg_gain).astype(np.float32)
+
+    def memory_bytes(self) -> int:
+        """Memoria ocupada por los arreglos del modelo"""
+        arrays = [self.roots, self.split_feature, self.split_threshold, self.left, self.right,
+                  self.default_left, self.is_leaf, self.leaf_value, self._gain]
+        return int(sum(a.nbytes for a in arrays))